@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Headless entry point: CSV ingestion and reports without any window.
+
+  python -m app import-invoices invoices.csv --office Residence
+  python -m app import-suppliers suppliers.csv
+  python -m app report official --from 2024Q1 --to 2024Q4 --formats csv --out /tmp/audit
+  python -m app report vouchers --from 2024Q3 --to 2024Q3
+  python -m app report colleague --from 2024Q1 --to 2024Q4 [--colleague 17]
+
+Run it from the repository root. The commands call the functions the
+screens call (batch_import, report_batch.run_batch, vat_colleague) and
+print one JSON object per line on stdout: "progress" lines while an import
+runs, one "report" line per file or colleague with its row count and
+timings, and a closing "summary" line with the totals and elapsed_seconds.
+Exit status: 0 when everything went through, 1 when anything failed.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# The modules import each other flat (from db import ...), as under run_gui.py
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mysql.connector import Error
+import batch_import
+import migrate
+import report_batch
+from core.periods import parse_period, periods
+
+# report name on the command line -> report_batch module
+REPORTS = {
+    "official": "vat_oficial",
+    "vouchers": "vat_vouchers",
+}
+
+
+def emit(event, **fields):
+    print(json.dumps(dict(event=event, **fields), default=str), flush=True)
+
+
+def _elapsed(started):
+    return round(time.perf_counter() - started, 3)
+
+
+# ==========================================================
+# Ingestion
+# ==========================================================
+def import_invoices(args):
+    import refdata
+
+    started = time.perf_counter()
+    lookups, refreshed = refdata.load_lookups(["suppliers"])
+    # Validate against the current supplier list, not a stale snapshot
+    suppliers = refreshed.result().get("suppliers", lookups["suppliers"])
+
+    def progress(line_no, inserted):
+        emit("progress", line=line_no, inserted=inserted, elapsed_seconds=_elapsed(started))
+
+    summary = batch_import.import_invoices_csv(
+        args.csv, suppliers.id_by_name, default_office=args.office,
+        reject_path=args.rejects, chunk_size=args.chunk_size, progress=progress,
+    )
+    emit("summary", command="import-invoices", file=args.csv, elapsed_seconds=_elapsed(started), **summary)
+    return 0
+
+
+def import_suppliers(args):
+    started = time.perf_counter()
+
+    def progress(line_no, inserted):
+        emit("progress", line=line_no, inserted=inserted, elapsed_seconds=_elapsed(started))
+
+    summary = batch_import.import_suppliers_csv(
+        args.csv, reject_path=args.rejects, chunk_size=args.chunk_size, progress=progress,
+    )
+    emit("summary", command="import-suppliers", file=args.csv, elapsed_seconds=_elapsed(started), **summary)
+    return 0
+
+
+# ==========================================================
+# Reports
+# ==========================================================
+def _report_summary(report, results, started):
+    counts = {}
+    for status in (r["status"] for r in results):
+        counts[status] = counts.get(status, 0) + 1
+    emit("summary", command="report", report=report, statuses=counts,
+         rows=sum(r["rows"] or 0 for r in results), elapsed_seconds=_elapsed(started))
+    return 1 if "error" in counts else 0
+
+
+def batch_reports(args):
+    """official / vouchers: every period and format through report_batch.run_batch()."""
+    started = time.perf_counter()
+
+    def progress(done, total, result):
+        emit("report", done=done, total=total, **dict(result, report=args.report))
+
+    results = report_batch.run_batch(
+        [REPORTS[args.report]], args.formats, args.start, args.end, out_dir=args.out,
+        workers=args.workers, use_cache=not args.no_cache, progress=progress,
+    )
+    return _report_summary(args.report, results, started)
+
+
+def colleague_reports(args):
+    """One colleague, or every colleague in one procedure call, per period."""
+    import background
+    import vat_colleague
+
+    output_dir = args.out or vat_colleague.OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    results = []
+
+    for year, quarter in periods(args.start, args.end):
+        period_started = time.perf_counter()
+        result = {"report": "colleague", "year": year, "quarter": quarter, "colleague": args.colleague,
+                  "status": None, "files": [], "error": None, "rows": None}
+        try:
+            if args.colleague is not None:
+                status, paths, rows = vat_colleague.build_report(
+                    background.Task(), args.colleague, quarter, year, output_dir, args.formats
+                )
+                found = [dict(result, status=status, files=paths, rows=rows)]
+            else:
+                found = [
+                    dict(result, colleague=name, status="error" if error else "generated",
+                         files=paths, error=error, rows=rows)
+                    for name, paths, error, rows in vat_colleague.generate_all_reports(
+                        quarter, year, output_dir, workers=args.workers, formats=args.formats
+                    )
+                ] or [dict(result, status="no data")]
+        except Error as err:
+            found = [dict(result, status="error", error=str(err))]
+        seconds = _elapsed(period_started)
+        for r in found:
+            r["period_seconds"] = seconds
+            emit("report", **r)
+        results += found
+
+    return _report_summary("colleague", results, started)
+
+
+def report(args):
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    if args.report == "colleague":
+        return colleague_reports(args)
+    return batch_reports(args)
+
+
+# ==========================================================
+# Main
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app", description="VAT Refunder without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("import-invoices", help="load an invoice CSV (see batch_import.py for the columns)")
+    p.add_argument("csv")
+    p.add_argument("--office", choices=list(batch_import.OFFICE_TABLES), default="Chancery",
+                   help="office for rows without one (default Chancery)")
+    p.add_argument("--rejects", help="reject file (default <csv>_rejects.csv)")
+    p.add_argument("--chunk-size", type=int, default=batch_import.CHUNK_SIZE, help="rows per commit")
+    p.set_defaults(run=import_invoices)
+
+    p = commands.add_parser("import-suppliers", help="load a supplier CSV with NIF and Name columns")
+    p.add_argument("csv")
+    p.add_argument("--rejects", help="reject file (default <csv>_rejects.csv)")
+    p.add_argument("--chunk-size", type=int, default=batch_import.CHUNK_SIZE, help="rows per commit")
+    p.set_defaults(run=import_suppliers)
+
+    p = commands.add_parser("report", help="generate reports for a range of quarters")
+    p.add_argument("report", choices=list(REPORTS) + ["colleague"])
+    p.add_argument("--from", dest="start", required=True, type=parse_period,
+                   help="first period, e.g. 2024Q1")
+    p.add_argument("--to", dest="end", required=True, type=parse_period,
+                   help="last period, e.g. 2024Q4")
+    p.add_argument("--formats", nargs="+", choices=report_batch.FORMATS, default=list(report_batch.FORMATS))
+    p.add_argument("--out", help="output directory (default: the report's export directory)")
+    p.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    p.add_argument("--no-cache", action="store_true", help="official / vouchers: always query and render")
+    p.add_argument("--colleague", type=int, help="colleague: only this Colleague_ID (default: all)")
+    p.set_defaults(run=report)
+
+    args = parser.parse_args(argv)
+    if args.command == "report" and args.start > args.end:
+        parser.error("--from must not be after --to")
+    migrate.startup()  # warns on stderr when the database is behind db/init
+    try:
+        return args.run(args)
+    except (Error, OSError, ValueError) as e:
+        emit("error", command=args.command, error=str(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
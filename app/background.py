@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Background work for the Tk screens.
+
+Tk callbacks have to return quickly, so the screens hand database calls and
+report rendering to start(), which runs work(task) on a shared thread pool
+and polls it every POLL_MS with widget.after(): widgets are only ever touched
+from the Tk thread. The buttons in busy are disabled while the work is in
+flight; when it is over on_done(result), on_error(exc) or on_cancel() runs
+on the Tk thread and the buttons are restored.
+
+Long work reports progress with task.progress(done, total, text) and calls
+task.check() between steps; once task.cancel() was called (the Cancel button
+of the progress window) check() raises Cancelled. pdf_progress() adapts a
+task to ReportLab's build progress callback, so a PDF render can be watched
+and stopped too.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import Toplevel, Label, Button, StringVar, TclError, messagebox
+from tkinter import ttk
+
+POLL_MS = 100
+WORKERS = 4  # screens hosted by the launcher share these threads
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="ui-work")
+
+
+class Cancelled(Exception):
+    """Raised by Task.check() once the task was cancelled."""
+
+
+class Task:
+    """Shared by the Tk side (cancel) and the work function (check, progress)."""
+
+    def __init__(self):
+        self._cancel = threading.Event()
+        self._progress = queue.Queue()
+        self.future = None
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled()
+
+    def progress(self, done, total=None, text=""):
+        """Report progress from the work function; total None means 'unknown'."""
+        self._progress.put((done, total, text))
+
+    def _latest_progress(self):
+        latest = None
+        try:
+            while True:
+                latest = self._progress.get_nowait()
+        except queue.Empty:
+            return latest
+
+
+def pdf_progress(task, text="Rendering PDF…"):
+    """A ReportLab setProgressCallBack() function reporting to task; raises Cancelled mid-build."""
+    total = [None]
+
+    def callback(kind, value):
+        task.check()
+        if kind == "SIZE_EST":
+            total[0] = value
+        elif kind == "PROGRESS":
+            task.progress(value, total[0], text)
+
+    return callback
+
+
+def watched(items, task, every=1000, text="{:,} rows…"):
+    """Yield items, checking for cancellation and reporting the count every `every` items."""
+    for n, item in enumerate(items, 1):
+        if n % every == 0:
+            task.check()
+            task.progress(n, None, text.format(n))
+        yield item
+
+
+def show_error(e):
+    messagebox.showerror("Error", f"Error: {e}")
+
+
+def _alive(widget):
+    """Whether widget still exists (False once it, or the whole Tk app, was destroyed)."""
+    try:
+        return bool(widget.winfo_exists())
+    except TclError:
+        return False
+
+
+# ==========================================================
+# Progress window
+# ==========================================================
+def _progress_window(widget, title, task):
+    """Small window with a progress bar and a Cancel button; returns (window, update)."""
+    window = Toplevel(widget)
+    window.title(title)
+    window.resizable(False, False)
+    window.transient(widget.winfo_toplevel())
+    text = StringVar(value="Working…")
+    Label(window, textvariable=text, width=48, anchor="w").pack(padx=12, pady=(12, 4))
+    bar = ttk.Progressbar(window, length=320, mode="indeterminate")
+    bar.pack(padx=12)
+    bar.start(50)
+    cancel_button = Button(window, text="Cancel")
+    cancel_button.pack(pady=10)
+
+    def cancel():
+        task.cancel()
+        cancel_button.config(state="disabled")
+        text.set("Cancelling…")
+
+    cancel_button.config(command=cancel)
+    window.protocol("WM_DELETE_WINDOW", cancel)
+
+    def update(done, total, message):
+        if task.cancelled:
+            return
+        if total:
+            if str(bar["mode"]) != "determinate":
+                bar.stop()
+                bar.config(mode="determinate")
+            bar.config(maximum=total, value=done)
+        if message:
+            text.set(message)
+
+    return window, update
+
+
+# ==========================================================
+# Runner
+# ==========================================================
+def start(widget, work, on_done=None, on_error=None, on_cancel=None, busy=(), progress=None, title=None):
+    """
+    Run work(task) in the background; returns the Task.
+
+    widget: any widget of the calling screen (used for after()).
+    busy: widgets disabled until the work is over.
+    progress(done, total, text): called on the Tk thread with the latest report.
+    title: show a progress window with a Cancel button under this title.
+    on_error defaults to a plain error box; Cancelled goes to on_cancel.
+    If widget is destroyed while the work runs, polling stops, the task is
+    cancelled and none of the callbacks run.
+    """
+    task = Task()
+    states = []
+    for w in busy:
+        states.append((w, w.cget("state")))
+        w.config(state="disabled")
+    window, update = _progress_window(widget, title, task) if title else (None, None)
+    task.future = _pool.submit(work, task)
+
+    def poll():
+        if not _alive(widget):
+            task.cancel()  # the screen was closed; nobody is left to report to
+            return
+        latest = task._latest_progress()
+        if latest:
+            if update:
+                update(*latest)
+            if progress:
+                progress(*latest)
+        if not task.future.done():
+            widget.after(POLL_MS, poll)
+            return
+
+        try:
+            if window:
+                window.destroy()
+            for w, state in states:
+                w.config(state=state)
+        except TclError:
+            pass  # the screen was closed meanwhile
+
+        try:
+            result = task.future.result()
+        except Cancelled:
+            if on_cancel:
+                on_cancel()
+        except Exception as e:
+            (on_error or show_error)(e)
+        else:
+            if on_done:
+                on_done(result)
+
+    widget.after(POLL_MS, poll)
+    return task
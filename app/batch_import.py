@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Streaming CSV importer behind the "Batch Insert CSV" button.
+
+Expected columns (header row required, ';' or ',' delimited):
+  Office; Supplier; Number; Date; Total; Vat; Refundable; Status; Recurring
+Office, Refundable, Status and Recurring are optional and default to the
+selected office, 1, "Processed" and 1.
+
+Rows are validated like the manual entry form, then written to
+Invoices_Chancery / Invoices_Residence as multi-row INSERTs committed every
+CHUNK_SIZE rows. A bad row never aborts the load: it is written to a reject
+file (<input>_rejects.csv) with its line number and the reason.
+
+import_suppliers_csv() loads NIF_Codes the same way from a NIF; Name file
+(both required); a NIF or name that already exists is rejected, as the New
+Supplier form rejects it.
+"""
+
+import os
+import csv
+from mysql.connector import Error, errors
+from db import get_cnx, in_placeholders
+import duplicates
+from core.invoices import OFFICE_TABLES, validate_invoice, invoice_params
+
+# ==========================================================
+# Config
+# ==========================================================
+CHUNK_SIZE = 500
+
+# Accepted header spellings -> canonical field
+HEADER_ALIASES = {
+    "office": "Office",
+    "supplier": "Supplier",
+    "supplier_name": "Supplier",
+    "number": "Number",
+    "invoice_number": "Number",
+    "date": "Date",
+    "invoice_date": "Date",
+    "total": "Total",
+    "amount": "Total",
+    "vat": "Vat",
+    "refundable": "Refundable",
+    "status": "Status",
+    "recurring": "Recurring",
+}
+
+INSERT_COLUMNS = "(Supplier_ID, Number, Date, Total, Vat, Refundable, Status, Recurring)"
+
+SUPPLIER_HEADER_ALIASES = {
+    "nif": "NIF",
+    "nif_code": "NIF",
+    "supplier_nif_code": "NIF",
+    "name": "Name",
+    "supplier": "Name",
+    "supplier_name": "Name",
+}
+SUPPLIER_INSERT = "INSERT INTO NIF_Codes (Supplier_NIF_Code, Supplier_Name) VALUES (%s, %s)"
+SUPPLIER_FIELD_LEN = 255
+
+
+# ==========================================================
+# Helpers
+# ==========================================================
+def _canonical(header, aliases=HEADER_ALIASES):
+    key = header.strip().lower().replace(" ", "_")
+    return aliases.get(key, header.strip())
+
+
+def _sniff_delimiter(f):
+    sample = f.read(4096)
+    f.seek(0)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=";,").delimiter
+    except csv.Error:
+        return ";"
+
+
+def validate_row(row, supplier_id_map, default_office):
+    """
+    Validate one CSV row the way add_invoice_to_list validates the form
+    (core.invoices.validate_invoice).
+
+    Returns (table_name, params) ready for INSERT, or raises ValueError with a
+    human-readable reason.
+    """
+    inv = validate_invoice(row, supplier_id_map, default_office)
+    return OFFICE_TABLES[inv["office"]], invoice_params(inv)
+
+
+# ==========================================================
+# Importer
+# ==========================================================
+class _RejectWriter:
+    """Opens the reject file on first use so clean loads leave nothing behind."""
+
+    def __init__(self, path, fieldnames, delimiter):
+        self.path = path
+        self.fieldnames = ["Line", "Reason"] + fieldnames
+        self.delimiter = delimiter
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, line_no, reason, row):
+        if self._writer is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(
+                self._file, fieldnames=self.fieldnames, delimiter=self.delimiter, extrasaction="ignore"
+            )
+            self._writer.writeheader()
+        out = dict(row)
+        out["Line"] = line_no
+        out["Reason"] = reason
+        self._writer.writerow(out)
+        self.count += 1
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+def _flush(cnx, table_name, pending, rejects):
+    """Insert one chunk for table_name and commit; returns the number inserted."""
+    if not pending:
+        return 0
+    cur = cnx.cursor()
+    try:
+        numbers = [params[1] for _, _, params in pending]
+        cur.execute(
+            f"SELECT Number FROM {table_name} WHERE Number IN ({in_placeholders(numbers)})",
+            numbers,
+        )
+        existing = {row[0] for row in cur.fetchall()}
+
+        batch = []
+        for line_no, raw, params in pending:
+            if params[1] in existing:
+                rejects.write(line_no, f"Invoice {params[1]} already exists.", raw)
+            else:
+                batch.append((line_no, raw, params))
+        if not batch:
+            return 0
+
+        insert_sql = f"INSERT INTO {table_name} {INSERT_COLUMNS} VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+        try:
+            # executemany rewrites this into a single multi-row INSERT
+            cur.executemany(insert_sql, [params for _, _, params in batch])
+            cnx.commit()
+            return len(batch)
+        except errors.OperationalError:
+            raise  # the connection itself failed; the caller rolls back
+        except errors.DatabaseError:
+            # Someone else inserted one of these meanwhile, or the server refused
+            # a value validation let through: isolate the offenders
+            cnx.rollback()
+            inserted = 0
+            for line_no, raw, params in batch:
+                try:
+                    cur.execute(insert_sql, params)
+                    inserted += 1
+                except (errors.OperationalError, errors.InterfaceError):
+                    raise
+                except Error as e:
+                    rejects.write(line_no, f"Database rejected row: {e.msg}", raw)
+            cnx.commit()
+            return inserted
+    finally:
+        cur.close()
+
+
+def import_invoices_csv(path, supplier_id_map, default_office="Chancery",
+                        reject_path=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Stream an invoice CSV into the database.
+
+    Returns a summary dict: inserted, rejected, reject_file (None when every
+    row loaded) and by_table (rows inserted per table). progress(line_no,
+    inserted) is called after each committed chunk; it may raise to stop the
+    import, and the chunks committed so far stay.
+    """
+    if reject_path is None:
+        base, _ = os.path.splitext(path)
+        reject_path = base + "_rejects.csv"
+
+    summary = {"inserted": 0, "rejected": 0, "reject_file": None,
+               "by_table": {t: 0 for t in OFFICE_TABLES.values()}}
+    pending = {t: [] for t in OFFICE_TABLES.values()}
+    seen = {t: set() for t in OFFICE_TABLES.values()}
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        delimiter = _sniff_delimiter(f)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        if not reader.fieldnames:
+            raise ValueError("CSV file has no header row.")
+        original_fields = list(reader.fieldnames)
+        canonical_fields = [_canonical(h) for h in original_fields]
+        rejects = _RejectWriter(reject_path, original_fields, delimiter)
+
+        cnx = get_cnx()
+        try:
+            for raw in reader:
+                line_no = reader.line_num
+                row = {canonical_fields[i]: raw.get(h) for i, h in enumerate(original_fields)}
+                try:
+                    table_name, params = validate_row(row, supplier_id_map, default_office)
+                except ValueError as e:
+                    rejects.write(line_no, str(e), raw)
+                    continue
+
+                if params[1] in seen[table_name]:
+                    rejects.write(line_no, f"Invoice {params[1]} appears earlier in this file.", raw)
+                    continue
+                seen[table_name].add(params[1])
+
+                pending[table_name].append((line_no, raw, params))
+                if len(pending[table_name]) >= chunk_size:
+                    n = _flush(cnx, table_name, pending[table_name], rejects)
+                    summary["by_table"][table_name] += n
+                    pending[table_name] = []
+                    if progress:
+                        progress(line_no, sum(summary["by_table"].values()))
+
+            for table_name, chunk in pending.items():
+                summary["by_table"][table_name] += _flush(cnx, table_name, chunk, rejects)
+        except Error:
+            cnx.rollback()
+            raise
+        finally:
+            cnx.close()
+            rejects.close()
+
+    summary["inserted"] = sum(summary["by_table"].values())
+    summary["rejected"] = rejects.count
+    if rejects.count:
+        summary["reject_file"] = reject_path
+    return summary
+
+
+# ==========================================================
+# Supplier importer
+# ==========================================================
+def validate_supplier(row):
+    """(nif_code, supplier_name) for one supplier CSV row, or ValueError with the reason."""
+    nif_code = (row.get("NIF") or "").strip()
+    supplier_name = (row.get("Name") or "").strip()
+    if not nif_code or not supplier_name:
+        raise ValueError("Missing NIF or supplier name.")
+    if len(nif_code) > SUPPLIER_FIELD_LEN or len(supplier_name) > SUPPLIER_FIELD_LEN:
+        raise ValueError(f"NIF and name are limited to {SUPPLIER_FIELD_LEN} characters.")
+    return nif_code, supplier_name
+
+
+def _flush_suppliers(cnx, pending, rejects):
+    """Insert one chunk of suppliers and commit; the UNIQUE keys reject existing ones."""
+    if not pending:
+        return 0
+    cur = cnx.cursor()
+    try:
+        try:
+            cur.executemany(SUPPLIER_INSERT, [params for _, _, params in pending])
+            cnx.commit()
+            return len(pending)
+        except errors.OperationalError:
+            raise
+        except errors.DatabaseError:
+            # Some already exist (or were refused): insert row by row and reject those
+            cnx.rollback()
+            inserted = 0
+            for line_no, raw, params in pending:
+                try:
+                    cur.execute(SUPPLIER_INSERT, params)
+                    inserted += 1
+                except (errors.OperationalError, errors.InterfaceError):
+                    raise
+                except Error as e:
+                    dup = duplicates.duplicate(e)
+                    rejects.write(line_no, duplicates.message(dup) if dup else f"Database rejected row: {e.msg}", raw)
+            cnx.commit()
+            return inserted
+    finally:
+        cur.close()
+
+
+def import_suppliers_csv(path, reject_path=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Stream a supplier CSV (NIF; Name) into NIF_Codes.
+
+    Returns a summary dict like import_invoices_csv() without by_table;
+    progress(line_no, inserted) is called after each committed chunk.
+    """
+    if reject_path is None:
+        base, _ = os.path.splitext(path)
+        reject_path = base + "_rejects.csv"
+
+    inserted = 0
+    pending = []
+    seen_nif, seen_name = set(), set()
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        delimiter = _sniff_delimiter(f)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        if not reader.fieldnames:
+            raise ValueError("CSV file has no header row.")
+        original_fields = list(reader.fieldnames)
+        canonical_fields = [_canonical(h, SUPPLIER_HEADER_ALIASES) for h in original_fields]
+        rejects = _RejectWriter(reject_path, original_fields, delimiter)
+
+        cnx = get_cnx()
+        try:
+            for raw in reader:
+                line_no = reader.line_num
+                row = {canonical_fields[i]: raw.get(h) for i, h in enumerate(original_fields)}
+                try:
+                    nif_code, supplier_name = validate_supplier(row)
+                except ValueError as e:
+                    rejects.write(line_no, str(e), raw)
+                    continue
+
+                if nif_code in seen_nif or supplier_name in seen_name:
+                    rejects.write(line_no, f"Supplier {supplier_name} ({nif_code}) appears earlier in this file.", raw)
+                    continue
+                seen_nif.add(nif_code)
+                seen_name.add(supplier_name)
+
+                pending.append((line_no, raw, (nif_code, supplier_name)))
+                if len(pending) >= chunk_size:
+                    inserted += _flush_suppliers(cnx, pending, rejects)
+                    pending = []
+                    if progress:
+                        progress(line_no, inserted)
+
+            inserted += _flush_suppliers(cnx, pending, rejects)
+        except Error:
+            cnx.rollback()
+            raise
+        finally:
+            cnx.close()
+            rejects.close()
+
+    return {"inserted": inserted, "rejected": rejects.count,
+            "reject_file": reject_path if rejects.count else None}
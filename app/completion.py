@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Completion index for the autocomplete comboboxes.
+
+Keeps the names sorted case-insensitively so prefix lookups are a bisect,
+plus a trigram index (and a word-start index for short queries) so typing a
+fragment from the middle of a name still finds it without scanning the list.
+"""
+
+import threading
+from bisect import bisect_left, insort
+
+NGRAM = 3
+
+
+def _grams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class CompletionIndex:
+    def __init__(self, items=()):
+        unique = {item for item in items if item}
+        self._keys = sorted((item.lower(), item) for item in unique)
+        self._members = set(unique)
+        self._words = sorted(
+            (word, item) for key, item in self._keys for word in key.split()[1:]
+        )
+        self._grams = None  # built by warm() or on the first mid-word query
+        self._grams_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, item):
+        return item in self._members
+
+    def warm(self):
+        """Build the trigram index now (safe to call from a background thread)."""
+        with self._grams_lock:
+            if self._grams is not None:
+                return
+            grams = {}
+            for key, item in list(self._keys):
+                for gram in _grams(key):
+                    grams.setdefault(gram, set()).add(item)
+            self._grams = grams
+
+    def items(self, limit=None):
+        """All items (or the first limit) in case-insensitive order."""
+        keys = self._keys if limit is None else self._keys[:limit]
+        return [item for _, item in keys]
+
+    def add(self, item):
+        """Insert one item in O(log n) + O(len(item)); returns False if already present."""
+        if not item or item in self._members:
+            return False
+        key = item.lower()
+        self._members.add(item)
+        insort(self._keys, (key, item))
+        # Word starts after the first word; the first one is covered by _keys
+        for word in key.split()[1:]:
+            insort(self._words, (word, item))
+        with self._grams_lock:
+            if self._grams is not None:
+                for gram in _grams(key):
+                    self._grams.setdefault(gram, set()).add(item)
+        return True
+
+    def _prefix(self, sorted_pairs, query, limit, seen, out):
+        i = bisect_left(sorted_pairs, (query,))
+        while i < len(sorted_pairs) and len(out) < limit:
+            key, item = sorted_pairs[i]
+            if not key.startswith(query):
+                break
+            if item not in seen:
+                seen.add(item)
+                out.append(item)
+            i += 1
+
+    def search(self, query, limit=50):
+        """
+        Return up to limit items matching query: prefix matches first, then
+        names containing it further in (mid-word for queries of 3+ chars,
+        word starts for shorter ones).
+        """
+        query = query.strip().lower()
+        if not query:
+            return self.items(limit)
+
+        out, seen = [], set()
+        self._prefix(self._keys, query, limit, seen, out)
+        if len(out) >= limit:
+            return out
+
+        if len(query) < NGRAM:
+            self._prefix(self._words, query, limit, seen, out)
+            return out
+
+        if self._grams is None:
+            self.warm()
+        postings = [self._grams.get(gram) for gram in _grams(query)]
+        if not all(postings):
+            return out
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        for item in sorted(candidates - seen, key=str.lower):
+            if query in item.lower():
+                out.append(item)
+                if len(out) >= limit:
+                    break
+        return out
+
+
+class SuggestionIndex:
+    """
+    Most frequently used value per key (e.g. beneficiary per supplier).
+
+    Lookups are a single dict access; record() keeps the ranking current as
+    new pairs are written, so the index never has to be rebuilt.
+    """
+
+    def __init__(self, pairs=()):
+        self._counts = {}  # key -> {value: uses}
+        self._best = {}    # key -> (uses, value)
+        for key, value, uses in pairs:
+            self.record(key, value, uses)
+
+    def record(self, key, value, uses=1):
+        key = (key or "").strip().lower()
+        if not key or not value:
+            return
+        counts = self._counts.setdefault(key, {})
+        counts[value] = counts.get(value, 0) + uses
+        best = self._best.get(key)
+        if best is None or best[1] == value or counts[value] > best[0]:
+            self._best[key] = (counts[value], value)
+
+    def suggest(self, key):
+        best = self._best.get((key or "").strip().lower())
+        return best[1] if best else None
@@ -0,0 +1,29 @@
+"""
+Tk-free business rules of the VAT Refunder, shared by the entry screens,
+the CSV importer, the reports and the headless CLI.
+
+Nothing in this package opens a window or a database connection: every
+function takes plain values (strings, Decimals, dicts, row tuples) and the
+batch functions take whole lists, so the rules can be imported, timed
+(core_bench.py) and changed without a Tk root or a server.
+
+  periods     quarter arithmetic and '2024Q3' periods
+  vat         VAT contained in VAT-inclusive totals
+  invoices    invoice validation and duplicate detection
+  vouchers    voucher numbers, their period and invoice-voucher linking
+  report_rows row shaping for the report CSV files
+"""
+
+from core.periods import quarter_of_month, parse_period, periods
+from core.vat import VAT_RATES, calculate_vat_generic, vat_amounts, total_vat
+from core.invoices import (
+    OFFICE_TABLES, STATUSES, DEFAULT_STATUS, MissingFields,
+    parse_flag, validate_invoice, validate_invoices, invoice_params, session_key, find_duplicates,
+)
+from core.vouchers import (
+    VOUCHER_NUMBER_WIDTH, pad_voucher_number, voucher_period, voucher_periods, check_link, link_pairs,
+)
+from core.report_rows import (
+    MAX_INVOICE_NUMBER_LEN, fmt_amount, fmt_date, fmt_date_ddmmyyyy,
+    aeat_csv_rows, voucher_csv_row, colleague_csv_row,
+)
@@ -0,0 +1,141 @@
+"""
+Invoice validation and duplicate detection for the entry form and the CSV
+importer.
+
+validate_invoice() takes one row keyed like the importer's canonical CSV
+columns (Office, Supplier, Number, Date, Total, Vat, Refundable, Status,
+Recurring; values as typed) and returns the invoice dict the form keeps in
+its list, or raises ValueError with a human-readable reason.
+"""
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+OFFICE_TABLES = {
+    "Chancery": "Invoices_Chancery",
+    "Residence": "Invoices_Residence",
+}
+STATUSES = ("Pending", "Processed", "Archived")
+DEFAULT_STATUS = "Processed"
+DATE_FORMAT = "%Y-%m-%d"
+NUMBER_MAX_LEN = 255               # Number VARCHAR(255)
+AMOUNT_LIMIT = Decimal("1e8")      # Total / Vat DECIMAL(10,2): |amount| < 10^8
+CENT = Decimal("0.01")
+
+
+class MissingFields(ValueError):
+    """A required invoice field is blank."""
+
+
+def parse_flag(value, default=1):
+    """'1'/'yes'/'sí'/1 -> 1, '0'/'no'/0 -> 0, blank -> default; ValueError otherwise."""
+    value = str(value if value is not None else "").strip().lower()
+    if not value:
+        return default
+    if value in ("1", "yes", "y", "true", "si", "sí"):
+        return 1
+    if value in ("0", "no", "n", "false"):
+        return 0
+    raise ValueError(f"Invalid flag value: {value}")
+
+
+def _text(row, field):
+    return str(row.get(field) or "").strip()
+
+
+def _fits_amount(value):
+    """Whether value is finite and still fits DECIMAL(10,2) once rounded to cents."""
+    return value.is_finite() and abs(value) < AMOUNT_LIMIT and abs(value.quantize(CENT)) < AMOUNT_LIMIT
+
+
+def validate_invoice(row, supplier_id_map, default_office="Chancery"):
+    """One row -> invoice dict (see the module docstring); ValueError with the reason."""
+    office = (_text(row, "Office") or default_office).capitalize()
+    if office not in OFFICE_TABLES:
+        raise ValueError(f"Unknown office '{office}'.")
+
+    supplier_name = _text(row, "Supplier")
+    invoice_number = _text(row, "Number")
+    invoice_date = _text(row, "Date")
+    invoice_amount = _text(row, "Total")
+    invoice_vat = _text(row, "Vat")
+    status = _text(row, "Status") or DEFAULT_STATUS
+
+    if not all([supplier_name, invoice_number, invoice_date, invoice_amount, invoice_vat]):
+        raise MissingFields("Missing required invoice fields.")
+    try:
+        invoice_amount = Decimal(invoice_amount)
+        invoice_vat = Decimal(invoice_vat)
+    except InvalidOperation:
+        raise ValueError("Invoice Amount and VAT must be numbers.")
+    if not (_fits_amount(invoice_amount) and _fits_amount(invoice_vat)):
+        raise ValueError("Invoice Amount and VAT must be finite amounts below 100,000,000.")
+    if len(invoice_number) > NUMBER_MAX_LEN:
+        raise ValueError(f"Invoice number is longer than {NUMBER_MAX_LEN} characters.")
+    try:
+        datetime.strptime(invoice_date, DATE_FORMAT)
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD.")
+    if status not in STATUSES:
+        raise ValueError(f"Invalid status '{status}'.")
+    refundable = parse_flag(row.get("Refundable"))
+    recurring = parse_flag(row.get("Recurring"))
+
+    supplier_id = supplier_id_map.get(supplier_name)
+    if not supplier_id:
+        raise ValueError(f"Supplier '{supplier_name}' not found.")
+
+    return {
+        "office": office,
+        "supplier_name": supplier_name,
+        "supplier_id": supplier_id,
+        "invoice_number": invoice_number,
+        "invoice_date": invoice_date,
+        "invoice_amount": invoice_amount,
+        "invoice_vat": invoice_vat,
+        "refundable": refundable,
+        "status": status,
+        "recurring": recurring,
+    }
+
+
+def validate_invoices(rows, supplier_id_map, default_office="Chancery"):
+    """validate_invoice() over rows: a list of (invoice, None) or (None, reason), in row order."""
+    out = []
+    for row in rows:
+        try:
+            out.append((validate_invoice(row, supplier_id_map, default_office), None))
+        except ValueError as e:
+            out.append((None, str(e)))
+    return out
+
+
+def invoice_params(inv):
+    """INSERT parameters: (Supplier_ID, Number, Date, Total, Vat, Refundable, Status, Recurring)."""
+    return (inv["supplier_id"], inv["invoice_number"], inv["invoice_date"], inv["invoice_amount"],
+            inv["invoice_vat"], inv["refundable"], inv["status"], inv["recurring"])
+
+
+# ==========================================================
+# Duplicates
+# ==========================================================
+def session_key(inv):
+    """What makes two entries of one form session the same invoice."""
+    return inv["supplier_name"], inv["invoice_number"], inv["invoice_amount"]
+
+
+def find_duplicates(invoices, seen=(), key=session_key):
+    """
+    Indexes of the invoices whose key is in seen (e.g. the invoices already
+    listed) or repeats an earlier one of the batch. One set lookup per
+    invoice, however long the list.
+    """
+    keys = set(key(inv) for inv in seen)
+    found = []
+    for n, inv in enumerate(invoices):
+        k = key(inv)
+        if k in keys:
+            found.append(n)
+        else:
+            keys.add(k)
+    return found
@@ -0,0 +1,27 @@
+"""Quarters and the '2024Q3' periods the batch reports and the CLI take."""
+
+
+def quarter_of_month(month):
+    """1-12 -> 1-4."""
+    return (month - 1) // 3 + 1
+
+
+def parse_period(text):
+    """'2024Q3' / '2024-3' -> (2024, 3)."""
+    cleaned = text.strip().upper().replace("-", "Q")
+    try:
+        year, quarter = cleaned.split("Q")
+        year, quarter = int(year), int(quarter)
+    except ValueError:
+        raise ValueError(f"Period must look like 2024Q1, got {text!r}")
+    if not 1 <= quarter <= 4:
+        raise ValueError(f"Quarter must be 1-4, got {text!r}")
+    return year, quarter
+
+
+def periods(start, end):
+    """(year, quarter) pairs from start to end inclusive."""
+    year, quarter = start
+    while (year, quarter) <= end:
+        yield year, quarter
+        year, quarter = (year, quarter + 1) if quarter < 4 else (year + 1, 1)
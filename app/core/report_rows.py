@@ -0,0 +1,99 @@
+"""
+Row shaping for the report files: the AEAT CSV of the official report
+(vat_oficial), the voucher report CSV and the colleague summary CSV, plus
+the amount and date formats the reports share.
+"""
+
+from datetime import datetime
+
+MAX_INVOICE_NUMBER_LEN = 12  # AEAT constraint
+
+
+def fmt_amount(x):
+    """1234.5 -> '1,234.50'; anything unreadable as it is."""
+    try:
+        return f"{float(x):,.2f}"
+    except Exception:
+        return str(x)
+
+
+def fmt_date(d):
+    """date / datetime / str -> 'YYYY-MM-DD'."""
+    if hasattr(d, "strftime"):
+        return d.strftime("%Y-%m-%d")
+    try:
+        s = str(d)
+        return s[:10]
+    except Exception:
+        return str(d)
+
+
+def fmt_date_ddmmyyyy(d):
+    """Return date as dd-mm-YYYY (preferred for AEAT CSV)."""
+    if hasattr(d, "strftime"):
+        return d.strftime("%d-%m-%Y")
+    s = str(d)
+    s10 = s[:10]
+    try:
+        # Convert common YYYY-MM-DD to DD-MM-YYYY
+        if "-" in s10 and len(s10) == 10:
+            parts = s10.split("-")
+            if len(parts) == 3 and len(parts[0]) == 4:
+                y, m, d2 = parts
+                return f"{d2}-{m}-{y}"
+        # If already dd/mm/yyyy or dd-mm-yyyy, normalize to dashes
+        if "/" in s10 and len(s10) == 10:
+            return s10.replace("/", "-")
+        return s10
+    except Exception:
+        return s10
+
+
+# ==========================================================
+# Official report (AEAT CSV)
+# ==========================================================
+def aeat_csv_row(r):
+    """
+    ([NIF, Importe, Numero_Factura, Cuota, Fecha], original number) for one
+    view row; the number is cut to MAX_INVOICE_NUMBER_LEN and the original
+    is None unless it was.
+    """
+    nf = str(r.get("Numero_Factura", ""))
+    vals = [
+        str(r.get("NIF", "")),
+        str(r.get("Importe_Total_Impuestos_Incluidos", "")),
+        nf[:MAX_INVOICE_NUMBER_LEN],
+        str(r.get("Cuotas_IVA", "")),
+        fmt_date_ddmmyyyy(r.get("Fecha_Devengo", "")),
+    ]
+    return vals, (nf if len(nf) > MAX_INVOICE_NUMBER_LEN else None)
+
+
+def aeat_csv_rows(rows):
+    """(section, row, values, original number) for each (section, row) pair, streamed."""
+    for section, r in rows:
+        vals, original = aeat_csv_row(r)
+        yield section, r, vals, original
+
+
+# ==========================================================
+# Voucher and colleague reports
+# ==========================================================
+def voucher_csv_row(row):
+    """A voucher report row as written: an unlinked invoice gets an empty Voucher_Number."""
+    r = list(row)
+    r[5] = "" if r[5] is None else r[5]
+    return r
+
+
+def _trim_amount(x):
+    return f"{float(x):.2f}".rstrip("0").rstrip(".")
+
+
+def colleague_csv_row(row):
+    """Nif Proveedor; Importe total (impuestos incluidos); Nº factura; Cuota IVA; Fecha devengo"""
+    try:
+        fecha = datetime.strptime(str(row[7]), "%Y-%m-%d").strftime("%d-%m-%Y")
+    except Exception:
+        fecha = str(row[7])
+    return [str(row[3]), _trim_amount(row[6]), str(row[5]), _trim_amount(row[8]), fecha]
@@ -0,0 +1,43 @@
+"""VAT contained in VAT-inclusive totals, in Decimal and rounded half up to the cent."""
+
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+VAT_RATES = (0, 10, 21)  # the rate checkboxes of the invoice form
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def _decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def calculate_vat_generic(total_amount, percentage):
+    """VAT in total_amount at percentage; 0.00 for a rate of 0 or an unreadable total."""
+    total_amount = _decimal(total_amount)
+    if total_amount is None or percentage == 0:
+        return ZERO
+    rate = Decimal(str(percentage))
+    return (total_amount * rate / (Decimal("100") + rate)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def vat_amounts(totals, percentage):
+    """calculate_vat_generic() for a whole list of totals at one rate."""
+    if percentage == 0:
+        return [ZERO] * len(totals)
+    rate = Decimal(str(percentage))
+    divisor = Decimal("100") + rate
+    out = []
+    for total in totals:
+        total = _decimal(total)
+        out.append(ZERO if total is None else (total * rate / divisor).quantize(CENT, rounding=ROUND_HALF_UP))
+    return out
+
+
+def total_vat(invoices):
+    """Sum of invoice_vat over validated invoices (the voucher's default amount)."""
+    return sum((_decimal(inv["invoice_vat"]) or ZERO for inv in invoices), ZERO)
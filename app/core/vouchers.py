@@ -0,0 +1,53 @@
+"""
+Voucher numbers and invoice-voucher linking.
+
+Voucher numbers end in MMYY and one more digit (0001103245: March 2024);
+voucher_period() reads the year and quarter from there, as the form fills
+them in while the number is typed.
+"""
+
+from core.periods import quarter_of_month
+
+VOUCHER_NUMBER_WIDTH = 10
+
+
+def pad_voucher_number(s):
+    """Zero-pad to the stored width: '12345' -> '0000012345'."""
+    return s.zfill(VOUCHER_NUMBER_WIDTH)
+
+
+def voucher_period(number):
+    """(year, quarter) encoded in a voucher number, or None while it is too short or not a date."""
+    number = number.strip()
+    if len(number) < 5:
+        return None
+    try:
+        year = int("20" + number[-3:-1])
+        month = int(number[-5:-3])
+    except ValueError:
+        return None
+    if not 1 <= month <= 12:
+        return None
+    return year, quarter_of_month(month)
+
+
+def voucher_periods(numbers):
+    """voucher_period() for a list of numbers."""
+    return [voucher_period(number) for number in numbers]
+
+
+def check_link(invoice_count, voucher_count):
+    """
+    Raise ValueError unless the invoices and vouchers can go in one
+    transaction: one invoice to many vouchers or many invoices to one
+    voucher, not many to many.
+    """
+    if not invoice_count and not voucher_count:
+        raise ValueError("No invoices or vouchers to submit.")
+    if invoice_count > 1 and voucher_count > 1:
+        raise ValueError("Cannot submit multiple invoices AND multiple vouchers.")
+
+
+def link_pairs(invoice_ids, voucher_ids):
+    """(Invoice_ID, Voucher_ID) rows linking every invoice to every voucher."""
+    return [(invoice_id, voucher_id) for voucher_id in voucher_ids for invoice_id in invoice_ids]
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Timings for the core package's batch functions on synthetic rows.
+
+No database and no window: each hot path of core/ is run over --rows
+generated rows and timed with timeit (best of --repeat), so a change to the
+rules can be measured in isolation before it reaches the screens.
+
+  python core_bench.py
+  python core_bench.py --rows 200000 --repeat 5
+
+Prints one line per function: best time, and rows per second.
+"""
+
+import sys
+import random
+import timeit
+import argparse
+from datetime import date, timedelta
+from decimal import Decimal
+import core
+
+DEFAULT_ROWS = 50000
+DEFAULT_REPEAT = 3
+
+
+def make_rows(n, seed=362):
+    """(CSV-like invoice rows, supplier map, official report rows, voucher numbers)."""
+    rng = random.Random(seed)
+    suppliers = {f"Supplier {k:04d}": k for k in range(1, 301)}
+    names = list(suppliers)
+    first = date(2019, 1, 1)
+    invoice_rows, report_rows, voucher_numbers = [], [], []
+    for k in range(n):
+        total = Decimal(rng.randint(500, 500000)) / 100
+        day = first + timedelta(days=rng.randint(0, 2000))
+        invoice_rows.append({
+            "Office": rng.choice(("Chancery", "Residence")),
+            "Supplier": rng.choice(names),
+            "Number": f"F-{k:08d}",
+            "Date": day.isoformat(),
+            "Total": str(total),
+            "Vat": str(core.calculate_vat_generic(total, 21)),
+        })
+        report_rows.append((rng.choice(("Chancery", "Residence")), {
+            "NIF": f"B{rng.randint(1, 300):08d}",
+            "Numero_Factura": f"INV-{k:0{rng.choice((6, 14))}d}",
+            "Importe_Total_Impuestos_Incluidos": total,
+            "Cuotas_IVA": core.calculate_vat_generic(total, 21),
+            "Fecha_Devengo": day,
+        }))
+        voucher_numbers.append(f"{k % 9999:04d}{day.month:02d}{day.year % 100:02d}{k % 10}")
+    return invoice_rows, suppliers, report_rows, voucher_numbers
+
+
+def benchmarks(n):
+    invoice_rows, suppliers, report_rows, voucher_numbers = make_rows(n)
+    totals = [row["Total"] for row in invoice_rows]
+    invoices = [inv for inv, _ in core.validate_invoices(invoice_rows, suppliers)]
+    return [
+        ("validate_invoices", lambda: core.validate_invoices(invoice_rows, suppliers)),
+        ("find_duplicates", lambda: core.find_duplicates(invoices)),
+        ("vat_amounts", lambda: core.vat_amounts(totals, 21)),
+        ("total_vat", lambda: core.total_vat(invoices)),
+        ("voucher_periods", lambda: core.voucher_periods(voucher_numbers)),
+        ("aeat_csv_rows", lambda: sum(1 for _ in core.aeat_csv_rows(report_rows))),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the core package's batch functions.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help=f"rows per run (default {DEFAULT_ROWS})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per function; the best is kept")
+    args = parser.parse_args(argv)
+
+    for name, run in benchmarks(args.rows):
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f"{name:<18} {best * 1000:9.1f} ms  {args.rows / best:12,.0f} rows/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
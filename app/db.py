@@ -1,15 +1,226 @@
 import os
-import mysql.connector
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from mysql.connector import Error, errors, pooling
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# ==========================================================
+# Pool config
+# ==========================================================
+POOL_NAME = "vat_refunder"
+DEFAULT_POOL_SIZE = 5
+POOL_WAIT_SECONDS = 10      # how long get_cnx() waits when every connection is borrowed
+PING_ATTEMPTS = 3           # reconnect attempts when a borrowed connection is dead
+PING_DELAY_SECONDS = 1
+SNAPSHOT_ATTEMPTS = 3       # parallel snapshot retries before falling back to one connection
+SNAPSHOT_SYNC_SECONDS = 10  # how long parallel readers wait for each other to open their snapshot
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def db_config():
+    """Connection settings from MYSQL_CONNECTION, falling back to the DB_* variables."""
+    mysql_conn = os.getenv("MYSQL_CONNECTION")
+    if mysql_conn:
+        url = urlparse(mysql_conn)
+        return {
+            "host": url.hostname,
+            "user": url.username,
+            "password": url.password,
+            "database": url.path.lstrip("/"),
+            "port": url.port if url.port else 3306,
+        }
+    return {
+        "host": os.getenv("DB_HOST", "127.0.0.1"),
+        "user": os.getenv("DB_USER", "vat_user"),
+        "password": os.getenv("DB_PASS", os.getenv("DB_PASSWORD", "ChangeMeUser!")),
+        "database": os.getenv("DB_NAME", "vat_refunder"),
+    }
+
+
+def pool_size():
+    """Pool size from DB_POOL_SIZE, clamped to what mysql.connector allows."""
+    try:
+        size = int(os.getenv("DB_POOL_SIZE", DEFAULT_POOL_SIZE))
+    except ValueError:
+        size = DEFAULT_POOL_SIZE
+    return max(1, min(size, pooling.CNX_POOL_MAXSIZE))
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name=POOL_NAME,
+                    pool_size=pool_size(),
+                    pool_reset_session=True,
+                    autocommit=False,  # better control; handle commits explicitly
+                    **db_config(),
+                )
+    return _pool
+
+
 def get_cnx():
-    """Return a new MySQL connection using environment variables."""
-    return mysql.connector.connect(
-        host=os.getenv("DB_HOST", "127.0.0.1"),
-        user=os.getenv("DB_USER", "vat_user"),
-        password=os.getenv("DB_PASS", "ChangeMeUser!"),
-        database=os.getenv("DB_NAME", "vat_refunder"),
-        autocommit=False,  # better control; handle commits explicitly
-    )
+    """
+    Borrow a connection from the shared pool.
+
+    The connection is pinged before it is handed out and reconnected if the
+    server dropped it (wait_timeout, container restart). Calling close() on it
+    returns it to the pool instead of closing the socket.
+    """
+    pool = get_pool()
+    deadline = time.monotonic() + POOL_WAIT_SECONDS
+    while True:
+        try:
+            cnx = pool.get_connection()
+            break
+        except errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+    try:
+        cnx.ping(reconnect=True, attempts=PING_ATTEMPTS, delay=PING_DELAY_SECONDS)
+    except Error:
+        cnx.close()
+        raise
+    return cnx
+
+
+# ==========================================================
+# Context manager for automatic cleanup
+# ==========================================================
+@contextmanager
+def db_cursor(commit=False, dictionary=False):
+    """
+    Yield a cursor on a pooled connection.
+
+    With commit=True the transaction is committed on success; otherwise it is
+    rolled back so the connection goes back to the pool without an open
+    transaction or a stale read snapshot.
+    """
+    cnx = get_cnx()
+    cur = None
+    try:
+        cur = cnx.cursor(dictionary=dictionary)
+        yield cur
+        if commit:
+            cnx.commit()
+        else:
+            cnx.rollback()
+    except Exception:
+        cnx.rollback()
+        raise
+    finally:
+        if cur:
+            cur.close()
+        cnx.close()
+
+
+@contextmanager
+def snapshot_cursor(dictionary=False):
+    """
+    Yield an unbuffered cursor inside a read-only consistent-snapshot
+    transaction, for streaming large results with fetchmany(). Rows the
+    caller did not read are drained before the connection goes back.
+    """
+    cnx = get_cnx()
+    cur = None
+    try:
+        cnx.start_transaction(consistent_snapshot=True, readonly=True)
+        cur = cnx.cursor(dictionary=dictionary)
+        yield cur
+    finally:
+        try:
+            if cnx.unread_result:
+                cnx.consume_results()
+            if cur:
+                cur.close()
+            cnx.rollback()
+        finally:
+            cnx.close()
+
+
+def in_placeholders(values):
+    """Return a '%s, %s, ...' list for an IN (...) clause over values."""
+    return ", ".join(["%s"] * len(values))
+
+
+# ==========================================================
+# Parallel reads over matching snapshots
+# ==========================================================
+def _snapshot_read(cnx, readers, watermark, dictionary, barrier=None):
+    """Run readers inside one consistent-snapshot transaction on cnx; returns (watermark, results)."""
+    cur = cnx.cursor(dictionary=dictionary)
+    try:
+        cnx.start_transaction(consistent_snapshot=True, readonly=True)
+        if barrier is not None:
+            barrier.wait(SNAPSHOT_SYNC_SECONDS)
+        cur.execute(*watermark)
+        mark = cur.fetchall()
+        results = [reader(cur) for reader in readers]
+        return mark, results
+    finally:
+        cur.close()
+        cnx.rollback()
+
+
+def _snapshot_worker(reader, watermark, dictionary, barrier):
+    try:
+        cnx = get_cnx()
+    except Exception:
+        barrier.abort()
+        raise
+    try:
+        mark, (result,) = _snapshot_read(cnx, [reader], watermark, dictionary, barrier)
+        return mark, result
+    except Exception:
+        barrier.abort()
+        raise
+    finally:
+        cnx.close()
+
+
+def parallel_snapshot_read(readers, watermark, dictionary=False, attempts=SNAPSHOT_ATTEMPTS):
+    """
+    Run each reader(cursor) on its own pooled connection, concurrently, and
+    return their results in the order given.
+
+    MySQL cannot share one snapshot between connections, so every reader opens
+    its own START TRANSACTION WITH CONSISTENT SNAPSHOT; the readers start
+    together and each evaluates watermark = (sql, params) inside its snapshot.
+    If the watermarks differ a write landed between the snapshots and the read
+    is retried; after attempts tries (or when the pool is too small) all
+    readers run one after another on a single snapshot instead. Reader errors
+    propagate to the caller.
+    """
+    readers = list(readers)
+    if len(readers) > 1 and pool_size() >= len(readers):
+        with ThreadPoolExecutor(max_workers=len(readers), thread_name_prefix="snapshot-read") as ex:
+            for _ in range(attempts):
+                barrier = threading.Barrier(len(readers))
+                futures = [ex.submit(_snapshot_worker, r, watermark, dictionary, barrier) for r in readers]
+                errors_seen = [f.exception() for f in futures]
+                # Report the reader's own error, not the barrier it broke for the others
+                for err in sorted(filter(None, errors_seen), key=lambda e: isinstance(e, threading.BrokenBarrierError)):
+                    raise err
+                outcomes = [f.result() for f in futures]
+                marks = [mark for mark, _ in outcomes]
+                if all(mark == marks[0] for mark in marks):
+                    return [result for _, result in outcomes]
+
+    cnx = get_cnx()
+    try:
+        _, results = _snapshot_read(cnx, readers, watermark, dictionary)
+        return results
+    finally:
+        cnx.close()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Duplicate detection for the entry screens.
+
+Writers insert straight away and let the UNIQUE keys decide: a number that
+already exists fails that statement with error 1062 (ER_DUP_ENTRY), the
+db_cursor() transaction rolls back and nothing is half-written. There is no
+SELECT-before-INSERT round trip, and no window in which two workstations both
+see "not there yet" and insert the same invoice.
+
+duplicate(err) turns such an error into a Duplicate(key, what, value) the
+screens can report; any other error gives None.
+"""
+
+import re
+from collections import namedtuple
+from mysql.connector import errorcode
+
+# UNIQUE key name (db/init/001_init.sql) -> what the user calls its value
+UNIQUE_KEYS = {
+    "Invoice_Chancery_No": "Invoice",
+    "Invoice_Residence_No": "Invoice",
+    "Invoice_Personal_No": "Invoice",  # added by migrate.py
+    "Voucher_Number": "Voucher",
+    "Supplier_NIF_Code": "NIF code",
+    "Supplier_Name": "Supplier",
+}
+
+Duplicate = namedtuple("Duplicate", "key what value")
+
+# MySQL 8 names the key as 'Table.Key', older servers as 'Key'
+_DUP_ENTRY = re.compile(r"Duplicate entry '(.*)' for key '(?:[^']*\.)?([^'.]*)'", re.DOTALL)
+
+
+def duplicate(err):
+    """Duplicate for a duplicate-key error, else None."""
+    if getattr(err, "errno", None) != errorcode.ER_DUP_ENTRY:
+        return None
+    match = _DUP_ENTRY.search(getattr(err, "msg", None) or str(err))
+    if not match:
+        return Duplicate(None, "Entry", None)
+    value, key = match.groups()
+    return Duplicate(key, UNIQUE_KEYS.get(key, "Entry"), value)
+
+
+def message(dup):
+    """'Invoice F-123 already exists.' for the message boxes."""
+    if dup.value is None:
+        return f"{dup.what} already exists."
+    return f"{dup.what} {dup.value} already exists."
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN regression check for the report queries.
+
+Builds a scratch database from db/init/*.sql, seeds it with a few years of
+invoices, vouchers and links, runs ANALYZE TABLE, then EXPLAINs every report
+query for one seeded quarter. It fails when a table that grows with the
+invoices is read in full (type ALL or index) or a query sorts with
+"Using filesort" where its check does not allow it. The scratch database is
+dropped afterwards.
+
+Needs an account that may create databases, e.g.:
+  DB_USER=root DB_PASS=... python explain_check.py
+  python explain_check.py --database vat_refunder_explain --keep -v
+
+Exit status: 0 when every plan passes, 1 otherwise.
+"""
+
+import re
+import sys
+import random
+import argparse
+from datetime import date, timedelta
+import mysql.connector
+from mysql.connector import Error
+from db import db_config
+import schema
+from migrate import init_statements
+import link_summary
+import vat_oficial
+import vat_vouchers
+
+DEFAULT_DATABASE = "vat_refunder_explain"
+
+# Seed sizes: large enough that the optimizer prefers an index over a scan
+SEED_YEARS = (2019, 2024)
+SEED_SUPPLIERS = 300
+SEED_HEADS = 20
+SEED_VOUCHERS = 4000
+SEED_INVOICES = 20000         # per office
+SEED_BATCH = 2000
+CHECK_PERIOD = (2023, 2)      # (year, quarter) the queries are explained for
+
+# Tables whose size grows with the invoices; these must never be read in full
+# unless a check says so
+GROWING_TABLES = {
+    "invoices_chancery", "invoices_residence",
+    "vouchers_chancery", "vouchers_residence", "vouchers",
+    "invoice_voucher_links",
+}
+
+
+# ==========================================================
+# Scratch database
+# ==========================================================
+def create_database(cnx, name):
+    cur = cnx.cursor()
+    cur.execute(f"DROP DATABASE IF EXISTS `{name}`")
+    cur.execute(f"CREATE DATABASE `{name}` CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci")
+    cur.execute(f"USE `{name}`")
+    for statement in init_statements():
+        cur.execute(statement)
+    cur.close()
+
+
+def _insert(cur, sql, rows):
+    for start in range(0, len(rows), SEED_BATCH):
+        cur.executemany(sql, rows[start:start + SEED_BATCH])
+
+
+def seed(cnx):
+    rng = random.Random(362)
+    first, last = date(SEED_YEARS[0], 1, 1), date(SEED_YEARS[1], 12, 31)
+    span = (last - first).days
+    cur = cnx.cursor()
+
+    _insert(cur, "INSERT INTO Head_of_Accounts (Name) VALUES (%s)",
+            [(f"Head {n}",) for n in range(1, SEED_HEADS + 1)])
+    _insert(cur, "INSERT INTO NIF_Codes (Supplier_NIF_Code, Supplier_Name) VALUES (%s, %s)",
+            [(f"B{n:08d}", f"Supplier {n:04d}") for n in range(1, SEED_SUPPLIERS + 1)])
+    _insert(cur, "INSERT INTO Vouchers (Voucher_Number, Head_of_Accounts_ID, Voucher_Euro, "
+                 "Voucher_Quarter, Voucher_Year) VALUES (%s, %s, %s, %s, %s)",
+            [(f"V{n:06d}", rng.randint(1, SEED_HEADS), rng.randint(100, 90000) / 100,
+              rng.randint(1, 4), rng.randint(*SEED_YEARS)) for n in range(1, SEED_VOUCHERS + 1)])
+
+    for prefix, table, link in (("C", "Invoices_Chancery", "Vouchers_Chancery"),
+                                ("R", "Invoices_Residence", "Vouchers_Residence")):
+        invoices = []
+        for n in range(1, SEED_INVOICES + 1):
+            total = rng.randint(500, 500000) / 100
+            invoices.append((rng.randint(1, SEED_SUPPLIERS), f"{prefix}{n:07d}",
+                             first + timedelta(days=rng.randint(0, span)),
+                             total, round(total * 0.21 / 1.21, 2), int(rng.random() < 0.8)))
+        _insert(cur, f"INSERT INTO {table} (Supplier_ID, Number, Date, Total, Vat, Refundable) "
+                     "VALUES (%s, %s, %s, %s, %s, %s)", invoices)
+        links = {(n, rng.randint(1, SEED_VOUCHERS)) for n in range(1, SEED_INVOICES + 1) if rng.random() < 0.6}
+        _insert(cur, f"INSERT INTO {link} (Invoice_ID, Voucher_ID) VALUES (%s, %s)", sorted(links))
+
+    link_summary.rebuild(cur)
+    cnx.commit()
+    cur.execute("ANALYZE TABLE Head_of_Accounts, NIF_Codes, Vouchers, Invoices_Chancery, "
+                "Invoices_Residence, Vouchers_Chancery, Vouchers_Residence, Invoice_Voucher_Links")
+    cur.fetchall()
+    cur.close()
+
+
+# ==========================================================
+# Checks: (name, sql, params, full scans allowed, filesort allowed)
+# ==========================================================
+def report_checks(cur):
+    year, quarter = CHECK_PERIOD
+    # The watermarks checksum whole reference / voucher tables on purpose
+    watermark_scans = {"vouchers", "vouchers_chancery", "vouchers_residence"}
+
+    checks = [
+        ("vat_vouchers report", vat_vouchers.report_query(),
+         (year, quarter) * len(vat_vouchers.OFFICES), set(), True),
+        ("vat_vouchers watermark",) + vat_vouchers.sections_watermark(cur, quarter, year) + (watermark_scans, False),
+    ]
+    # What link_summary.sync() runs for one quarter of each office
+    for office in link_summary.OFFICES:
+        for label, template, params in (
+            ("fingerprint", link_summary.FINGERPRINT_QUERY, (year, quarter)),
+            ("rebuild", link_summary.SUMMARY_SELECT, (office, year, quarter)),
+        ):
+            sql = link_summary.statement(cur, template, office, link_summary.PERIOD_WHERE)
+            # GROUP BY of one quarter's rows
+            checks.append((f"link_summary {label} {office.lower()}", sql, params, set(), True))
+    # The VAT views are deployment specific; explain them where they exist
+    if all(schema.columns(cur, view_name) for _, view_name in vat_oficial.SECTIONS):
+        checks.append(("vat_oficial watermark",) + vat_oficial.sections_watermark(cur, quarter, year) + (set(), False))
+    for section, view_name in vat_oficial.SECTIONS:
+        if schema.columns(cur, view_name):
+            select = vat_oficial.section_select(cur, view_name)
+            sql = (f"SELECT {select} FROM {view_name} WHERE Trimestre = %s AND Fiscal_Year = %s "
+                   "ORDER BY NIF, Fecha_Devengo, Numero_Factura")
+            checks.append((f"vat_oficial {section.lower()}", sql, (quarter, year), set(), True))
+    return checks
+
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN " + sql.strip().rstrip(";"), params)
+    return cur.fetchall()
+
+
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_NOT_ALIAS = {"on", "where", "left", "right", "inner", "cross", "join", "group", "order", "using"}
+
+
+def table_names(sql):
+    """
+    alias -> set of table names (lower case) for the tables named in sql;
+    EXPLAIN shows aliases, and UNION branches may reuse one alias.
+    """
+    names = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        names.setdefault(table.lower(), set()).add(table.lower())
+        if alias and alias.lower() not in _NOT_ALIAS:
+            names.setdefault(alias.lower(), set()).add(table.lower())
+    return names
+
+
+def problems(plan, tables, full_scans_ok, filesort_ok):
+    found = []
+    for row in plan:
+        alias = (row.get("table") or "").lower()
+        guarded = tables.get(alias, {alias}) & (GROWING_TABLES - full_scans_ok)
+        if guarded and row.get("type") in ("ALL", "index"):
+            found.append(f"full scan of {'/'.join(sorted(guarded))} (type {row['type']})")
+        extra = row.get("Extra") or ""
+        if "Using filesort" in extra and not filesort_ok:
+            found.append(f"filesort on {row.get('table')}")
+    return found
+
+
+def format_plan(plan):
+    return "\n".join(
+        f"      {row.get('table')!s:<22} type={row.get('type')!s:<7} key={row.get('key')!s:<34} "
+        f"rows={row.get('rows')!s:<7} {row.get('Extra') or ''}"
+        for row in plan
+    )
+
+
+def run_checks(cnx, verbose=False):
+    cur = cnx.cursor(dictionary=True)
+    failures = 0
+    for name, sql, params, full_scans_ok, filesort_ok in report_checks(cur):
+        plan = explain(cur, sql, params)
+        found = problems(plan, table_names(sql), full_scans_ok, filesort_ok)
+        print(f"{'FAIL' if found else 'ok  '}  {name}")
+        for problem in found:
+            print(f"      - {problem}")
+        if found or verbose:
+            print(format_plan(plan))
+        failures += bool(found)
+    cur.close()
+    return failures
+
+
+# ==========================================================
+# Main
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN the report queries against a seeded scratch database.")
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help=f"scratch database (default {DEFAULT_DATABASE})")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch database afterwards")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args(argv)
+
+    config = db_config()
+    if args.database == config.get("database"):
+        parser.error("the scratch database must not be the application database")
+    config.pop("database", None)
+
+    try:
+        cnx = mysql.connector.connect(**config)
+    except Error as e:
+        print(f"Cannot connect: {e}", file=sys.stderr)
+        return 1
+    try:
+        create_database(cnx, args.database)
+        seed(cnx)
+        failures = run_checks(cnx, args.verbose)
+    except Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        failures = 1
+    finally:
+        if not args.keep:
+            try:
+                cnx.cursor().execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+            except Error:
+                pass
+        cnx.close()
+
+    print("All report query plans pass." if not failures else f"{failures} report query plan(s) regressed.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,75 +1,92 @@
 #!/usr/bin/env python3
-import os
-from contextlib import contextmanager
-from db import get_cnx  # central DB connector
+from db import db_cursor  # shared pooled connection
+from widgets import AutocompleteCombobox
+import refdata
+import duplicates
+import schema
+import background
+from core.vat import calculate_vat_generic
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import messagebox
 from mysql.connector import Error
 from datetime import datetime
 
 # ==========================================================
-# Context manager for automatic cleanup
+# Database Fetch Function
 # ==========================================================
-@contextmanager
-def db_cursor(commit=False):
-    cnx = get_cnx()
-    cur = cnx.cursor()
+REFERENCE_TABLES = ["colleagues", "recipients", "suppliers", "refund_statuses"]
+REFRESH_POLL_MS = 250
+reference_refresh = None
+
+def fetch_data_from_db():
+    """Shared lookups (refdata.Lookup) for REFERENCE_TABLES, fetched in one batch when not cached yet."""
+    global reference_refresh
     try:
-        yield cur
-        if commit:
-            cnx.commit()
-    except Exception as e:
-        cnx.rollback()
-        raise e
-    finally:
-        cur.close()
-        cnx.close()
+        lookups, reference_refresh = refdata.load_lookups(REFERENCE_TABLES)
+        return tuple(lookups[name] for name in REFERENCE_TABLES)
+    except Error as e:
+        messagebox.showerror("Database Error", f"Error fetching data: {e}")
+        return (refdata.EMPTY_LOOKUP,) * len(REFERENCE_TABLES)
+
+def apply_reference_refresh():
+    """Poll the background re-validation and swap in any tables that changed."""
+    global colleagues, recipients, suppliers, refund_statuses, \
+        Colleague_ID_map, recipient_id_map, supplier_id_map, refund_status_id_map
+    if reference_refresh is None:
+        return
+    if not reference_refresh.done():
+        root.after(REFRESH_POLL_MS, apply_reference_refresh)
+        return
+    try:
+        changed = reference_refresh.result()
+    except (Error, OSError):
+        return  # keep the cached snapshot
+    if "colleagues" in changed:
+        colleagues = changed["colleagues"]
+        Colleague_ID_map = colleagues.id_by_name
+        colleague_dropdown.set_completion_list(colleagues.names)
+    if "recipients" in changed:
+        recipients = changed["recipients"]
+        recipient_id_map = recipients.id_by_name
+        recipient_dropdown.set_completion_list(recipients.names)
+    if "suppliers" in changed:
+        suppliers = changed["suppliers"]
+        supplier_id_map = suppliers.id_by_name
+        store_dropdown.set_completion_list(suppliers.names)
+    if "refund_statuses" in changed:
+        refund_statuses = changed["refund_statuses"]
+        refund_status_id_map = refund_statuses.id_by_name
+        refund_status_dropdown.set_completion_list(refund_statuses.names)
+
 # ==========================================================
-# Autocomplete Combobox Class
+# Writes
 # ==========================================================
-class AutocompleteCombobox(ttk.Combobox):
+# A plain INSERT: the UNIQUE key on Number rejects duplicates (see duplicates.py)
+INVOICE_INSERT = """
+INSERT INTO Invoices_Personal (Store, Colleague_ID, Recipient_ID, Number, Date, Amount, VAT, Status, Date_Refunded)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+class MissingNumberKey(Exception):
+    """Invoices_Personal has no UNIQUE key on Number yet (see migrate.py)."""
+
+def write_invoice(row):
     """
-    A Combobox with autocompletion.
+    Insert one personal invoice (INVOICE_INSERT column order); returns its ID.
+    Invoices_Personal is not created by db/init, so the UNIQUE key on Number
+    that rejects duplicates is added by migrate.py; without it nothing is
+    written. Once found, the key is not looked up again in this session
+    (schema.has_unique_key memoizes it).
     """
-    def set_completion_list(self, completion_list):
-        self._completion_list = sorted(completion_list, key=str.lower)
-        self['values'] = self._completion_list
-        self.bind('<KeyRelease>', self._handle_keyrelease)
-        self.bind('<<ComboboxSelected>>', self._handle_selected)
-
-    def _handle_keyrelease(self, event):
-        if event.keysym in ("BackSpace", "Left", "Right", "Up", "Down", "Return", "Escape"):
-            return
-        value = self.get().lower()
-        matches = [item for item in self._completion_list if item.lower().startswith(value)]
-        if matches:
-            self['values'] = matches
-            self.event_generate('<Down>')
-        else:
-            self['values'] = self._completion_list
+    with db_cursor(commit=True) as cur:
+        if not schema.has_unique_key(cur, "Invoices_Personal", "Number"):
+            raise MissingNumberKey(
+                "Invoices_Personal has no UNIQUE key on Number, so duplicates cannot be rejected. "
+                "Run 'python app/migrate.py' to add it."
+            )
+        cur.execute(INVOICE_INSERT, row)
+        return cur.lastrowid
 
-    def _handle_selected(self, event):
-        pass
-
-# ==========================================================
-# Database Fetch Function
-# ==========================================================
-def fetch_data_from_db():
-    try:
-        with db_cursor(commit=False) as cur:
-            # Fetch colleagues: only rank_id between 1 and 5 and ordered by rank_id
-            cur.execute("SELECT Colleague_ID, Colleague_Name FROM Colleagues WHERE rank_id BETWEEN 1 AND 5 ORDER BY rank_id")
-            colleagues = cur.fetchall()
-            cur.execute("SELECT recipient_id, Name FROM Recipients")
-            recipients = cur.fetchall()
-            cur.execute("SELECT Supplier_ID, Supplier_Name FROM NIF_Codes")
-            suppliers = cur.fetchall()
-            cur.execute("SELECT Refund_Status_ID, Refund_Status_Type FROM Refund_Status")
-            refund_statuses = cur.fetchall()
-            return colleagues, recipients, suppliers, refund_statuses
-    except Error as e:
-        messagebox.showerror("Database Error", f"Error fetching data: {e}")
-        return [], [], [], []
 # ==========================================================
 # Event Handlers
 # ==========================================================
@@ -108,37 +125,33 @@ def submit_transaction():
     recipient_id = recipient_id_map.get(recipient_name)
     refund_status_id = refund_status_id_map.get(refund_status_name)
 
-    try:
-        with db_cursor(commit=True) as cur:
-            cur.execute("SELECT * FROM Invoices_Personal WHERE Number = %s", (invoice_number,))
-            invoice = cur.fetchone()
-            if invoice:
-                messagebox.showerror("Duplicate Invoice", "An invoice with this number already exists.")
-                return
+    row = (
+        store_id,
+        Colleague_ID,
+        recipient_id,
+        invoice_number,
+        invoice_date,
+        invoice_amount,
+        invoice_vat,
+        refund_status_id,
+        date_refunded if date_refunded else None
+    )
+
+    def submitted(_):
+        messagebox.showinfo("Success", "Invoice submitted successfully.")
+        clear_form()
+
+    def failed(e):
+        if isinstance(e, MissingNumberKey):
+            messagebox.showerror("Database Upgrade Needed", str(e))
+        elif duplicates.duplicate(e):
+            messagebox.showerror("Duplicate Invoice", f"Invoice {invoice_number} already exists.")
+        else:
+            messagebox.showerror("Database Error", f"Error submitting invoice: {e}")
+
+    background.start(root, lambda task: write_invoice(row), on_done=submitted, on_error=failed,
+                     busy=[submit_button])
 
-            query = """
-            INSERT INTO Invoices_Personal (Store, Colleague_ID, Recipient_ID, Number, Date, Amount, VAT, Status, Date_Refunded)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            cur.execute(query, (
-                store_id,
-                Colleague_ID,
-                recipient_id,
-                invoice_number,
-                invoice_date,
-                invoice_amount,
-                invoice_vat,
-                refund_status_id,
-                date_refunded if date_refunded else None
-            ))
-            print("Store ID:", store_id)
-            print("Colleague ID:", Colleague_ID)
-            print("Recipient ID:", recipient_id)
-            print("Refund Status ID:", refund_status_id)
-            messagebox.showinfo("Success", "Invoice submitted successfully.")
-            clear_form()
-    except Error as e:
-        messagebox.showerror("Database Error", f"Error submitting invoice: {e}")
 def clear_form():
     store_var.set('')
     colleague_var.set('')
@@ -171,7 +184,7 @@ def on_vat_checkbox_toggle():
         invoice_vat_entry.config(state='normal')
 
 def calculate_vat_from_total(total_amount):
-    return total_amount * 21 / 121
+    return calculate_vat_generic(total_amount, 21)
 
 def on_invoice_amount_change(*args):
     if vat_21_var.get():
@@ -183,92 +196,105 @@ def on_invoice_amount_change(*args):
             invoice_vat_var.set("")
 
 # ==========================================================
-# Fetch Data
+# Tkinter GUI Setup
 # ==========================================================
-colleagues, recipients, suppliers, refund_statuses = fetch_data_from_db()
+def main(master=None):
+    """Build the form; as a Toplevel of master when hosted by the launcher."""
+    global root, colleagues, recipients, suppliers, refund_statuses, Colleague_ID_map, \
+        recipient_id_map, supplier_id_map, refund_status_id_map, store_var, colleague_var, \
+        recipient_var, invoice_number_entry, invoice_date_entry, invoice_amount_entry, \
+        invoice_amount_var, invoice_vat_entry, invoice_vat_var, vat_21_var, refund_status_var, \
+        date_refunded_entry, store_dropdown, colleague_dropdown, recipient_dropdown, \
+        refund_status_dropdown, submit_button
 
-Colleague_ID_map = {colleague[1]: colleague[0] for colleague in colleagues}
-recipient_id_map = {recipient[1]: recipient[0] for recipient in recipients}
-supplier_id_map = {supplier[1]: supplier[0] for supplier in suppliers}
-refund_status_id_map = {status[1]: status[0] for status in refund_statuses}
+    # Fetch Data
+    colleagues, recipients, suppliers, refund_statuses = fetch_data_from_db()
 
-# ==========================================================
-# Tkinter GUI Setup
-# ==========================================================
-root = tk.Tk()
-root.title("Personal Invoice Entry Form")
-root.geometry("700x600")
-root.configure(bg="#E8F0FE")
-for widget in root.winfo_children():
-    try:
-        widget.configure(bg="#E8F0FE")
-    except:
-        pass
-
-root.update_idletasks()
-w = root.winfo_width()
-h = root.winfo_height()
-ws = root.winfo_screenwidth()
-hs = root.winfo_screenheight()
-x = (ws // 2) - (w // 2)
-y = (hs // 2) - (h // 2)
-root.geometry(f"{w}x{h}+{x}+{y}")
-
-padding_options = {'padx': 10, 'pady': 5}
-
-tk.Label(root, text="Store:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=0, column=0, sticky=tk.E, **padding_options)
-store_var = tk.StringVar()
-store_dropdown = AutocompleteCombobox(root, textvariable=store_var, state="readonly", font=("Helvetica", 12), width=30)
-store_dropdown.set_completion_list([supplier[1] for supplier in suppliers])
-store_dropdown.grid(row=0, column=1, **padding_options)
-
-tk.Label(root, text="Colleague:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=1, column=0, sticky=tk.E, **padding_options)
-colleague_var = tk.StringVar()
-colleague_dropdown = AutocompleteCombobox(root, textvariable=colleague_var, state="readonly", font=("Helvetica", 12), width=30)
-colleague_dropdown.set_completion_list([colleague[1] for colleague in colleagues])
-colleague_dropdown.grid(row=1, column=1, **padding_options)
-colleague_dropdown.bind("<<ComboboxSelected>>", on_colleague_select)
-
-tk.Label(root, text="Recipient:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=2, column=0, sticky=tk.E, **padding_options)
-recipient_var = tk.StringVar()
-recipient_dropdown = AutocompleteCombobox(root, textvariable=recipient_var, state="readonly", font=("Helvetica", 12), width=30)
-recipient_dropdown.set_completion_list([recipient[1] for recipient in recipients])
-recipient_dropdown.grid(row=2, column=1, **padding_options)
-
-tk.Label(root, text="Invoice Number:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=3, column=0, sticky=tk.E, **padding_options)
-invoice_number_entry = tk.Entry(root, font=("Helvetica", 12), width=32)
-invoice_number_entry.grid(row=3, column=1, **padding_options)
-
-tk.Label(root, text="Invoice Date (YYYY-MM-DD):", font=("Helvetica", 12), bg="#E8F0FE").grid(row=4, column=0, sticky=tk.E, **padding_options)
-invoice_date_entry = tk.Entry(root, font=("Helvetica", 12), width=32)
-invoice_date_entry.grid(row=4, column=1, **padding_options)
-
-tk.Label(root, text="Invoice Amount (€):", font=("Helvetica", 12), bg="#E8F0FE").grid(row=5, column=0, sticky=tk.E, **padding_options)
-invoice_amount_var = tk.StringVar()
-invoice_amount_entry = tk.Entry(root, textvariable=invoice_amount_var, font=("Helvetica", 12), width=32)
-invoice_amount_entry.grid(row=5, column=1, **padding_options)
-invoice_amount_var.trace_add('write', on_invoice_amount_change)
-
-vat_21_var = tk.IntVar()
-vat_checkbox = tk.Checkbutton(root, text="Is VAT 21%?", variable=vat_21_var, font=("Helvetica", 12), command=on_vat_checkbox_toggle, bg="#E8F0FE")
-vat_checkbox.grid(row=6, column=0, sticky=tk.E, **padding_options)
-
-tk.Label(root, text="Invoice VAT (€):", font=("Helvetica", 12), bg="#E8F0FE").grid(row=6, column=1, sticky=tk.W, **padding_options)
-invoice_vat_var = tk.StringVar()
-invoice_vat_entry = tk.Entry(root, textvariable=invoice_vat_var, font=("Helvetica", 12), width=32)
-invoice_vat_entry.grid(row=6, column=1, sticky=tk.E, **padding_options)
-
-tk.Label(root, text="Refund Status:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=7, column=0, sticky=tk.E, **padding_options)
-refund_status_var = tk.StringVar()
-refund_status_dropdown = AutocompleteCombobox(root, textvariable=refund_status_var, state="readonly", font=("Helvetica", 12), width=30)
-refund_status_dropdown.set_completion_list([status[1] for status in refund_statuses])
-refund_status_dropdown.grid(row=7, column=1, **padding_options)
-
-tk.Label(root, text="Date Refunded (YYYY-MM-DD, optional):", font=("Helvetica", 12), bg="#E8F0FE").grid(row=8, column=0, sticky=tk.E, **padding_options)
-date_refunded_entry = tk.Entry(root, font=("Helvetica", 12), width=32)
-date_refunded_entry.grid(row=8, column=1, **padding_options)
-
-submit_button = tk.Button(root, text="Submit", command=submit_transaction, font=("Helvetica", 12), bg="#4CAF50", fg="white", width=15)
-submit_button.grid(row=9, column=1, sticky=tk.E, **padding_options)
-
-root.mainloop()
+    Colleague_ID_map = colleagues.id_by_name
+    recipient_id_map = recipients.id_by_name
+    supplier_id_map = suppliers.id_by_name
+    refund_status_id_map = refund_statuses.id_by_name
+
+    root = tk.Toplevel(master) if master else tk.Tk()
+    root.title("Personal Invoice Entry Form")
+    root.geometry("700x600")
+    root.configure(bg="#E8F0FE")
+    for widget in root.winfo_children():
+        try:
+            widget.configure(bg="#E8F0FE")
+        except:
+            pass
+
+    root.update_idletasks()
+    w = root.winfo_width()
+    h = root.winfo_height()
+    ws = root.winfo_screenwidth()
+    hs = root.winfo_screenheight()
+    x = (ws // 2) - (w // 2)
+    y = (hs // 2) - (h // 2)
+    root.geometry(f"{w}x{h}+{x}+{y}")
+
+    padding_options = {'padx': 10, 'pady': 5}
+
+    tk.Label(root, text="Store:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=0, column=0, sticky=tk.E, **padding_options)
+    store_var = tk.StringVar()
+    store_dropdown = AutocompleteCombobox(root, textvariable=store_var, state="readonly", font=("Helvetica", 12), width=30)
+    store_dropdown.set_completion_list(suppliers.names)
+    store_dropdown.grid(row=0, column=1, **padding_options)
+
+    tk.Label(root, text="Colleague:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=1, column=0, sticky=tk.E, **padding_options)
+    colleague_var = tk.StringVar()
+    colleague_dropdown = AutocompleteCombobox(root, textvariable=colleague_var, state="readonly", font=("Helvetica", 12), width=30)
+    colleague_dropdown.set_completion_list(colleagues.names)
+    colleague_dropdown.grid(row=1, column=1, **padding_options)
+    colleague_dropdown.bind("<<ComboboxSelected>>", on_colleague_select)
+
+    tk.Label(root, text="Recipient:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=2, column=0, sticky=tk.E, **padding_options)
+    recipient_var = tk.StringVar()
+    recipient_dropdown = AutocompleteCombobox(root, textvariable=recipient_var, state="readonly", font=("Helvetica", 12), width=30)
+    recipient_dropdown.set_completion_list(recipients.names)
+    recipient_dropdown.grid(row=2, column=1, **padding_options)
+
+    tk.Label(root, text="Invoice Number:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=3, column=0, sticky=tk.E, **padding_options)
+    invoice_number_entry = tk.Entry(root, font=("Helvetica", 12), width=32)
+    invoice_number_entry.grid(row=3, column=1, **padding_options)
+
+    tk.Label(root, text="Invoice Date (YYYY-MM-DD):", font=("Helvetica", 12), bg="#E8F0FE").grid(row=4, column=0, sticky=tk.E, **padding_options)
+    invoice_date_entry = tk.Entry(root, font=("Helvetica", 12), width=32)
+    invoice_date_entry.grid(row=4, column=1, **padding_options)
+
+    tk.Label(root, text="Invoice Amount (€):", font=("Helvetica", 12), bg="#E8F0FE").grid(row=5, column=0, sticky=tk.E, **padding_options)
+    invoice_amount_var = tk.StringVar()
+    invoice_amount_entry = tk.Entry(root, textvariable=invoice_amount_var, font=("Helvetica", 12), width=32)
+    invoice_amount_entry.grid(row=5, column=1, **padding_options)
+    invoice_amount_var.trace_add('write', on_invoice_amount_change)
+
+    vat_21_var = tk.IntVar()
+    vat_checkbox = tk.Checkbutton(root, text="Is VAT 21%?", variable=vat_21_var, font=("Helvetica", 12), command=on_vat_checkbox_toggle, bg="#E8F0FE")
+    vat_checkbox.grid(row=6, column=0, sticky=tk.E, **padding_options)
+
+    tk.Label(root, text="Invoice VAT (€):", font=("Helvetica", 12), bg="#E8F0FE").grid(row=6, column=1, sticky=tk.W, **padding_options)
+    invoice_vat_var = tk.StringVar()
+    invoice_vat_entry = tk.Entry(root, textvariable=invoice_vat_var, font=("Helvetica", 12), width=32)
+    invoice_vat_entry.grid(row=6, column=1, sticky=tk.E, **padding_options)
+
+    tk.Label(root, text="Refund Status:", font=("Helvetica", 12), bg="#E8F0FE").grid(row=7, column=0, sticky=tk.E, **padding_options)
+    refund_status_var = tk.StringVar()
+    refund_status_dropdown = AutocompleteCombobox(root, textvariable=refund_status_var, state="readonly", font=("Helvetica", 12), width=30)
+    refund_status_dropdown.set_completion_list(refund_statuses.names)
+    refund_status_dropdown.grid(row=7, column=1, **padding_options)
+
+    tk.Label(root, text="Date Refunded (YYYY-MM-DD, optional):", font=("Helvetica", 12), bg="#E8F0FE").grid(row=8, column=0, sticky=tk.E, **padding_options)
+    date_refunded_entry = tk.Entry(root, font=("Helvetica", 12), width=32)
+    date_refunded_entry.grid(row=8, column=1, **padding_options)
+
+    submit_button = tk.Button(root, text="Submit", command=submit_transaction, font=("Helvetica", 12), bg="#4CAF50", fg="white", width=15)
+    submit_button.grid(row=9, column=1, sticky=tk.E, **padding_options)
+
+    root.after(REFRESH_POLL_MS, apply_reference_refresh)
+    if master is None:
+        root.mainloop()
+    return root
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,20 @@
 #!/usr/bin/env python3
-import csv
 from decimal import Decimal, ROUND_HALF_UP, getcontext
-import re
-import math
-from urllib.parse import urlparse
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import mysql.connector
 from mysql.connector import Error
-from datetime import datetime, date
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from datetime import date
+from db import db_cursor, in_placeholders  # shared pooled connection
+from batch_import import import_invoices_csv
+from widgets import AutocompleteCombobox
+from completion import SuggestionIndex
+import refdata
+import link_summary
+import duplicates
+import background
+from core.vat import calculate_vat_generic, total_vat
+from core.invoices import MissingFields, validate_invoice, invoice_params, find_duplicates
+from core.vouchers import pad_voucher_number, voucher_period, check_link, link_pairs
 
 # ===================== GLOBAL CONFIG =====================
 getcontext().rounding = ROUND_HALF_UP
@@ -22,137 +24,34 @@ DEFAULT_OFFICE = "Chancery"
 DEFAULT_HEAD = "OE, CHANCERY"
 DEFAULT_STATUS = "Processed"
 
-# ===================== Autocomplete Combobox =====================
-class AutocompleteCombobox(ttk.Combobox):
-    def set_completion_list(self, completion_list):
-        self._completion_list = sorted(completion_list, key=str.lower)
-        self['values'] = self._completion_list
-        self.bind('<KeyRelease>', self._handle_keyrelease)
-    
-    def _handle_keyrelease(self, event):
-        if event.keysym in ("BackSpace", "Left", "Right", "Up", "Down", "Return", "Escape"):
-            return
-        value = self.get().lower()
-        matches = [item for item in self._completion_list if item.lower().startswith(value)]
-        self['values'] = matches if matches else self._completion_list
-        if matches:
-            self.event_generate('<Down>')
-
-# ===================== DB Config =====================
-mysql_conn = os.environ.get("MYSQL_CONNECTION")
-if mysql_conn:
-    url = urlparse(mysql_conn)
-    db_config = {
-        "host": url.hostname,
-        "user": url.username,
-        "password": url.password,
-        "database": url.path.lstrip('/'),
-        "port": url.port if url.port else 3306
-    }
-else:
-    db_config = {
-        "host": os.environ.get("DB_HOST"),
-        "user": os.environ.get("DB_USER"),
-        "password": os.environ.get("DB_PASSWORD"),
-        "database": os.environ.get("DB_NAME")
-    }
-
-# ===================== DB Fetch =====================
-def fetch_suppliers():
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cur = conn.cursor()
-        cur.execute("SELECT Supplier_ID, Supplier_Name FROM NIF_Codes")
-        return cur.fetchall()
-    except Error:
-        return []
-    finally:
-        if 'conn' in locals() and conn.is_connected():
-            cur.close(); conn.close()
-
-def fetch_budget_heads():
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cur = conn.cursor()
-        cur.execute("SELECT Head_of_Accounts_ID, Head_of_Accounts_Name FROM Head_of_Accounts")
-        rows = cur.fetchall()
-        return {name: head_id for head_id, name in rows}
-    except Error:
-        return {}
-    finally:
-        if 'conn' in locals() and conn.is_connected():
-            cur.close(); conn.close()
-
-def fetch_beneficiaries():
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT Voucher_Beneficiary FROM Vouchers WHERE Voucher_Beneficiary IS NOT NULL AND Voucher_Beneficiary != ''")
-        rows = cur.fetchall()
-        return [row[0] for row in rows]
-    except Error:
-        return []
-    finally:
-        if 'conn' in locals() and conn.is_connected():
-            cur.close(); conn.close()
-
 # ===================== Utils =====================
-def calculate_vat_generic(total_amount, percentage):
-    if not isinstance(total_amount, Decimal):
-        try:
-            total_amount = Decimal(str(total_amount))
-        except:
-            return Decimal('0.00')
-    if percentage == 0:
-        return Decimal('0.00')
-    rate = Decimal(str(percentage))
-    divisor = Decimal('100') + rate
-    vat = total_amount * rate / divisor
-    return vat.quantize(Decimal('0.01'))
+def show_db_error(e, parent=None):
+    """Report a failed write: duplicates by what was duplicated, anything else as a database error."""
+    dup = duplicates.duplicate(e)
+    if dup:
+        messagebox.showerror(f"Duplicate {dup.what}", duplicates.message(dup), parent=parent)
+    else:
+        messagebox.showerror("Database Error", f"Error: {e}", parent=parent)
 
 def update_voucher_euro_default():
-    total_vat = Decimal('0.00')
-    for inv in invoices_list:
-        val = inv['invoice_vat']
-        if not isinstance(val, Decimal):
-            val = Decimal(str(val))
-        total_vat += val
     entry_voucher_euro.delete(0, tk.END)
-    entry_voucher_euro.insert(0, f"{total_vat:.2f}")
-
-def pad_voucher_number(s):
-    return s.zfill(10)
+    entry_voucher_euro.insert(0, f"{total_vat(invoices_list):.2f}")
 
 def on_voucher_number_change(event):
-    val = entry_voucher_number.get().strip()
-    if len(val) >= 5:
-        try:
-            year_part = val[-3:-1]
-            month_part = val[-5:-3]
-            year_full = int("20" + year_part)
-            month_int = int(month_part)
-            if 1 <= month_int <= 12:
-                quarter = (month_int - 1) // 3 + 1
-                entry_voucher_year.delete(0, tk.END)
-                entry_voucher_year.insert(0, str(year_full))
-                entry_voucher_quarter.delete(0, tk.END)
-                entry_voucher_quarter.insert(0, str(quarter))
-        except ValueError:
-            pass
+    period = voucher_period(entry_voucher_number.get())
+    if period:
+        year, quarter = period
+        entry_voucher_year.delete(0, tk.END)
+        entry_voucher_year.insert(0, str(year))
+        entry_voucher_quarter.delete(0, tk.END)
+        entry_voucher_quarter.insert(0, str(quarter))
 
 def auto_suggest_beneficiary(*args):
     supp_name = supplier_var.get().strip()
     if not supp_name:
         return
-    pattern = re.compile(re.escape(supp_name), re.IGNORECASE)
-    best_match = ""
-    for ben in beneficiaries_list:
-        if pattern.search(ben):
-            best_match = ben
-            if supp_name.lower() == ben.lower():
-                break
-            if not best_match: 
-                best_match = ben
+    # Most used beneficiary for this supplier, else a beneficiary with the same name
+    best_match = beneficiary_index.suggest(supp_name) or beneficiary_by_name.get(supp_name.lower())
     if best_match:
         current_val = entry_voucher_beneficiary.get().strip()
         if not current_val:
@@ -188,7 +87,8 @@ def open_add_beneficiary_window():
             return
 
         beneficiaries_list.append(new_name)
-        entry_voucher_beneficiary.set_completion_list(beneficiaries_list)
+        beneficiary_by_name[new_name.lower()] = new_name
+        entry_voucher_beneficiary.add_completion(new_name)
         entry_voucher_beneficiary.set(new_name)
         popup.destroy()
 
@@ -222,35 +122,19 @@ def open_add_supplier_window():
             messagebox.showwarning("Input Error", "Please fill both NIF Code and Name.", parent=popup)
             return
 
-        try:
-            conn = mysql.connector.connect(**db_config)
-            cur = conn.cursor()
-            cur.execute("SELECT 1 FROM NIF_Codes WHERE Supplier_Name = %s OR Supplier_NIF_Code = %s", (supplier_name, nif_code))
-            if cur.fetchone():
-                messagebox.showerror("Error", "Supplier Name or NIF already exists.", parent=popup)
-                return
-
-            insert_query = "INSERT INTO NIF_Codes (Supplier_NIF_Code, Supplier_Name) VALUES (%s, %s)"
-            cur.execute(insert_query, (nif_code, supplier_name))
-            conn.commit()
+        def saved(new_id):
+            global suppliers, supplier_id_map
+            suppliers = refdata.add_row("suppliers", (new_id, supplier_name))
+            supplier_id_map = suppliers.id_by_name
             
-            new_id = cur.lastrowid
-            global suppliers
-            suppliers.append((new_id, supplier_name))
-            supplier_id_map[supplier_name] = new_id
-            
-            updated_names = [s[1] for s in suppliers]
-            supplier_dropdown.set_completion_list(updated_names)
+            supplier_dropdown.add_completion(supplier_name)
             supplier_dropdown.set(supplier_name)
 
             messagebox.showinfo("Success", f"Supplier added!\nID: {new_id}", parent=popup)
             popup.destroy()
 
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error: {e}", parent=popup)
-        finally:
-            if 'conn' in locals() and conn.is_connected():
-                cur.close(); conn.close()
+        background.start(popup, lambda task: write_supplier(nif_code, supplier_name), on_done=saved,
+                         on_error=lambda e: show_db_error(e, parent=popup), busy=[btn_save])
 
     btn_save = tk.Button(popup, text="Add Supplier", command=save_new_supplier, bg="#4CAF50", fg="white")
     btn_save.pack(pady=15)
@@ -260,55 +144,33 @@ def open_add_supplier_window():
 invoices_list = []
 
 def add_invoice_to_list():
-    supplier_name = supplier_var.get().strip()
-    invoice_number = invoice_number_entry.get().strip()
-    invoice_date = invoice_date_entry.get().strip()
-    invoice_amount = invoice_amount_entry.get().strip()
-    invoice_vat = invoice_vat_entry.get().strip()
-    refundable = vat_refundable_var.get()
-    status = status_var.get().strip()
-    recurring = recurring_var.get()
-
-    if not all([supplier_name, invoice_number, invoice_date, invoice_amount, invoice_vat, refundable, status, recurring]):
-        status_label.config(text="Please fill in all required invoice fields.", fg="red")
-        return
+    row = {
+        "Supplier": supplier_var.get(),
+        "Number": invoice_number_entry.get(),
+        "Date": invoice_date_entry.get(),
+        "Total": invoice_amount_entry.get(),
+        "Vat": invoice_vat_entry.get(),
+        "Refundable": vat_refundable_var.get(),
+        "Status": status_var.get(),
+        "Recurring": recurring_var.get(),
+    }
     try:
-        invoice_amount = Decimal(invoice_amount)
-        invoice_vat = Decimal(invoice_vat) if invoice_vat else Decimal('0.00')
-    except ValueError:
-        messagebox.showwarning("Input Error", "Invoice Amount and VAT must be numbers.")
+        inv = validate_invoice(row, supplier_id_map, office_var.get())
+    except MissingFields:
+        status_label.config(text="Please fill in all required invoice fields.", fg="red")
         return
-    try:
-        datetime.strptime(invoice_date, '%Y-%m-%d')
-    except ValueError:
-        messagebox.showwarning("Input Error", "Invalid date format. Use YYYY-MM-DD.")
+    except ValueError as e:
+        messagebox.showwarning("Input Error", str(e))
         return
 
-    supplier_id = supplier_id_map.get(supplier_name)
-    if not supplier_id:
-        messagebox.showwarning("Input Error", f"Supplier '{supplier_name}' not found.")
+    if find_duplicates([inv], seen=invoices_list):
+        messagebox.showinfo("Duplicate Invoice", "This invoice has already been entered during this session.")
         return
-    
-    for inv in invoices_list:
-        if (inv["supplier_name"] == supplier_name and inv["invoice_number"] == invoice_number and 
-            inv["invoice_amount"] == invoice_amount):
-            messagebox.showinfo("Duplicate Invoice", "This invoice has already been entered during this session.")
-            return
-    
-    inv = {
-        "supplier_name": supplier_name,
-        "invoice_number": invoice_number,
-        "invoice_date": invoice_date,
-        "invoice_amount": invoice_amount,
-        "invoice_vat": invoice_vat,
-        "refundable": refundable,
-        "status": status,
-        "recurring": recurring
-    }
-    
+
     invoices_list.append(inv)
     invoices_tree.insert("", "end", values=(
-        supplier_name, invoice_number, invoice_date, f"{invoice_amount:.2f}", f"{invoice_vat:.2f}", refundable, recurring, status
+        inv["supplier_name"], inv["invoice_number"], inv["invoice_date"], f"{inv['invoice_amount']:.2f}",
+        f"{inv['invoice_vat']:.2f}", inv["refundable"], inv["recurring"], inv["status"]
     ))
     
     update_voucher_euro_default()
@@ -436,104 +298,123 @@ def submit_voucher_only():
 
     number = pad_voucher_number(number_raw)
 
-    if messagebox.askyesno("Confirm", f"Submit Voucher #{number} ONLY?\n(No invoices will be linked)"):
-        try:
-            conn = mysql.connector.connect(**db_config)
-            cur = conn.cursor()
-            
-            # Check duplicate
-            cur.execute("SELECT 1 FROM Vouchers WHERE Voucher_Number = %s", (number,))
-            if cur.fetchone():
-                messagebox.showerror("Duplicate", f"Voucher {number} already exists in Database.")
-                return
-
-            sql = """INSERT INTO Vouchers 
-                     (Voucher_Number, Head_of_Accounts_ID, Voucher_Beneficiary, Voucher_Euro, Voucher_Quarter, Voucher_Year)
-                     VALUES (%s, %s, %s, %s, %s, %s)"""
-            cur.execute(sql, (number, head_id, beneficiary, euro, quarter, year))
-            conn.commit()
-            
-            messagebox.showinfo("Success", f"Voucher {number} inserted successfully.")
-            
-            # Clear fields
-            entry_voucher_number.delete(0, tk.END)
-            entry_voucher_beneficiary.delete(0, tk.END)
-            entry_voucher_euro.delete(0, tk.END)
-            entry_voucher_euro.insert(0, "0.00")
-            entry_voucher_quarter.delete(0, tk.END)
-            entry_voucher_year.delete(0, tk.END)
-            budget_head_var.set(DEFAULT_HEAD)
-
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error: {e}")
-        finally:
-            if 'conn' in locals() and conn.is_connected():
-                cur.close(); conn.close()
+    if not messagebox.askyesno("Confirm", f"Submit Voucher #{number} ONLY?\n(No invoices will be linked)"):
+        return
+
+    def inserted(_):
+        messagebox.showinfo("Success", f"Voucher {number} inserted successfully.")
+
+        # Clear fields
+        entry_voucher_number.delete(0, tk.END)
+        entry_voucher_beneficiary.delete(0, tk.END)
+        entry_voucher_euro.delete(0, tk.END)
+        entry_voucher_euro.insert(0, "0.00")
+        entry_voucher_quarter.delete(0, tk.END)
+        entry_voucher_year.delete(0, tk.END)
+        budget_head_var.set(DEFAULT_HEAD)
+
+    row = (number, head_id, beneficiary, euro, quarter, year)
+    background.start(root, lambda task: write_voucher(row), on_done=inserted,
+                     on_error=show_db_error, busy=write_buttons)
+
+# ===================== Writes =====================
+# Plain INSERTs: the UNIQUE keys reject duplicates in the same statement (see duplicates.py)
+SUPPLIER_INSERT = "INSERT INTO NIF_Codes (Supplier_NIF_Code, Supplier_Name) VALUES (%s, %s)"
+VOUCHER_INSERT = """INSERT INTO Vouchers
+    (Voucher_Number, Head_of_Accounts_ID, Voucher_Beneficiary, Voucher_Euro, Voucher_Quarter, Voucher_Year)
+    VALUES (%s, %s, %s, %s, %s, %s)"""
+INVOICE_INSERT = """INSERT INTO {table}
+    (Supplier_ID, Number, Date, Total, Vat, Refundable, Status, Recurring)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
+
+def write_supplier(nif_code, supplier_name):
+    """Insert a supplier; returns its ID. A name or NIF that exists raises the duplicate-key error."""
+    with db_cursor(commit=True) as cur:
+        cur.execute(SUPPLIER_INSERT, (nif_code, supplier_name))
+        return cur.lastrowid
+
+def write_voucher(row):
+    """Insert one voucher (VOUCHER_INSERT column order); returns its ID."""
+    with db_cursor(commit=True) as cur:
+        cur.execute(VOUCHER_INSERT, row)
+        return cur.lastrowid
+
+def write_transaction(office, invoice_rows, voucher_rows):
+    """
+    Insert invoice_rows and voucher_rows (INSERT column order) and link every
+    invoice to every voucher, in one transaction; returns (invoice_ids,
+    voucher_ids). If any number already exists the duplicate-key error is
+    raised and nothing is written.
+    """
+    table_name, link_table = link_summary.OFFICES[office]
+    invoice_ids, voucher_ids = [], []
+
+    with db_cursor(commit=True) as cur:
+        # executemany turns each of these into a single multi-row INSERT
+        if invoice_rows:
+            numbers = [row[1] for row in invoice_rows]
+            cur.executemany(INVOICE_INSERT.format(table=table_name), invoice_rows)
+            # Map IDs back through the unique Number rather than assuming consecutive auto-increments
+            cur.execute(
+                f"SELECT Number, ID FROM {table_name} WHERE Number IN ({in_placeholders(numbers)})",
+                numbers
+            )
+            id_by_number = dict(cur.fetchall())
+            invoice_ids = [id_by_number[n] for n in numbers]
+
+        if voucher_rows:
+            v_numbers = [row[0] for row in voucher_rows]
+            cur.executemany(VOUCHER_INSERT, voucher_rows)
+            cur.execute(
+                f"SELECT Voucher_Number, Voucher_ID FROM Vouchers WHERE Voucher_Number IN ({in_placeholders(v_numbers)})",
+                v_numbers
+            )
+            id_by_number = dict(cur.fetchall())
+            voucher_ids = [id_by_number[n] for n in v_numbers]
+
+        links = link_pairs(invoice_ids, voucher_ids)
+        if links:
+            cur.executemany(
+                f"INSERT INTO {link_table} (Invoice_ID, Voucher_ID) VALUES (%s, %s)",
+                links
+            )
+            link_summary.refresh_invoices(cur, office, invoice_ids, new=True)
+
+    return invoice_ids, voucher_ids
 
 # ===================== Event Handlers =====================
 def submit_transaction():
     office = office_var.get()
-    table_name = "Invoices_Chancery" if office == "Chancery" else "Invoices_Residence"
-    link_table = "Vouchers_Chancery" if office == "Chancery" else "Vouchers_Residence"
-    
-    invoice_ids = []
-    voucher_ids = []
-
-    if not invoices_list and not vouchers_list:
-        messagebox.showwarning("Empty", "No invoices or vouchers to submit.")
-        return
-
-    if len(invoices_list) > 1 and len(vouchers_list) > 1:
-        messagebox.showwarning("Input Error", "Cannot submit multiple invoices AND multiple vouchers.")
-        return
 
     try:
-        conn = mysql.connector.connect(**db_config)
-        cur = conn.cursor()
-
-        for i in invoices_list:
-            cur.execute(f"SELECT 1 FROM {table_name} WHERE Number = %s", (i["invoice_number"],))
-            if cur.fetchone():
-                messagebox.showerror("Duplicate Invoice", f"Invoice {i['invoice_number']} already exists.")
-                return
-
-        for i in invoices_list: 
-            supp_id = supplier_id_map.get(i["supplier_name"])
-            cur.execute(f"""INSERT INTO {table_name}
-            (Supplier_ID, Number, Date, Total, Vat, Refundable, Status, Recurring)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
-            (supp_id, i["invoice_number"], i["invoice_date"], i["invoice_amount"], i["invoice_vat"],
-             i["refundable"], i["status"], i["recurring"])
-            )
-            invoice_ids.append(cur.lastrowid)
+        check_link(len(invoices_list), len(vouchers_list))
+    except ValueError as e:
+        messagebox.showwarning("Input Error" if invoices_list or vouchers_list else "Empty", str(e))
+        return
 
-        for v in vouchers_list:
-            head_id = budget_heads.get(v["head_name"])
-            cur.execute(
-                """INSERT INTO Vouchers
-                   (Voucher_Number, Head_of_Accounts_ID, Voucher_Beneficiary, Voucher_Euro, Voucher_Quarter, Voucher_Year)
-                   VALUES (%s, %s, %s, %s, %s, %s)""",
-                (v["number"], head_id, v["beneficiary"], v["euro"], v["quarter"], v["year"])
-            )
-            voucher_id = cur.lastrowid
-            voucher_ids.append(voucher_id)
+    invoice_rows = [invoice_params(i) for i in invoices_list]
+    voucher_rows = [
+        (v["number"], budget_heads.get(v["head_name"]), v["beneficiary"], v["euro"], v["quarter"], v["year"])
+        for v in vouchers_list
+    ]
+    pairs = [(i["supplier_name"], v["beneficiary"]) for v in vouchers_list for i in invoices_list]
 
-            for inv_id in invoice_ids:
-                cur.execute(
-                    f"INSERT INTO {link_table} (Invoice_ID, Voucher_ID) VALUES (%s, %s)",
-                    (inv_id, voucher_id)
-                )
+    def submitted(result):
+        _, voucher_ids = result
+        for supplier_name, beneficiary in pairs:
+            beneficiary_index.record(supplier_name, beneficiary)
 
-        conn.commit()
         messagebox.showinfo("Success", f"Transaction Successful. Linked {len(voucher_ids)} vouchers.")
         status_label.config(text="Transaction Submitted.", fg="green")
         clear_form()
 
-    except Error as e:
-        messagebox.showerror("Database Error", f"Error: {e}")
-    finally:
-        if 'conn' in locals() and conn.is_connected():
-            cur.close(); conn.close()
+    status_label.config(text="Submitting…", fg="black")
+    background.start(root, lambda task: write_transaction(office, invoice_rows, voucher_rows),
+                     on_done=submitted, on_error=submit_failed, busy=write_buttons)
+
+def submit_failed(e):
+    status_label.config(text="", fg="black")
+    show_db_error(e)
 
 def clear_form():
     supplier_var.set('')
@@ -599,182 +480,271 @@ def on_invoice_amount_change(*args):
     calc_vat_from_ui()
 
 def batch_insert():
-    pass 
+    path = filedialog.askopenfilename(
+        title="Select invoice CSV", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+    )
+    if not path:
+        return
+    office = office_var.get()
+
+    def work(task):
+        def progress(line_no, inserted):
+            task.check()
+            task.progress(line_no, None, f"Line {line_no:,}: {inserted:,} invoices inserted…")
+        return import_invoices_csv(path, supplier_id_map, default_office=office, progress=progress)
+
+    def imported(summary):
+        msg = f"Inserted {summary['inserted']} invoices."
+        if summary["rejected"]:
+            msg += f"\n{summary['rejected']} rows rejected, see:\n{summary['reject_file']}"
+            status_label.config(text=f"Batch insert: {summary['rejected']} rows rejected.", fg="red")
+        else:
+            status_label.config(text="Batch insert complete.", fg="green")
+        messagebox.showinfo("Batch Insert", msg)
+
+    def cancelled():
+        status_label.config(text="Batch insert cancelled.", fg="red")
+        messagebox.showinfo("Batch Insert", "Import cancelled. Chunks committed before cancelling stay in the database.")
+
+    background.start(
+        root, work, on_done=imported, on_cancel=cancelled,
+        on_error=lambda e: messagebox.showerror("Batch Insert Error", f"Error: {e}"),
+        busy=write_buttons, title="Batch Insert CSV",
+    )
 
 # ===================== Data =====================
-suppliers = fetch_suppliers()
-supplier_id_map = {supplier[1]: supplier[0] for supplier in suppliers}
-budget_heads = fetch_budget_heads()
-beneficiaries_list = fetch_beneficiaries()
+REFERENCE_TABLES = ["suppliers", "budget_heads", "beneficiaries", "beneficiary_history"]
+REFRESH_POLL_MS = 250
+
+def load_reference_data(data):
+    """(Re)build the lookup globals; only the tables present in data are replaced."""
+    global suppliers, supplier_id_map, budget_heads, beneficiaries_list, beneficiary_by_name, beneficiary_index
+    if "suppliers" in data:
+        suppliers = refdata.lookup("suppliers")
+        supplier_id_map = suppliers.id_by_name
+    if "budget_heads" in data:
+        budget_heads = refdata.lookup("budget_heads").id_by_name
+    if "beneficiaries" in data:
+        beneficiaries_list = [row[0] for row in data["beneficiaries"]]
+        beneficiary_by_name = {b.lower(): b for b in beneficiaries_list}
+    if "beneficiary_history" in data:
+        beneficiary_index = SuggestionIndex(data["beneficiary_history"])
+
+def apply_reference_refresh():
+    """Poll the background re-validation and swap in any tables that changed."""
+    if reference_refresh is None:
+        return
+    if not reference_refresh.done():
+        root.after(REFRESH_POLL_MS, apply_reference_refresh)
+        return
+    try:
+        changed = reference_refresh.result()
+    except (Error, OSError):
+        return  # keep painting from the cached snapshot
+    if not changed:
+        return
+    load_reference_data(changed)
+    if "suppliers" in changed:
+        supplier_dropdown.set_completion_list(suppliers.names)
+    if "beneficiaries" in changed:
+        entry_voucher_beneficiary.set_completion_list(beneficiaries_list)
+    if "budget_heads" in changed:
+        budget_head_dropdown.set_completion_list(list(budget_heads.keys()))
 
 # ===================== GUI =====================
-root = tk.Tk()
-root.title("Invoice Entry Form")
-root.geometry("900x750")
-
-label_font = ("Helvetica", 10)
-button_font = ("Helvetica", 10, "bold")
-root.columnconfigure(1, weight=1)
-root.columnconfigure(3, weight=1)
-
-PAD_X = 5
-PAD_Y = 2
-
-tk.Label(root, text="Office:", font=label_font).grid(row=0, column=0, padx=PAD_X, pady=10, sticky="e")
-office_frame = tk.Frame(root)
-office_frame.grid(row=0, column=1, columnspan=3, sticky="w", padx=PAD_X, pady=5)
-office_var = tk.StringVar(value=DEFAULT_OFFICE)
-tk.Radiobutton(office_frame, text="Chancery", variable=office_var, value="Chancery", font=label_font).pack(side="left", padx=10)
-tk.Radiobutton(office_frame, text="Residence", variable=office_var, value="Residence", font=label_font).pack(side="left", padx=10)
-
-# Invoice Details
-tk.Label(root, text="Supplier:", font=label_font).grid(row=1, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
-
-# Supplier Row with Add Button
-supplier_var = tk.StringVar()
-supp_frame = tk.Frame(root)
-supp_frame.grid(row=1, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
-
-supplier_dropdown = AutocompleteCombobox(supp_frame, textvariable=supplier_var, font=label_font)
-supplier_dropdown.set_completion_list([supplier[1] for supplier in suppliers])
-supplier_dropdown.pack(side="left", fill="x", expand=True)
-supplier_var.trace_add("write", auto_suggest_beneficiary)
-
-btn_add_supp = tk.Button(supp_frame, text="+", width=3, command=open_add_supplier_window, bg="#ddd")
-btn_add_supp.pack(side="right", padx=(5, 0))
-
-tk.Label(root, text="Invoice Number:", font=label_font).grid(row=1, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
-invoice_number_entry = tk.Entry(root, font=label_font)
-invoice_number_entry.grid(row=1, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
-
-tk.Label(root, text="Date (YYYY-MM-DD):", font=label_font).grid(row=2, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
-invoice_date_entry = tk.Entry(root, font=label_font)
-invoice_date_entry.grid(row=2, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
-invoice_date_entry.insert(0, date.today().strftime('%Y-%m-%d'))
-
-tk.Label(root, text="Amount (€):", font=label_font).grid(row=2, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
-invoice_amount_var = tk.StringVar()
-invoice_amount_entry = tk.Entry(root, textvariable=invoice_amount_var, font=label_font)
-invoice_amount_entry.grid(row=2, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
-invoice_amount_var.trace_add('write', on_invoice_amount_change)
-
-# VAT
-vat_frame = tk.Frame(root)
-vat_frame.grid(row=3, column=0, columnspan=4, pady=5)
-vat_0_var = tk.IntVar()
-tk.Checkbutton(vat_frame, text="VAT 0%", variable=vat_0_var, font=label_font, 
-               command=lambda: on_vat_checkbox_change(0)).pack(side="left", padx=10)
-vat_10_var = tk.IntVar()
-tk.Checkbutton(vat_frame, text="VAT 10%", variable=vat_10_var, font=label_font, 
-               command=lambda: on_vat_checkbox_change(10)).pack(side="left", padx=10)
-vat_21_var = tk.IntVar()
-tk.Checkbutton(vat_frame, text="VAT 21%", variable=vat_21_var, font=label_font, 
-               command=lambda: on_vat_checkbox_change(21)).pack(side="left", padx=10)
-
-tk.Label(root, text="VAT (€):", font=label_font).grid(row=4, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
-invoice_vat_var = tk.StringVar()
-invoice_vat_entry = tk.Entry(root, textvariable=invoice_vat_var, font=label_font)
-invoice_vat_entry.grid(row=4, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
-
-tk.Label(root, text="Status:", font=label_font).grid(row=4, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
-status_var = tk.StringVar(value=DEFAULT_STATUS)
-status_dropdown = ttk.Combobox(root, textvariable=status_var, font=label_font, state="readonly", values=["Pending", "Processed", "Archived"])
-status_dropdown.grid(row=4, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
-
-flags_frame = tk.Frame(root)
-flags_frame.grid(row=5, column=1, columnspan=3, sticky="w", pady=PAD_Y)
-vat_refundable_var = tk.IntVar(value=1)
-tk.Checkbutton(flags_frame, text="Refundable", variable=vat_refundable_var, font=label_font).pack(side="left", padx=5)
-recurring_var = tk.IntVar(value=1)
-tk.Checkbutton(flags_frame, text="Recurring", variable=recurring_var, font=label_font).pack(side="left", padx=20)
-
-btn_add_invoice = tk.Button(root, text="Add Invoice", command=add_invoice_to_list, font=button_font, bg="#6A5ACD", fg="white")
-btn_add_invoice.grid(row=6, column=0, columnspan=4, pady=10)
-
-cols = ("Supplier", "Invoice Number", "Date", "Amount (€)", "VAT (€)", "Refundable", "Recurring", "Status")
-invoices_tree = ttk.Treeview(root, columns=cols, show="headings", height=5)
-for c in cols:
-    invoices_tree.heading(c, text=c)
-    invoices_tree.column(c, width=90, anchor="w")
-invoices_tree.grid(row=7, column=0, columnspan=4, padx=10, pady=5, sticky="nsew")
-
-btn_remove_invoice = tk.Button(root, text="Remove Selected", command=remove_selected_invoice, font=("Helvetica", 9), bg="#B22222", fg="white")
-btn_remove_invoice.grid(row=8, column=0, padx=10, pady=5, sticky="w")
-
-# Vouchers
-ttk.Separator(root, orient='horizontal').grid(row=9, column=0, columnspan=4, sticky="ew", padx=10, pady=10)
-tk.Label(root, text="Voucher Entry:", font=("Helvetica", 11, "bold")).grid(row=10, column=0, columnspan=4, pady=5)
-
-tk.Label(root, text="Voucher #:", font=label_font).grid(row=11, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
-entry_voucher_number = tk.Entry(root, font=label_font)
-entry_voucher_number.grid(row=11, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
-entry_voucher_number.bind("<KeyRelease>", on_voucher_number_change)
-
-# Beneficiary Row with Add Button
-tk.Label(root, text="Beneficiary:", font=label_font).grid(row=11, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
-ben_frame = tk.Frame(root)
-ben_frame.grid(row=11, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
-
-entry_voucher_beneficiary = AutocompleteCombobox(ben_frame, font=label_font)
-entry_voucher_beneficiary.set_completion_list(beneficiaries_list)
-entry_voucher_beneficiary.pack(side="left", fill="x", expand=True)
-
-btn_add_ben = tk.Button(ben_frame, text="+", width=3, command=open_add_beneficiary_window, bg="#ddd")
-btn_add_ben.pack(side="right", padx=(5, 0))
-
-tk.Label(root, text="Euro (€):", font=label_font).grid(row=12, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
-entry_voucher_euro = tk.Entry(root, font=label_font)
-entry_voucher_euro.grid(row=12, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
-entry_voucher_euro.insert(0, "0.00")
-
-tk.Label(root, text="Budget Head:", font=label_font).grid(row=12, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
-budget_head_var = tk.StringVar(value=DEFAULT_HEAD)
-budget_head_dropdown = AutocompleteCombobox(root, textvariable=budget_head_var, font=label_font)
-budget_head_dropdown.set_completion_list(list(budget_heads.keys()))
-budget_head_dropdown.grid(row=12, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
-
-tk.Label(root, text="Quarter:", font=label_font).grid(row=13, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
-entry_voucher_quarter = tk.Entry(root, font=label_font)
-entry_voucher_quarter.grid(row=13, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
-
-tk.Label(root, text="Year:", font=label_font).grid(row=13, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
-entry_voucher_year = tk.Entry(root, font=label_font)
-entry_voucher_year.grid(row=13, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
-
-btn_add_voucher = tk.Button(root, text="Add Voucher (To List)", command=add_voucher_to_list, font=button_font, bg="#6A5ACD", fg="white")
-btn_add_voucher.grid(row=14, column=0, columnspan=4, pady=10)
-
-vcols = ("Number", "Beneficiary", "Euro", "Quarter", "Year", "Budget Head")
-vouchers_tree = ttk.Treeview(root, columns=vcols, show="headings", height=4)
-for c in vcols:
-    vouchers_tree.heading(c, text=c)
-    vouchers_tree.column(c, width=100, anchor="w")
-vouchers_tree.grid(row=15, column=0, columnspan=4, padx=10, pady=5, sticky="nsew")
-
-btn_remove_voucher = tk.Button(root, text="Remove Selected", command=remove_selected_voucher, font=("Helvetica", 9), bg="#B22222", fg="white")
-btn_remove_voucher.grid(row=16, column=0, padx=10, pady=5, sticky="w")
-
-# SUBMIT BUTTONS
-button_frame = tk.Frame(root)
-button_frame.grid(row=17, column=0, columnspan=4, pady=20)
-
-# 1. Main Transaction
-submit_button = tk.Button(button_frame, text="SUBMIT TRANSACTION\n(Link Invoices & Vouchers)", command=submit_transaction, font=button_font, bg="#4CAF50", fg="white", width=25)
-submit_button.pack(side="left", padx=20)
-
-# 2. Separate Voucher Only
-btn_submit_voucher_only = tk.Button(button_frame, text="SUBMIT VOUCHER ONLY\n(No Invoices)", command=submit_voucher_only, font=button_font, bg="#FFA500", fg="white", width=20)
-btn_submit_voucher_only.pack(side="left", padx=20)
-
-
-ttk.Separator(root, orient='horizontal').grid(row=18, column=0, columnspan=4, sticky="ew", padx=10)
-batch_insert_button = tk.Button(root, text="Batch Insert CSV", command=batch_insert, font=("Helvetica", 10), bg="#2196F3", fg="white")
-batch_insert_button.grid(row=19, column=0, columnspan=4, pady=10)
-
-status_label = tk.Label(root, text="", font=label_font, fg="red")
-status_label.grid(row=20, column=0, columnspan=4, sticky="w", padx=10)
-
-root.grid_rowconfigure(7, weight=1)
-root.grid_rowconfigure(15, weight=1)
-
-root.mainloop()
\ No newline at end of file
+def main(master=None):
+    """Build the entry form; as a Toplevel of master when hosted by the launcher."""
+    global root, reference_refresh, office_var, supplier_var, supplier_dropdown, \
+        invoice_number_entry, invoice_date_entry, invoice_amount_entry, invoice_vat_entry, \
+        invoice_vat_var, vat_0_var, vat_10_var, vat_21_var, status_var, vat_refundable_var, \
+        recurring_var, invoices_tree, entry_voucher_number, entry_voucher_beneficiary, \
+        entry_voucher_euro, entry_voucher_quarter, entry_voucher_year, budget_head_var, \
+        budget_head_dropdown, vouchers_tree, status_label, write_buttons
+    invoices_list.clear()
+    vouchers_list.clear()
+
+    # Tables come from the local snapshot when there is one; stale ones are refreshed in the background
+    try:
+        reference, reference_refresh = refdata.load(REFERENCE_TABLES)
+    except Error:
+        reference, reference_refresh = {name: [] for name in REFERENCE_TABLES}, None
+    load_reference_data(reference)
+
+    root = tk.Toplevel(master) if master else tk.Tk()
+    root.title("Invoice Entry Form")
+    root.geometry("900x750")
+
+    label_font = ("Helvetica", 10)
+    button_font = ("Helvetica", 10, "bold")
+    root.columnconfigure(1, weight=1)
+    root.columnconfigure(3, weight=1)
+
+    PAD_X = 5
+    PAD_Y = 2
+
+    tk.Label(root, text="Office:", font=label_font).grid(row=0, column=0, padx=PAD_X, pady=10, sticky="e")
+    office_frame = tk.Frame(root)
+    office_frame.grid(row=0, column=1, columnspan=3, sticky="w", padx=PAD_X, pady=5)
+    office_var = tk.StringVar(value=DEFAULT_OFFICE)
+    tk.Radiobutton(office_frame, text="Chancery", variable=office_var, value="Chancery", font=label_font).pack(side="left", padx=10)
+    tk.Radiobutton(office_frame, text="Residence", variable=office_var, value="Residence", font=label_font).pack(side="left", padx=10)
+
+    # Invoice Details
+    tk.Label(root, text="Supplier:", font=label_font).grid(row=1, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
+
+    # Supplier Row with Add Button
+    supplier_var = tk.StringVar()
+    supp_frame = tk.Frame(root)
+    supp_frame.grid(row=1, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
+
+    supplier_dropdown = AutocompleteCombobox(supp_frame, textvariable=supplier_var, font=label_font)
+    supplier_dropdown.set_completion_list(suppliers.names)
+    supplier_dropdown.pack(side="left", fill="x", expand=True)
+    supplier_var.trace_add("write", auto_suggest_beneficiary)
+
+    btn_add_supp = tk.Button(supp_frame, text="+", width=3, command=open_add_supplier_window, bg="#ddd")
+    btn_add_supp.pack(side="right", padx=(5, 0))
+
+    tk.Label(root, text="Invoice Number:", font=label_font).grid(row=1, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
+    invoice_number_entry = tk.Entry(root, font=label_font)
+    invoice_number_entry.grid(row=1, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
+
+    tk.Label(root, text="Date (YYYY-MM-DD):", font=label_font).grid(row=2, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
+    invoice_date_entry = tk.Entry(root, font=label_font)
+    invoice_date_entry.grid(row=2, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
+    invoice_date_entry.insert(0, date.today().strftime('%Y-%m-%d'))
+
+    tk.Label(root, text="Amount (€):", font=label_font).grid(row=2, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
+    invoice_amount_var = tk.StringVar()
+    invoice_amount_entry = tk.Entry(root, textvariable=invoice_amount_var, font=label_font)
+    invoice_amount_entry.grid(row=2, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
+    invoice_amount_var.trace_add('write', on_invoice_amount_change)
+
+    # VAT
+    vat_frame = tk.Frame(root)
+    vat_frame.grid(row=3, column=0, columnspan=4, pady=5)
+    vat_0_var = tk.IntVar()
+    tk.Checkbutton(vat_frame, text="VAT 0%", variable=vat_0_var, font=label_font, 
+                   command=lambda: on_vat_checkbox_change(0)).pack(side="left", padx=10)
+    vat_10_var = tk.IntVar()
+    tk.Checkbutton(vat_frame, text="VAT 10%", variable=vat_10_var, font=label_font, 
+                   command=lambda: on_vat_checkbox_change(10)).pack(side="left", padx=10)
+    vat_21_var = tk.IntVar()
+    tk.Checkbutton(vat_frame, text="VAT 21%", variable=vat_21_var, font=label_font, 
+                   command=lambda: on_vat_checkbox_change(21)).pack(side="left", padx=10)
+
+    tk.Label(root, text="VAT (€):", font=label_font).grid(row=4, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
+    invoice_vat_var = tk.StringVar()
+    invoice_vat_entry = tk.Entry(root, textvariable=invoice_vat_var, font=label_font)
+    invoice_vat_entry.grid(row=4, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
+
+    tk.Label(root, text="Status:", font=label_font).grid(row=4, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
+    status_var = tk.StringVar(value=DEFAULT_STATUS)
+    status_dropdown = ttk.Combobox(root, textvariable=status_var, font=label_font, state="readonly", values=["Pending", "Processed", "Archived"])
+    status_dropdown.grid(row=4, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
+
+    flags_frame = tk.Frame(root)
+    flags_frame.grid(row=5, column=1, columnspan=3, sticky="w", pady=PAD_Y)
+    vat_refundable_var = tk.IntVar(value=1)
+    tk.Checkbutton(flags_frame, text="Refundable", variable=vat_refundable_var, font=label_font).pack(side="left", padx=5)
+    recurring_var = tk.IntVar(value=1)
+    tk.Checkbutton(flags_frame, text="Recurring", variable=recurring_var, font=label_font).pack(side="left", padx=20)
+
+    btn_add_invoice = tk.Button(root, text="Add Invoice", command=add_invoice_to_list, font=button_font, bg="#6A5ACD", fg="white")
+    btn_add_invoice.grid(row=6, column=0, columnspan=4, pady=10)
+
+    cols = ("Supplier", "Invoice Number", "Date", "Amount (€)", "VAT (€)", "Refundable", "Recurring", "Status")
+    invoices_tree = ttk.Treeview(root, columns=cols, show="headings", height=5)
+    for c in cols:
+        invoices_tree.heading(c, text=c)
+        invoices_tree.column(c, width=90, anchor="w")
+    invoices_tree.grid(row=7, column=0, columnspan=4, padx=10, pady=5, sticky="nsew")
+
+    btn_remove_invoice = tk.Button(root, text="Remove Selected", command=remove_selected_invoice, font=("Helvetica", 9), bg="#B22222", fg="white")
+    btn_remove_invoice.grid(row=8, column=0, padx=10, pady=5, sticky="w")
+
+    # Vouchers
+    ttk.Separator(root, orient='horizontal').grid(row=9, column=0, columnspan=4, sticky="ew", padx=10, pady=10)
+    tk.Label(root, text="Voucher Entry:", font=("Helvetica", 11, "bold")).grid(row=10, column=0, columnspan=4, pady=5)
+
+    tk.Label(root, text="Voucher #:", font=label_font).grid(row=11, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
+    entry_voucher_number = tk.Entry(root, font=label_font)
+    entry_voucher_number.grid(row=11, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
+    entry_voucher_number.bind("<KeyRelease>", on_voucher_number_change)
+
+    # Beneficiary Row with Add Button
+    tk.Label(root, text="Beneficiary:", font=label_font).grid(row=11, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
+    ben_frame = tk.Frame(root)
+    ben_frame.grid(row=11, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
+
+    entry_voucher_beneficiary = AutocompleteCombobox(ben_frame, font=label_font)
+    entry_voucher_beneficiary.set_completion_list(beneficiaries_list)
+    entry_voucher_beneficiary.pack(side="left", fill="x", expand=True)
+
+    btn_add_ben = tk.Button(ben_frame, text="+", width=3, command=open_add_beneficiary_window, bg="#ddd")
+    btn_add_ben.pack(side="right", padx=(5, 0))
+
+    tk.Label(root, text="Euro (€):", font=label_font).grid(row=12, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
+    entry_voucher_euro = tk.Entry(root, font=label_font)
+    entry_voucher_euro.grid(row=12, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
+    entry_voucher_euro.insert(0, "0.00")
+
+    tk.Label(root, text="Budget Head:", font=label_font).grid(row=12, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
+    budget_head_var = tk.StringVar(value=DEFAULT_HEAD)
+    budget_head_dropdown = AutocompleteCombobox(root, textvariable=budget_head_var, font=label_font)
+    budget_head_dropdown.set_completion_list(list(budget_heads.keys()))
+    budget_head_dropdown.grid(row=12, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
+
+    tk.Label(root, text="Quarter:", font=label_font).grid(row=13, column=0, padx=PAD_X, pady=PAD_Y, sticky="e")
+    entry_voucher_quarter = tk.Entry(root, font=label_font)
+    entry_voucher_quarter.grid(row=13, column=1, padx=PAD_X, pady=PAD_Y, sticky="ew")
+
+    tk.Label(root, text="Year:", font=label_font).grid(row=13, column=2, padx=PAD_X, pady=PAD_Y, sticky="e")
+    entry_voucher_year = tk.Entry(root, font=label_font)
+    entry_voucher_year.grid(row=13, column=3, padx=PAD_X, pady=PAD_Y, sticky="ew")
+
+    btn_add_voucher = tk.Button(root, text="Add Voucher (To List)", command=add_voucher_to_list, font=button_font, bg="#6A5ACD", fg="white")
+    btn_add_voucher.grid(row=14, column=0, columnspan=4, pady=10)
+
+    vcols = ("Number", "Beneficiary", "Euro", "Quarter", "Year", "Budget Head")
+    vouchers_tree = ttk.Treeview(root, columns=vcols, show="headings", height=4)
+    for c in vcols:
+        vouchers_tree.heading(c, text=c)
+        vouchers_tree.column(c, width=100, anchor="w")
+    vouchers_tree.grid(row=15, column=0, columnspan=4, padx=10, pady=5, sticky="nsew")
+
+    btn_remove_voucher = tk.Button(root, text="Remove Selected", command=remove_selected_voucher, font=("Helvetica", 9), bg="#B22222", fg="white")
+    btn_remove_voucher.grid(row=16, column=0, padx=10, pady=5, sticky="w")
+
+    # SUBMIT BUTTONS
+    button_frame = tk.Frame(root)
+    button_frame.grid(row=17, column=0, columnspan=4, pady=20)
+
+    # 1. Main Transaction
+    submit_button = tk.Button(button_frame, text="SUBMIT TRANSACTION\n(Link Invoices & Vouchers)", command=submit_transaction, font=button_font, bg="#4CAF50", fg="white", width=25)
+    submit_button.pack(side="left", padx=20)
+
+    # 2. Separate Voucher Only
+    btn_submit_voucher_only = tk.Button(button_frame, text="SUBMIT VOUCHER ONLY\n(No Invoices)", command=submit_voucher_only, font=button_font, bg="#FFA500", fg="white", width=20)
+    btn_submit_voucher_only.pack(side="left", padx=20)
+
+
+    ttk.Separator(root, orient='horizontal').grid(row=18, column=0, columnspan=4, sticky="ew", padx=10)
+    batch_insert_button = tk.Button(root, text="Batch Insert CSV", command=batch_insert, font=("Helvetica", 10), bg="#2196F3", fg="white")
+    batch_insert_button.grid(row=19, column=0, columnspan=4, pady=10)
+    # Disabled while a write runs in the background (see background.py)
+    write_buttons = [submit_button, btn_submit_voucher_only, batch_insert_button]
+
+    status_label = tk.Label(root, text="", font=label_font, fg="red")
+    status_label.grid(row=20, column=0, columnspan=4, sticky="w", padx=10)
+
+    root.grid_rowconfigure(7, weight=1)
+    root.grid_rowconfigure(15, weight=1)
+
+    root.after(REFRESH_POLL_MS, apply_reference_refresh)
+    if master is None:
+        root.mainloop()
+    return root
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Invoice -> voucher link summary (table Invoice_Voucher_Links, db/init/003).
+
+One row per linked invoice with its voucher numbers (ordered, comma
+separated) and head of accounts, so the voucher report reads it by key
+instead of joining and grouping the link tables on every run. It is kept
+current three ways:
+
+  - submit_transaction() calls refresh_invoices() for the invoices it links,
+    inside the same transaction; it also records the fingerprint of the links
+    it added as a row of Invoice_Voucher_Links_Delta;
+  - sync() compares a per-quarter fingerprint of the link tables with the
+    one stored at the last rebuild combined with the deltas recorded since,
+    and rebuilds only the quarters that moved (the voucher report syncs its
+    own quarter before reading). A quarter whose summary was current before
+    a submit is still current after it, so submits cause no rebuild;
+  - check() compares the whole table against a fresh join.
+
+Usage:
+  python link_summary.py            # sync every quarter
+  python link_summary.py --rebuild  # rebuild from scratch
+  python link_summary.py --check    # list differences, exit 1 if any
+"""
+
+import sys
+import argparse
+from mysql.connector import Error
+from db import db_cursor, snapshot_cursor, in_placeholders
+import schema
+
+# office -> (invoice table, invoice<->voucher link table), in report order
+OFFICES = {
+    "Chancery": ("Invoices_Chancery", "Vouchers_Chancery"),
+    "Residence": ("Invoices_Residence", "Vouchers_Residence"),
+}
+
+# ==========================================================
+# Queries
+# ==========================================================
+# {head_name} is filled in from schema.py (Head_of_Accounts_Name or Name);
+# {where} narrows to one quarter or a list of invoices.
+_LINKED = """
+    FROM {invoices} i
+    JOIN {links} l                ON l.Invoice_ID = i.ID
+    JOIN Vouchers v               ON v.Voucher_ID = l.Voucher_ID
+    LEFT JOIN Head_of_Accounts ha ON ha.Head_of_Accounts_ID = v.Head_of_Accounts_ID
+    WHERE i.Year IS NOT NULL AND {where}
+"""
+
+# Summary rows as they should be; takes the office name first
+SUMMARY_SELECT = """
+    SELECT %s, i.ID, i.Year, i.Quarter,
+    GROUP_CONCAT(DISTINCT v.Voucher_Number ORDER BY v.Voucher_Number SEPARATOR ', '),
+    MAX({head_name})
+""" + _LINKED + """
+    GROUP BY i.ID, i.Year, i.Quarter
+"""
+
+# REPLACE: an invoice whose date moved quarter may still sit under the old one
+SUMMARY_INSERT = """
+    REPLACE INTO Invoice_Voucher_Links
+    (Office, Invoice_ID, Year, Quarter, Voucher_Numbers, Head_of_Accounts)
+""" + SUMMARY_SELECT
+
+# (count, checksum) of the link rows per quarter
+FINGERPRINT_QUERY = """
+    SELECT i.Year, i.Quarter, COUNT(*),
+    BIT_XOR(CRC32(CONCAT_WS('|', i.ID, v.Voucher_ID, v.Voucher_Number, {head_name})))
+""" + _LINKED + """
+    GROUP BY i.Year, i.Quarter
+"""
+
+PERIOD_WHERE = "i.Year = %s AND i.Quarter = %s"
+
+
+def statement(cur, template, office, where):
+    """template filled in for office, with the head-of-accounts column looked up via schema.py."""
+    invoices, links = OFFICES[office]
+    column = schema.pick_column(cur, "Head_of_Accounts", "Head_of_Accounts_Name", "Name")
+    head_name = f"ha.`{column}`" if column else "NULL"
+    return template.format(invoices=invoices, links=links, head_name=head_name, where=where)
+
+
+def _execute(cur, template, office, where, params):
+    schema.run_with_columns(
+        cur, ["Head_of_Accounts"], lambda: cur.execute(statement(cur, template, office, where), params)
+    )
+
+
+# ==========================================================
+# Maintenance
+# ==========================================================
+def refresh_invoices(cur, office, invoice_ids, new=False):
+    """
+    Recompute the summary rows of invoice_ids; runs in the caller's transaction.
+    new: the invoices were inserted in this transaction, so there are no old
+    rows to delete (and no gap locks taken that would block other writers),
+    and every link row of theirs is new: their fingerprint is recorded as a
+    delta, so sync() does not rebuild the quarter for them. Without new the
+    stored fingerprint is left alone and the next sync() rebuilds the quarter.
+    """
+    ids = list(invoice_ids)
+    if not ids:
+        return
+    marks = in_placeholders(ids)
+    if not new:
+        cur.execute(f"DELETE FROM Invoice_Voucher_Links WHERE Office = %s AND Invoice_ID IN ({marks})", [office] + ids)
+    _execute(cur, SUMMARY_INSERT, office, f"i.ID IN ({marks})", [office] + ids)
+    if new:
+        _execute(cur, FINGERPRINT_QUERY, office, f"i.ID IN ({marks})", ids)
+        deltas = [(office, year, quarter, int(n), int(x)) for year, quarter, n, x in cur.fetchall()]
+        if deltas:
+            # Plain INSERTs of new rows: concurrent submits never wait on each other here
+            cur.executemany(
+                "INSERT INTO Invoice_Voucher_Links_Delta (Office, Year, Quarter, Link_Count, Link_Checksum) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                deltas,
+            )
+
+
+def fingerprints(cur, office, period=None):
+    """{(year, quarter): (link count, checksum)} from the link tables, for one period or all."""
+    where, params = (PERIOD_WHERE, tuple(period)) if period else ("1 = 1", ())
+    _execute(cur, FINGERPRINT_QUERY, office, where, params)
+    return {(year, quarter): (int(n), int(x)) for year, quarter, n, x in cur.fetchall()}
+
+
+STORED_QUERY = """
+    SELECT Year, Quarter, SUM(n), BIT_XOR(x), MAX(d) FROM (
+        SELECT Year, Quarter, Link_Count AS n, Link_Checksum AS x, 0 AS d
+        FROM Invoice_Voucher_Links_State WHERE Office = %s {where}
+        UNION ALL
+        SELECT Year, Quarter, Link_Count, Link_Checksum, Delta_ID
+        FROM Invoice_Voucher_Links_Delta WHERE Office = %s {where}
+    ) t
+    GROUP BY Year, Quarter
+"""
+
+
+def _stored(cur, office, period=None):
+    """
+    {(year, quarter): ((link count, checksum), last delta ID)}: the state
+    stored at the last rebuild combined with the deltas recorded since.
+    """
+    where, params = ("AND Year = %s AND Quarter = %s", [office] + list(period)) if period else ("", [office])
+    cur.execute(STORED_QUERY.format(where=where), params * 2)
+    return {(year, quarter): ((int(n), int(x)), int(d)) for year, quarter, n, x, d in cur.fetchall()}
+
+
+def _rebuild_quarter(cur, office, period, fp, last_delta=0):
+    """Rebuild one quarter's summary and store fp; the deltas up to last_delta are folded into it."""
+    cur.execute(
+        "DELETE FROM Invoice_Voucher_Links WHERE Office = %s AND Year = %s AND Quarter = %s",
+        (office,) + tuple(period),
+    )
+    if last_delta:
+        cur.execute(
+            "DELETE FROM Invoice_Voucher_Links_Delta "
+            "WHERE Office = %s AND Year = %s AND Quarter = %s AND Delta_ID <= %s",
+            (office,) + tuple(period) + (last_delta,),
+        )
+    if fp is None:  # no links left in this quarter
+        cur.execute(
+            "DELETE FROM Invoice_Voucher_Links_State WHERE Office = %s AND Year = %s AND Quarter = %s",
+            (office,) + tuple(period),
+        )
+        return
+    _execute(cur, SUMMARY_INSERT, office, PERIOD_WHERE, (office,) + tuple(period))
+    cur.execute(
+        "REPLACE INTO Invoice_Voucher_Links_State (Office, Year, Quarter, Link_Count, Link_Checksum) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        (office,) + tuple(period) + fp,
+    )
+
+
+def sync(cur, period=None):
+    """
+    Rebuild the quarters (just period, when given) whose link fingerprint
+    differs from the one stored at their last rebuild. Returns the rebuilt
+    (office, year, quarter) list; the caller commits.
+    """
+    rebuilt = []
+    for office in OFFICES:
+        fresh = fingerprints(cur, office, period)
+        stored = _stored(cur, office, period)
+        for key in sorted(fresh.keys() | stored.keys()):
+            fp, last_delta = stored.get(key, (None, 0))
+            if fresh.get(key) != fp:
+                _rebuild_quarter(cur, office, key, fresh.get(key), last_delta)
+                rebuilt.append((office,) + key)
+    return rebuilt
+
+
+def rebuild(cur):
+    """Empty the summary and rebuild every quarter; the caller commits."""
+    cur.execute("DELETE FROM Invoice_Voucher_Links")
+    cur.execute("DELETE FROM Invoice_Voucher_Links_State")
+    cur.execute("DELETE FROM Invoice_Voucher_Links_Delta")
+    return sync(cur)
+
+
+# ==========================================================
+# Consistency check
+# ==========================================================
+def check(cur):
+    """
+    Compare the summary with a fresh join of the link tables. Returns
+    [(office, invoice_id, expected, stored)], each side (year, quarter,
+    voucher numbers, head of accounts) or None.
+    """
+    differences = []
+    for office in OFFICES:
+        _execute(cur, SUMMARY_SELECT, office, "1 = 1", (office,))
+        expected = {row[1]: tuple(row[2:]) for row in cur.fetchall()}
+        cur.execute(
+            "SELECT Invoice_ID, Year, Quarter, Voucher_Numbers, Head_of_Accounts "
+            "FROM Invoice_Voucher_Links WHERE Office = %s",
+            (office,),
+        )
+        stored = {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+        for invoice_id in sorted(expected.keys() | stored.keys()):
+            if expected.get(invoice_id) != stored.get(invoice_id):
+                differences.append((office, invoice_id, expected.get(invoice_id), stored.get(invoice_id)))
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the Invoice_Voucher_Links summary table.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rebuild", action="store_true", help="rebuild every quarter from scratch")
+    mode.add_argument("--check", action="store_true", help="compare with a fresh join; exit 1 on differences")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.check:
+            with snapshot_cursor() as cur:  # both sides from the same committed state
+                differences = check(cur)
+            for office, invoice_id, expected, stored in differences[:50]:
+                print(f"{office} invoice {invoice_id}: expected {expected}, stored {stored}")
+            print(f"{len(differences)} difference(s).")
+            return 1 if differences else 0
+
+        with db_cursor(commit=True) as cur:
+            rebuilt = rebuild(cur) if args.rebuild else sync(cur)
+        print(f"Rebuilt {len(rebuilt)} quarter(s).")
+        return 0
+    except Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Schema migrations for databases created before a db/init file existed.
+
+The MySQL image runs db/init/*.sql only when its volume is first created, so
+an installation that was set up earlier never gets the later files. Each
+step below compares information_schema with what the files define and
+applies only what is missing, so running it again changes nothing. Schema
+changes are only ever made by running it by hand:
+
+  python app/migrate.py           # apply what is missing
+  python app/migrate.py --check   # list what is missing, exit 1 if anything
+
+The launcher and the headless CLI call startup(), which only checks and
+warns when something is missing.
+
+The database account needs ALTER and CREATE on the schema (the MYSQL_USER
+of docker-compose.yml has both).
+"""
+
+import os
+import re
+import sys
+import glob
+import argparse
+from mysql.connector import Error
+from db import db_cursor
+import schema
+
+INIT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "db", "init")
+
+
+def init_statements(pattern="*.sql"):
+    """Statements of the db/init files matching pattern, in order, without the CREATE DATABASE / USE lines."""
+    statements = []
+    for path in sorted(glob.glob(os.path.join(INIT_DIR, pattern))):
+        with open(path, encoding="utf-8") as f:
+            lines = [
+                line for line in f
+                if not line.lstrip().startswith("--")
+                and not re.match(r"\s*(CREATE DATABASE|USE)\b", line, re.IGNORECASE)
+            ]
+        statements += [s.strip() for s in "".join(lines).split(";") if s.strip()]
+    return statements
+
+
+def _create_table(pattern, table):
+    """The CREATE TABLE IF NOT EXISTS statement for table from the db/init files matching pattern."""
+    for statement in init_statements(pattern):
+        if re.match(rf"CREATE TABLE IF NOT EXISTS {table}\b", statement, re.IGNORECASE):
+            return statement
+    raise LookupError(f"{table} is not defined in db/init/{pattern}")
+
+
+# ==========================================================
+# information_schema
+# ==========================================================
+def table_exists(cur, table):
+    cur.execute(
+        "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,),
+    )
+    return cur.fetchone()[0] > 0
+
+
+def index_names(cur, table):
+    """Lower-case index names of table."""
+    cur.execute(
+        "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,),
+    )
+    return {row[0].lower() for row in cur.fetchall()}
+
+
+# ==========================================================
+# Steps: each returns (statements to run, problems it cannot fix)
+# ==========================================================
+# 002_report_indexes.sql: (table, index replaced, index, its columns)
+REPORT_INDEXES = [
+    ("Invoices_Chancery", "IDX_IC_Vat_Year_Quarter", "IDX_IC_Year_Quarter_Refundable", "Year, Quarter, Refundable"),
+    ("Invoices_Residence", "IDX_IR_Vat_Year_Quarter", "IDX_IR_Year_Quarter_Refundable", "Year, Quarter, Refundable"),
+    ("Vouchers_Chancery", None, "IDX_VC_Voucher_Invoice", "Voucher_ID, Invoice_ID"),
+    ("Vouchers_Residence", None, "IDX_VR_Voucher_Invoice", "Voucher_ID, Invoice_ID"),
+]
+
+
+def report_indexes(cur):
+    """002_report_indexes.sql: the link tables, and the indexes explain_check.py expects."""
+    statements = []
+    for table, old, new, columns in REPORT_INDEXES:
+        if not table_exists(cur, table):
+            statements.append(_create_table("002_*.sql", table))  # comes with its indexes
+            continue
+        indexes = index_names(cur, table)
+        changes = []
+        if old and old.lower() in indexes:
+            changes.append(f"DROP INDEX {old}")
+        if new.lower() not in indexes:
+            changes.append(f"ADD KEY {new} ({columns})")
+        if changes:
+            statements.append(f"ALTER TABLE {table} " + ", ".join(changes))
+    return statements, []
+
+
+# 003_invoice_voucher_links.sql: the summary and its fingerprints
+LINK_SUMMARY_TABLES = [
+    "Invoice_Voucher_Links",
+    "Invoice_Voucher_Links_State",
+    "Invoice_Voucher_Links_Delta",
+]
+
+
+def link_summary_tables(cur):
+    """
+    003_invoice_voucher_links.sql: the tables submits and the voucher report
+    write to. They start empty; link_summary.sync() fills each quarter the
+    first time the report reads it.
+    """
+    return [_create_table("003_*.sql", t) for t in LINK_SUMMARY_TABLES if not table_exists(cur, t)], []
+
+
+def personal_invoice_number_key(cur):
+    """
+    Invoices_Personal is not created by db/init, so its UNIQUE key on Number
+    (which invoice_pers.write_invoice relies on, see duplicates.py) may be
+    missing. It is added only when no number occurs twice: duplicates are
+    listed for someone to resolve, never deleted here.
+    """
+    if not table_exists(cur, "Invoices_Personal") or schema.has_unique_key(cur, "Invoices_Personal", "Number"):
+        return [], []
+    cur.execute(
+        "SELECT Number, COUNT(*) FROM Invoices_Personal GROUP BY Number HAVING COUNT(*) > 1 ORDER BY Number"
+    )
+    repeated = cur.fetchall()
+    if repeated:
+        listed = ", ".join(f"{number} ({n}x)" for number, n in repeated[:20])
+        more = f" and {len(repeated) - 20} more" if len(repeated) > 20 else ""
+        return [], [
+            f"Invoices_Personal has repeated invoice numbers: {listed}{more}. "
+            "Resolve them to add the UNIQUE key Invoice_Personal_No (Number)."
+        ]
+    return ["ALTER TABLE Invoices_Personal ADD UNIQUE KEY Invoice_Personal_No (Number)"], []
+
+
+STEPS = [
+    report_indexes,
+    link_summary_tables,
+    personal_invoice_number_key,
+]
+
+
+def migrate(apply=True):
+    """
+    Run every step; returns (statements, problems). With apply=False nothing
+    is changed and statements lists what would run. Errors propagate.
+    """
+    done, problems = [], []
+    with db_cursor(commit=True) as cur:
+        for step in STEPS:
+            statements, found = step(cur)
+            for statement in statements:
+                if apply:
+                    cur.execute(statement)
+                done.append(statement)
+            problems += found
+    return done, problems
+
+
+def startup():
+    """
+    The launcher's and the CLI's check: nothing is changed. Returns the
+    warnings (also printed to stderr), [] when the schema is up to date or
+    the check could not run.
+    """
+    try:
+        missing, problems = migrate(apply=False)
+    except (Error, OSError, LookupError) as e:
+        print(f"[migrate] schema check skipped: {e}", file=sys.stderr, flush=True)
+        return []
+    warnings = [f"missing: {' '.join(statement.split())[:120]}" for statement in missing]
+    warnings += [f"needs attention: {problem}" for problem in problems]
+    if warnings:
+        warnings.append("The database is behind db/init; run 'python app/migrate.py' (see README).")
+    for warning in warnings:
+        print(f"[migrate] {warning}", file=sys.stderr, flush=True)
+    return warnings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bring an existing database up to the db/init schema.")
+    parser.add_argument("--check", action="store_true", help="only list what is missing; exit 1 if anything is")
+    args = parser.parse_args(argv)
+
+    try:
+        done, problems = migrate(apply=not args.check)
+    except Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        return 1
+    for statement in done:
+        print(("missing: " if args.check else "applied: ") + " ".join(statement.split()))
+    for problem in problems:
+        print(f"needs attention: {problem}")
+    if not done and not problems:
+        print("Schema is up to date.")
+    return 1 if problems or (args.check and done) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,62 +1,47 @@
 #!/usr/bin/env python3
 import tkinter as tk
 from tkinter import messagebox
-from contextlib import contextmanager
 from mysql.connector import Error
-# Ensure db.py exists, or replace this import with the connection function
-from db import get_cnx 
-
-# ==========================================================
-# Context manager (Fixed for UnboundLocalError)
-# ==========================================================
-@contextmanager
-def db_cursor(commit=False):
-    cnx = get_cnx()
-    cur = None
-    try:
-        cur = cnx.cursor()
-        yield cur
-        if commit:
-            cnx.commit()
-    except Exception as e:
-        cnx.rollback()
-        raise e
-    finally:
-        if cur:
-            cur.close()
-        # Be careful closing cnx here if get_cnx() returns a pooled connection.
-        # If it's a fresh connection every time, this is fine.
-        cnx.close()
+from db import db_cursor  # shared pooled connection
+import duplicates
+import background
 
 # ==========================================================
 # Function to add supplier
 # ==========================================================
-def add_supplier(nif_code, supplier_name):
-    success = False
-    new_id = 0
-    
-    try:
-        with db_cursor(commit=True) as cur:
-            insert_query = """
-            INSERT INTO administration.NIF_Codes (Supplier_NIF_Code, Supplier_Name)
-            VALUES (%s, %s)
-            """
-            cur.execute(insert_query, (nif_code, supplier_name))
-            
-            # Use lastrowid only if you have an AUTO_INCREMENT column. 
-            # If NIF is the key, this might return 0.
-            new_id = cur.lastrowid 
-            success = True
-            
-    except Error as e:
-        messagebox.showerror("Database Error", f"Error: {e}")
-    except Exception as e:
-        messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+def insert_supplier(nif_code, supplier_name):
+    """Insert the supplier; returns the new ID (0 when the table has no AUTO_INCREMENT). Errors propagate."""
+    with db_cursor(commit=True) as cur:
+        insert_query = """
+        INSERT INTO administration.NIF_Codes (Supplier_NIF_Code, Supplier_Name)
+        VALUES (%s, %s)
+        """
+        cur.execute(insert_query, (nif_code, supplier_name))
 
-    # Show success message OUTSIDE the database transaction
-    if success:
+        # Use lastrowid only if you have an AUTO_INCREMENT column. 
+        # If NIF is the key, this might return 0.
+        return cur.lastrowid
+
+def add_supplier(nif_code, supplier_name):
+    """Insert in the background; the messages are shown once the transaction is over."""
+    def added(new_id):
         id_display = new_id if new_id != 0 else nif_code
         messagebox.showinfo("Success", f"Supplier added successfully.\nID/NIF: {id_display}")
+        entry_nif.delete(0, tk.END)
+        entry_name.delete(0, tk.END)
+
+    def failed(e):
+        dup = duplicates.duplicate(e)
+        if dup:
+            # The UNIQUE keys on name and NIF decide; no SELECT beforehand
+            messagebox.showerror(f"Duplicate {dup.what}", duplicates.message(dup))
+        elif isinstance(e, Error):
+            messagebox.showerror("Database Error", f"Error: {e}")
+        else:
+            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+
+    background.start(submit_button, lambda task: insert_supplier(nif_code, supplier_name),
+                     on_done=added, on_error=failed, busy=[submit_button])
 
 # ==========================================================
 # Function to handle button click event
@@ -67,16 +52,15 @@ def submit():
 
     if nif_code and supplier_name:
         add_supplier(nif_code, supplier_name)
-        entry_nif.delete(0, tk.END)
-        entry_name.delete(0, tk.END)
     else:
         messagebox.showwarning("Input Error", "Please fill all fields.")
 
 # ==========================================================
 # Main GUI
 # ==========================================================
-if __name__ == "__main__":
-    root = tk.Tk()
+def main(master=None):
+    global entry_nif, entry_name, submit_button
+    root = tk.Toplevel(master) if master else tk.Tk()
     root.title("Add Supplier")
 
     tk.Label(root, text="Supplier NIF Code:").grid(row=0, column=0, padx=10, pady=5, sticky="e")
@@ -90,4 +74,9 @@ if __name__ == "__main__":
     submit_button = tk.Button(root, text="Add Supplier", command=submit)
     submit_button.grid(row=2, column=0, columnspan=2, pady=10)
 
-    root.mainloop()
\ No newline at end of file
+    if master is None:
+        root.mainloop()
+    return root
+
+if __name__ == "__main__":
+    main()
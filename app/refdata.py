@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Reference-data loader shared by the entry screens.
+
+Every lookup table is described by a data query and a cheap change-token
+query (row count, max ID, CRC checksum). load() answers from the on-disk
+snapshot when one exists and re-validates it in the background. All the
+queries for one load go to the server as a single multi-statement batch:
+every change token plus the data of the tables that are not cached yet in
+one round trip, and a second one only for tables that turned out stale.
+
+load_lookups() hands out the (id, name) tables as Lookup tuples of
+read-only maps, built once per snapshot entry and shared by every screen in
+the process; a changed table gets a new Lookup, existing ones never change.
+
+Cache dir:
+  $VAT_REFUNDER_CACHE_DIR, else $XDG_CACHE_HOME/vat_refunder, else ~/.cache/vat_refunder
+"""
+
+import os
+import json
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import MappingProxyType
+from db import db_cursor
+
+# ==========================================================
+# Datasets: name -> (data query, change-token query)
+# ==========================================================
+DATASETS = {
+    "suppliers": (
+        "SELECT Supplier_ID, Supplier_Name FROM NIF_Codes",
+        "SELECT COUNT(*), COALESCE(MAX(Supplier_ID), 0), "
+        "COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Supplier_ID, Supplier_Name))), 0) FROM NIF_Codes",
+    ),
+    "budget_heads": (
+        "SELECT Head_of_Accounts_ID, Head_of_Accounts_Name FROM Head_of_Accounts",
+        "SELECT COUNT(*), COALESCE(MAX(Head_of_Accounts_ID), 0), "
+        "COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Head_of_Accounts_ID, Head_of_Accounts_Name))), 0) "
+        "FROM Head_of_Accounts",
+    ),
+    "beneficiaries": (
+        "SELECT DISTINCT Voucher_Beneficiary FROM Vouchers "
+        "WHERE Voucher_Beneficiary IS NOT NULL AND Voucher_Beneficiary != ''",
+        "SELECT COUNT(*), COALESCE(MAX(Voucher_ID), 0), "
+        "COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Voucher_ID, Voucher_Beneficiary))), 0) FROM Vouchers",
+    ),
+    "beneficiary_history": (
+        """
+        SELECT n.Supplier_Name, v.Voucher_Beneficiary, COUNT(*)
+        FROM Vouchers v
+        JOIN Vouchers_Chancery l ON l.Voucher_ID = v.Voucher_ID
+        JOIN Invoices_Chancery i ON i.ID = l.Invoice_ID
+        JOIN NIF_Codes n         ON n.Supplier_ID = i.Supplier_ID
+        WHERE v.Voucher_Beneficiary IS NOT NULL AND v.Voucher_Beneficiary != ''
+        GROUP BY n.Supplier_Name, v.Voucher_Beneficiary
+        UNION ALL
+        SELECT n.Supplier_Name, v.Voucher_Beneficiary, COUNT(*)
+        FROM Vouchers v
+        JOIN Vouchers_Residence l ON l.Voucher_ID = v.Voucher_ID
+        JOIN Invoices_Residence i ON i.ID = l.Invoice_ID
+        JOIN NIF_Codes n          ON n.Supplier_ID = i.Supplier_ID
+        WHERE v.Voucher_Beneficiary IS NOT NULL AND v.Voucher_Beneficiary != ''
+        GROUP BY n.Supplier_Name, v.Voucher_Beneficiary
+        """,
+        "SELECT (SELECT COUNT(*) FROM Vouchers_Chancery), (SELECT COUNT(*) FROM Vouchers_Residence), "
+        "(SELECT COALESCE(MAX(Voucher_ID), 0) FROM Vouchers), "
+        "(SELECT COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Voucher_ID, Voucher_Beneficiary))), 0) FROM Vouchers)",
+    ),
+    "colleagues": (
+        "SELECT Colleague_ID, Colleague_Name FROM Colleagues WHERE rank_id BETWEEN 1 AND 5 ORDER BY rank_id",
+        "SELECT COUNT(*), COALESCE(MAX(Colleague_ID), 0), "
+        "COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Colleague_ID, Colleague_Name, rank_id))), 0) FROM Colleagues",
+    ),
+    "recipients": (
+        "SELECT recipient_id, Name FROM Recipients",
+        "SELECT COUNT(*), COALESCE(MAX(recipient_id), 0), "
+        "COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', recipient_id, Name))), 0) FROM Recipients",
+    ),
+    "refund_statuses": (
+        "SELECT Refund_Status_ID, Refund_Status_Type FROM Refund_Status",
+        "SELECT COUNT(*), COALESCE(MAX(Refund_Status_ID), 0), "
+        "COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Refund_Status_ID, Refund_Status_Type))), 0) FROM Refund_Status",
+    ),
+}
+
+_snapshot_lock = threading.Lock()
+_memory = None  # in-process copy shared by every screen in the launcher
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refdata")
+
+
+def cache_dir():
+    base = os.getenv("VAT_REFUNDER_CACHE_DIR")
+    if not base:
+        xdg = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        base = os.path.join(xdg, "vat_refunder")
+    return base
+
+
+def _snapshot_path():
+    return os.path.join(cache_dir(), "refdata.json")
+
+
+# ==========================================================
+# Snapshot file
+# ==========================================================
+def _read_snapshot():
+    """The snapshot, read from disk once per process and then kept in memory."""
+    global _memory
+    with _snapshot_lock:
+        if _memory is None:
+            try:
+                with open(_snapshot_path(), encoding="utf-8") as f:
+                    _memory = json.load(f)
+            except (OSError, ValueError):
+                _memory = {}
+        return dict(_memory)
+
+
+def _update_snapshot(entries):
+    """Merge entries into the snapshot file (atomic replace)."""
+    if not entries:
+        return
+    _read_snapshot()  # make sure the in-memory copy is loaded
+    with _snapshot_lock:
+        _memory.update(entries)
+        snapshot = dict(_memory)
+        path = _snapshot_path()
+        tmp = path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, default=str)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # the cache is an optimisation; never fail a screen over it
+
+
+# ==========================================================
+# Fetching
+# ==========================================================
+def _run_batch(cur, statements):
+    """Row lists of statements, sent to the server as one multi-statement round trip."""
+    results = []
+    for result in cur.execute(";\n".join(statements), multi=True):
+        if result.with_rows:
+            results.append(result.fetchall())
+    return results
+
+
+def _fetch_batch(names, snapshot=None):
+    """
+    Fresh entries for names that are not in snapshot or whose change token
+    moved, over one pooled connection (and one read view, so tokens match
+    the rows): the first round trip carries every token plus the data of the
+    uncached tables; a second one fetches the stale tables, if any.
+    """
+    if not names:
+        return {}
+    snapshot = snapshot or {}
+    cached = {name: snapshot[name]["token"] for name in names if name in snapshot}
+    missing = [name for name in names if name not in cached]
+    entries = {}
+
+    with db_cursor() as cur:
+        results = _run_batch(cur, [DATASETS[name][1] for name in names] + [DATASETS[name][0] for name in missing])
+        tokens = {name: [int(v or 0) for v in rows[0]] for name, rows in zip(names, results)}
+        for name, rows in zip(missing, results[len(names):]):
+            entries[name] = {"token": tokens[name], "rows": [list(row) for row in rows]}
+
+        stale = [name for name, token in cached.items() if tokens[name] != token]
+        if stale:
+            for name, rows in zip(stale, _run_batch(cur, [DATASETS[name][0] for name in stale])):
+                entries[name] = {"token": tokens[name], "rows": [list(row) for row in rows]}
+    return entries
+
+
+def _refresh_entries(names):
+    changed = _fetch_batch(names, _read_snapshot())
+    _update_snapshot(changed)
+    return changed
+
+
+def _load_entries(names):
+    """
+    ({name: entry}, future of {name: entry} for cached tables that were stale).
+
+    When something is missing, the cached tables are validated in the same
+    round trip, so there is nothing left to do in the background.
+    """
+    snapshot = _read_snapshot()
+    if all(name in snapshot for name in names):
+        return {name: snapshot[name] for name in names}, _background.submit(_refresh_entries, list(names))
+
+    fresh = _fetch_batch(names, snapshot)
+    _update_snapshot(fresh)
+    snapshot.update(fresh)
+    done = Future()
+    done.set_result({})
+    return {name: snapshot[name] for name in names}, done
+
+
+def refresh(names):
+    """Re-validate cached names against their change tokens; returns {name: rows} for changed ones."""
+    return {name: entry["rows"] for name, entry in _refresh_entries(names).items()}
+
+
+def load(names):
+    """
+    Return ({name: rows}, refresh_future).
+
+    Cached tables come straight from the snapshot; anything missing is fetched
+    now and mysql.connector errors propagate. refresh_future resolves to
+    {name: rows} for the cached tables that turned out stale.
+    """
+    entries, changed = _load_entries(names)
+    data = {name: entry["rows"] for name, entry in entries.items()}
+    return data, _background.submit(lambda: {name: entry["rows"] for name, entry in changed.result().items()})
+
+
+# ==========================================================
+# Shared lookups for (id, name) tables
+# ==========================================================
+# rows: ((id, name), ...); names: completion list; id_by_name / name_by_id: read-only maps
+Lookup = namedtuple("Lookup", "rows names id_by_name name_by_id")
+EMPTY_LOOKUP = Lookup((), (), MappingProxyType({}), MappingProxyType({}))
+
+_lookups = {}  # name -> (snapshot entry it was built from, Lookup)
+
+
+def _lookup(name, entry):
+    """The Lookup for a snapshot entry, built on first use and shared afterwards."""
+    with _snapshot_lock:
+        cached = _lookups.get(name)
+        if cached and cached[0] is entry:
+            return cached[1]
+    rows = tuple((row[0], row[1]) for row in entry["rows"])
+    built = Lookup(
+        rows,
+        tuple(name for _, name in rows),
+        MappingProxyType({name: row_id for row_id, name in rows}),
+        MappingProxyType({row_id: name for row_id, name in rows}),
+    )
+    with _snapshot_lock:
+        _lookups[name] = (entry, built)
+    return built
+
+
+def lookup(name):
+    """The shared Lookup of a loaded (id, name) table, from memory; EMPTY_LOOKUP when not loaded."""
+    entry = _read_snapshot().get(name)
+    return _lookup(name, entry) if entry else EMPTY_LOOKUP
+
+
+def refresh_lookups(names):
+    """As refresh(), with a new Lookup for each changed table."""
+    return {name: _lookup(name, entry) for name, entry in _refresh_entries(names).items()}
+
+
+def load_lookups(names):
+    """As load(), for (id, name) tables: ({name: Lookup}, future of {name: Lookup} for stale ones)."""
+    entries, changed = _load_entries(names)
+    lookups = {name: _lookup(name, entry) for name, entry in entries.items()}
+    return lookups, _background.submit(
+        lambda: {name: _lookup(name, entry) for name, entry in changed.result().items()}
+    )
+
+
+def add_row(name, row):
+    """
+    Record a row this session just inserted (e.g. a new supplier), so every
+    screen sees it without a refetch; returns the table's new Lookup. The
+    change token is left alone, so the next validation still re-reads it.
+    """
+    entry = _read_snapshot().get(name, {"token": None, "rows": []})
+    entry = {"token": entry["token"], "rows": entry["rows"] + [list(row)]}
+    _update_snapshot({name: entry})
+    return _lookup(name, entry)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Batch report generation over a range of quarters.
+
+Each period's data is fetched once in this process (both sections on one
+consistent read, as in the report windows) and every requested format is
+rendered in a pool of worker processes by the report module's own
+write_pdf()/write_csv(), so the files are the same as a single-period run.
+Periods whose data has not changed since the last run are served from the
+report cache: the earlier files are copied into the output directory.
+
+Usage:
+  python report_batch.py --from 2020Q1 --to 2024Q4
+  python report_batch.py --from 2024Q1 --to 2024Q4 --reports vat_oficial --formats csv --out /tmp/audit
+
+Without arguments the batch window opens.
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from mysql.connector import Error
+import report_cache
+from core.periods import quarter_of_month, parse_period, periods
+
+# report module -> (file prefix, label in the batch window)
+REPORTS = {
+    "vat_oficial": ("VAT", "Official VAT (Modelo 362)"),
+    "vat_vouchers": ("Vouchers", "Invoice-to-Voucher"),
+}
+FORMATS = ("pdf", "csv")
+PENDING_PER_WORKER = 2  # periods read ahead of the renders, per worker process
+
+
+def output_dir(report):
+    module = importlib.import_module(report)
+    return str(getattr(module, "OUTPUT_DIR", None) or getattr(module, "OUT_DIR"))
+
+
+# ==========================================================
+# Worker side (runs in the process pool)
+# ==========================================================
+def _render(report, fmt, data, base_path, fiscal_year, quarter):
+    """Render one file; returns ({role: path}, info), or None when the period has no data."""
+    module = importlib.import_module(report)
+    chancery, residence = data
+
+    if fmt == "pdf":
+        path = module.write_pdf(chancery, residence, base_path + ".pdf", fiscal_year, quarter)
+        return ({"main": path}, {}) if path else None
+
+    if report == "vat_oficial":
+        csv_file = base_path + ".csv"
+        log_file = base_path + "_truncated_log.csv"
+        written, truncated, log_error = module.write_csv(
+            module.sections_to_rows(chancery, residence), csv_file, log_file
+        )
+        if not written:
+            os.remove(csv_file)
+            return None
+        if log_error:
+            raise OSError(f"CSV saved to {csv_file}, but the truncation log failed: {log_error}")
+        files = {"main": csv_file}
+        if truncated:
+            files["log"] = log_file
+        return files, {"truncated": truncated}
+
+    path = module.write_csv(chancery, residence, base_path + ".csv")
+    return ({"main": path}, {}) if path else None
+
+
+def _timed_render(*args):
+    """_render() and its wall time in seconds."""
+    started = time.perf_counter()
+    return _render(*args), time.perf_counter() - started
+
+
+# ==========================================================
+# Batch driver
+# ==========================================================
+def run_batch(reports, formats, start, end, out_dir=None, workers=None, use_cache=True, progress=None,
+              check=None):
+    """
+    Generate every (report, period, format) from start to end.
+
+    progress(done, total, result) is called as each file is done, and
+    check() before each period is fetched; either may raise to stop the
+    batch (renders not started yet are dropped). Each period's renders are
+    submitted as soon as it is read, and at most PENDING_PER_WORKER periods
+    per worker wait in the pool, so fetched rows do not pile up. Returns the
+    list of results: dicts with report, year, quarter, format, status
+    ('generated', 'cached', 'no data' or 'error'), files, error, and for the
+    periods that were queried rows (both sections), fetch_seconds and
+    render_seconds.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    jobs = [(report, year, quarter) for year, quarter in periods(start, end) for report in reports]
+    total = len(jobs) * len(formats)
+    max_pending = (workers or os.cpu_count() or 1) * PENDING_PER_WORKER * len(formats)
+    results = []
+    pending = {}
+
+    def finish(result):
+        results.append(result)
+        if progress:
+            progress(len(results), total, result)
+
+    def collect(block):
+        """finish() the renders that are done; with block, wait for at least one."""
+        done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            result, fp = pending.pop(future)
+            try:
+                rendered, seconds = future.result()
+            except Exception as err:
+                finish(dict(result, status="error", error=str(err)))
+                continue
+            result = dict(result, render_seconds=round(seconds, 3))
+            if rendered is None:
+                finish(dict(result, status="no data"))
+                continue
+            files, info = rendered
+            if use_cache and fp:
+                key = report_cache.cache_key(result["report"], result["quarter"], result["year"], result["format"])
+                report_cache.store(key, fp, files, info)
+            finish(dict(result, status="generated", files=files))
+
+    # spawn: workers must not inherit the pool's sockets or Tk state
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        try:
+            for report, year, quarter in jobs:
+                module = importlib.import_module(report)
+                prefix = REPORTS[report][0]
+                directory = out_dir or output_dir(report)
+                base_path = os.path.join(directory, f"{prefix}_Q{quarter}_{year}_{timestamp}")
+                todo = []
+
+                fp = None
+                for fmt in formats:
+                    result = {"report": report, "year": year, "quarter": quarter, "format": fmt,
+                              "status": None, "files": {}, "error": None,
+                              "rows": None, "fetch_seconds": None, "render_seconds": None}
+                    if use_cache:
+                        try:
+                            key = report_cache.cache_key(report, quarter, year, fmt)
+                            if fp is None:
+                                fp = report_cache.fingerprint(module.report_watermark(quarter, year),
+                                                              module.REPORT_VERSION)
+                            cached = report_cache.lookup(key, fp, directory)
+                        except Error:
+                            cached = None  # the fetch below reports the database problem
+                        if cached:
+                            finish(dict(result, status="cached", files=cached["files"]))
+                            continue
+                    todo.append(result)
+
+                if not todo:
+                    continue
+                if check:
+                    check()
+                started = time.perf_counter()
+                try:
+                    data = module.read_sections(quarter, year)  # once per period, for every format
+                except Error as err:
+                    for result in todo:
+                        finish(dict(result, status="error", error=str(err)))
+                    continue
+                fetched = {"rows": sum(len(section) for section in data),
+                           "fetch_seconds": round(time.perf_counter() - started, 3)}
+
+                for result in todo:
+                    future = pool.submit(_timed_render, report, result["format"], data, base_path, year, quarter)
+                    pending[future] = (dict(result, **fetched), fp)
+                del data
+                collect(block=False)
+                while len(pending) > max_pending:
+                    collect(block=True)
+
+            while pending:
+                collect(block=True)
+        except BaseException:
+            # e.g. the batch was cancelled: drop the renders not started yet
+            for future in pending:
+                future.cancel()
+            raise
+
+    return results
+
+
+def describe(result):
+    prefix = REPORTS[result["report"]][0]
+    line = f"{prefix} Q{result['quarter']} {result['year']} {result['format']}: {result['status']}"
+    if result["error"]:
+        line += f" ({result['error']})"
+    elif result["files"]:
+        line += f" -> {result['files']['main']}"
+    return line
+
+
+# ==========================================================
+# Batch window
+# ==========================================================
+def main(master=None):
+    from tkinter import Tk, Toplevel, Label, Button, OptionMenu, StringVar, BooleanVar, Checkbutton, Frame, messagebox
+    from tkinter import ttk
+
+    import background
+
+    running = []  # the background.Task of the batch in flight
+
+    def start_batch():
+        try:
+            start = (int(from_year.get()), int(from_quarter.get()))
+            end = (int(to_year.get()), int(to_quarter.get()))
+        except ValueError:
+            messagebox.showwarning("Input Required", "Please select the first and last period.")
+            return
+        reports = [name for name, var in report_vars.items() if var.get()]
+        formats = [fmt for fmt, var in format_vars.items() if var.get()]
+        if start > end or not reports or not formats:
+            messagebox.showwarning("Input Required", "Pick a valid period range, at least one report and one format.")
+            return
+
+        progress["value"] = 0
+        status.set("Starting…")
+
+        def work(task):
+            def report(done, total, result):
+                task.progress(done, total, f"{done}/{total}  {describe(result)}")
+                task.check()
+            return run_batch(reports, formats, start, end, progress=report, check=task.check)
+
+        def show_progress(done, total, text):
+            progress["maximum"] = total or 1
+            progress["value"] = done
+            status.set(text)
+
+        def settle():
+            running.clear()
+            cancel_button.config(state="disabled")
+
+        def finished(results):
+            settle()
+            counts = {}
+            for r in results:
+                counts[r["status"]] = counts.get(r["status"], 0) + 1
+            summary = ", ".join(f"{n} {s}" for s, n in sorted(counts.items()))
+            errors = [describe(r) for r in results if r["status"] == "error"]
+            message = f"{summary or 'Nothing to do'}."
+            if errors:
+                message += "\n\n" + "\n".join(errors[:10])
+            messagebox.showinfo("Batch finished", message)
+
+        def failed(err):
+            settle()
+            messagebox.showerror("Batch failed", str(err))
+
+        def cancelled():
+            settle()
+            status.set(f"Cancelled after {progress['value']:.0f} file(s).")
+
+        cancel_button.config(state="normal")
+        running.append(background.start(
+            root, work, on_done=finished, on_error=failed, on_cancel=cancelled,
+            busy=[run_button], progress=show_progress,
+        ))
+
+    def cancel_batch():
+        if running:
+            running[0].cancel()
+            status.set("Cancelling after the current file…")
+        cancel_button.config(state="disabled")
+
+    root = Toplevel(master) if master else Tk()
+    root.title("Batch Reports")
+
+    current_year = datetime.now().year
+    years = [str(y) for y in range(current_year - 10, current_year + 1)]
+    quarters = ["1", "2", "3", "4"]
+
+    from_year, from_quarter = StringVar(value=str(current_year - 5)), StringVar(value="1")
+    to_year, to_quarter = StringVar(value=str(current_year)), StringVar(value=str(quarter_of_month(datetime.now().month)))
+    for label, year_var, quarter_var in (("From (year / quarter):", from_year, from_quarter),
+                                         ("To (year / quarter):", to_year, to_quarter)):
+        Label(root, text=label).pack(pady=(8, 2))
+        row = Frame(root)
+        row.pack()
+        OptionMenu(row, year_var, *years).pack(side="left")
+        OptionMenu(row, quarter_var, *quarters).pack(side="left")
+
+    Label(root, text="Reports:").pack(pady=(8, 2))
+    report_vars = {name: BooleanVar(value=True) for name in REPORTS}
+    for name, (_, label) in REPORTS.items():
+        Checkbutton(root, text=label, variable=report_vars[name]).pack(anchor="w", padx=20)
+
+    Label(root, text="Formats:").pack(pady=(8, 2))
+    format_vars = {fmt: BooleanVar(value=True) for fmt in FORMATS}
+    for fmt in FORMATS:
+        Checkbutton(root, text=fmt.upper(), variable=format_vars[fmt]).pack(anchor="w", padx=20)
+
+    buttons = Frame(root)
+    buttons.pack(pady=12)
+    run_button = Button(buttons, text="Generate Reports", command=start_batch)
+    run_button.pack(side="left", padx=4)
+    cancel_button = Button(buttons, text="Cancel", command=cancel_batch, state="disabled")
+    cancel_button.pack(side="left", padx=4)
+    progress = ttk.Progressbar(root, length=320, mode="determinate")
+    progress.pack(padx=16)
+    status = StringVar()
+    Label(root, textvariable=status, font=("Helvetica", 8), wraplength=320).pack(pady=(4, 12))
+
+    if master is None:
+        root.mainloop()
+    return root
+
+
+# ==========================================================
+# Headless
+# ==========================================================
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Generate VAT reports for a range of quarters.")
+    parser.add_argument("--from", dest="start", required=True, type=parse_period, help="first period, e.g. 2020Q1")
+    parser.add_argument("--to", dest="end", required=True, type=parse_period, help="last period, e.g. 2024Q4")
+    parser.add_argument("--reports", nargs="+", choices=list(REPORTS), default=list(REPORTS))
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--out", help="output directory (default: each report's export directory)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="always query and render")
+    args = parser.parse_args(argv)
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    def show(done, total, result):
+        print(f"[{done}/{total}] {describe(result)}", flush=True)
+
+    results = run_batch(args.reports, args.formats, args.start, args.end, out_dir=args.out,
+                        workers=args.workers, use_cache=not args.no_cache, progress=show)
+    return 1 if any(r["status"] == "error" for r in results) else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli())
+    main()
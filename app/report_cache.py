@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Report output cache.
+
+Entries are keyed by (report, quarter, year, format) and carry a fingerprint
+of the data behind the report (the report's watermark query: counts, max IDs
+and checksums). When the fingerprint still matches, the files produced last
+time are handed back instead of querying and rendering again, copied into
+the directory the caller writes to. Each produced file is also kept under its
+content hash, so a deleted or moved export can be restored; the least recently used entries are evicted once the stored files
+exceed the size limit.
+
+Cache dir:
+  <refdata cache dir>/reports
+Size limit:
+  $VAT_REFUNDER_REPORT_CACHE_MB (default 200)
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+import time
+from db import db_cursor
+from refdata import cache_dir
+
+DEFAULT_LIMIT_MB = 200
+
+_lock = threading.Lock()
+
+
+def _root():
+    return os.path.join(cache_dir(), "reports")
+
+
+def _index_path():
+    return os.path.join(_root(), "index.json")
+
+
+def size_limit():
+    try:
+        mb = float(os.getenv("VAT_REFUNDER_REPORT_CACHE_MB", DEFAULT_LIMIT_MB))
+    except ValueError:
+        mb = DEFAULT_LIMIT_MB
+    return int(mb * 1024 * 1024)
+
+
+def cache_key(report, quarter, fiscal_year, fmt):
+    return f"{report}|Q{quarter}|{fiscal_year}|{fmt}"
+
+
+def fingerprint(watermark, version=1):
+    """Hash of the watermark = (sql, params) result; version lets a report invalidate old output."""
+    sql, params = watermark
+    with db_cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    payload = json.dumps([version, [list(row) for row in rows]], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ==========================================================
+# Index file
+# ==========================================================
+def _load_index():
+    try:
+        with open(_index_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(index):
+    path = _index_path()
+    tmp = path + ".tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+
+
+def _object_path(digest, ext):
+    return os.path.join(_root(), "objects", digest + ext)
+
+
+def _store_object(path):
+    """Copy path into the cache under its content hash; returns (object path, size)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    target = _object_path(h.hexdigest(), os.path.splitext(path)[1])
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target + ".tmp")
+        os.replace(target + ".tmp", target)
+    return target, os.path.getsize(target)
+
+
+def _drop_unreferenced(index, objects):
+    live = {f["object"] for entry in index.values() for f in entry["files"].values()}
+    for obj in objects - live:
+        try:
+            os.remove(obj)
+        except OSError:
+            pass
+
+
+def _evict(index):
+    """Remove least recently used entries until the stored objects fit the size limit."""
+    limit = size_limit()
+
+    def total():
+        sizes = {f["object"]: f["size"] for entry in index.values() for f in entry["files"].values()}
+        return sum(sizes.values())
+
+    for key in sorted(index, key=lambda k: index[k]["used"]):
+        if total() <= limit:
+            break
+        dropped = {f["object"] for f in index.pop(key)["files"].values()}
+        _drop_unreferenced(index, dropped)
+
+
+# ==========================================================
+# Public API
+# ==========================================================
+def lookup(key, fp, out_dir=None):
+    """
+    Return the cached entry {"files": {role: path}, "info": {...}} when fp
+    still matches, else None. The files are handed back in out_dir, under
+    the names they were produced with, copied there from the cache when
+    missing (a deleted export, or a run into another directory); without
+    out_dir, at their original location.
+    """
+    with _lock:
+        index = _load_index()
+        entry = index.get(key)
+        if not entry or entry["fingerprint"] != fp:
+            return None
+        files = {}
+        try:
+            for role, f in entry["files"].items():
+                path = os.path.join(os.path.abspath(out_dir), os.path.basename(f["path"])) if out_dir else f["path"]
+                if not os.path.exists(path) or os.path.getsize(path) != f["size"]:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    shutil.copyfile(f["object"], path + ".tmp")
+                    os.replace(path + ".tmp", path)
+                files[role] = path
+            entry["used"] = time.time()
+            _save_index(index)
+        except OSError:
+            return None  # cache damaged or export dir gone; just regenerate
+        return {"files": files, "info": entry.get("info", {})}
+
+
+def store(key, fp, files, info=None):
+    """
+    Remember files ({role: exported path}) as the output for key at fp,
+    replacing what was there before, then evict down to the size limit.
+    Cache problems are never fatal to the report that was just produced.
+    """
+    with _lock:
+        try:
+            index = _load_index()
+            old = index.pop(key, None)
+            stored = {}
+            for role, path in files.items():
+                obj, size = _store_object(path)
+                stored[role] = {"path": os.path.abspath(path), "object": obj, "size": size}
+            index[key] = {"fingerprint": fp, "files": stored, "info": info or {}, "used": time.time()}
+            if old:
+                _drop_unreferenced(index, {f["object"] for f in old["files"].values()})
+            _evict(index)
+            _save_index(index)
+        except OSError:
+            pass
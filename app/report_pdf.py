@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Shared ReportLab building blocks for the report screens.
+
+Styles, column layouts and table styles are built once, when this module is
+first imported. The report modules import it inside their PDF writers only, so
+opening a report window (or exporting CSV) never loads ReportLab.
+"""
+
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_RIGHT, TA_CENTER
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, Paragraph, Table
+
+# ==========================================================
+# Page sizes
+# ==========================================================
+PORTRAIT = A4
+LANDSCAPE = landscape(A4)
+
+# ==========================================================
+# Paragraph styles
+# ==========================================================
+STYLES = getSampleStyleSheet()
+STYLES.add(ParagraphStyle(name="SectionHeading", parent=STYLES["Heading2"], spaceBefore=6, spaceAfter=6))
+STYLES.add(ParagraphStyle(name="Total", parent=STYLES["Normal"], fontSize=10, alignment=TA_RIGHT, spaceBefore=6, spaceAfter=12))
+STYLES.add(ParagraphStyle(name="TotalSmall", parent=STYLES["Normal"], fontSize=8, alignment=TA_RIGHT, spaceAfter=6))
+STYLES.add(ParagraphStyle(name="QuarterHeader", parent=STYLES["Heading2"], alignment=TA_CENTER, spaceAfter=10))
+STYLES.add(ParagraphStyle(name="TableHeader", parent=STYLES["Normal"], fontSize=9, leading=12, alignment=TA_CENTER, textColor=colors.white))
+STYLES.add(ParagraphStyle(name="TableCell", parent=STYLES["Normal"], fontSize=8, leading=10))
+
+# ==========================================================
+# Column layouts: (header labels, column widths)
+# ==========================================================
+OFICIAL_COLUMNS = (
+    ["Serial Nº", "NIF", "Proveedor", "Nº Factura", "Fecha Devengo", "Importe Total (€)", "Cuota IVA (€)"],
+    [15 * mm, 30 * mm, 50 * mm, 35 * mm, 25 * mm, 25 * mm, 25 * mm],
+)
+VOUCHER_COLUMNS = (
+    ["Proveedor", "Nº Factura", "Fecha Devengo", "Importe Total (€)", "Cuota IVA (€)", "Voucher Nº", "Head of Accounts"],
+    [70 * mm, 40 * mm, 30 * mm, 30 * mm, 30 * mm, 30 * mm, 40 * mm],
+)
+COLLEAGUE_COLUMNS = (
+    ["NIF", "Proveedor", "Nº Factura", "Importe Total (€)", "Fecha Devengo", "Cuota IVA (€)"],
+    [30 * mm, 50 * mm, 30 * mm, 30 * mm, 30 * mm, 30 * mm],
+)
+
+# ==========================================================
+# Table styles
+# ==========================================================
+_BASE_TABLE = [
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+]
+
+OFICIAL_TABLE_STYLE = _BASE_TABLE + [
+    ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
+    ("ALIGN", (2, 1), (2, -1), "LEFT"),
+    ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+    ("FONTSIZE", (0, 0), (-1, -1), 8),
+    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+]
+VOUCHER_TABLE_STYLE = _BASE_TABLE + [
+    ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
+    ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+    ("FONTSIZE", (0, 0), (-1, -1), 7),
+    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+]
+COLLEAGUE_TABLE_STYLE = _BASE_TABLE + [
+    ("BACKGROUND", (0, 0), (-1, 0), colors.darkblue),
+    ("ALIGN", (1, 1), (1, -1), "LEFT"),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+    ("FONTSIZE", (0, 0), (-1, -1), 8),
+    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+]
+
+
+def header_row(labels, style="Heading4"):
+    """Fresh header Paragraphs for one table (flowables are not shared between tables)."""
+    return [Paragraph(label, STYLES[style]) for label in labels]
+
+
+# ==========================================================
+# Section tables (fast mode for large sections)
+# ==========================================================
+FAST_PDF_ROWS = 500   # sections with at least this many rows use the fast path
+CELL_PADDING = 12     # default left + right cell padding in a Table
+ROW_PADDING = 6       # default top + bottom cell padding in a Table
+
+
+def _fast_body_style(cell_style):
+    """Table commands that make plain-string body cells look like Paragraph(text, cell_style)."""
+    return [
+        ("FONTNAME", (0, 1), (-1, -1), cell_style.fontName),
+        ("FONTSIZE", (0, 1), (-1, -1), cell_style.fontSize),
+        ("LEADING", (0, 1), (-1, -1), cell_style.leading),
+        ("ALIGN", (0, 1), (-1, -1), "LEFT"),
+    ]
+
+
+def _fast_cell(text, width, cell_style):
+    """Plain string when text fits on one line of the column, else a wrapping Paragraph."""
+    if "\n" not in text and "<" not in text and "&" not in text and (
+        stringWidth(text, cell_style.fontName, cell_style.fontSize) <= width - CELL_PADDING
+    ):
+        return text
+    return Paragraph(text, cell_style)
+
+
+class PagedTable(Flowable):
+    """
+    A long table laid out one page at a time.
+
+    A single Table re-measures every remaining row each time it is split
+    across a page, which is quadratic in the row count. PagedTable instead
+    builds a Table of just the rows that can possibly fit on the current page
+    (header repeated), lets ReportLab split that, and carries the rest over.
+    Page breaks, repeated headers and row shading match one big Table.
+    """
+
+    def __init__(self, labels, col_widths, rows, style, min_row_height):
+        super().__init__()
+        self._labels = labels
+        self._col_widths = col_widths
+        self._rows = rows
+        self._style = style
+        self._min_row_height = min_row_height
+        self._whole = None
+
+    def _table(self, rows):
+        table = Table([header_row(self._labels)] + rows, colWidths=self._col_widths, repeatRows=1)
+        table.setStyle(self._style)
+        return table
+
+    def _page_rows(self, avail_height):
+        # More rows than this cannot fit, whatever their height
+        return int(avail_height // self._min_row_height) + 1
+
+    def wrap(self, availWidth, availHeight):
+        if len(self._rows) > self._page_rows(availHeight):
+            self._whole = None
+            return sum(self._col_widths), availHeight + 1  # too tall: forces a split()
+        self._whole = self._table(self._rows)
+        return self._whole.wrap(availWidth, availHeight)
+
+    def split(self, availWidth, availHeight):
+        page_rows = self._page_rows(availHeight)
+        if len(self._rows) <= page_rows:
+            return self._table(self._rows).split(availWidth, availHeight)
+        parts = self._table(self._rows[:page_rows]).split(availWidth, availHeight)
+        if not parts:
+            return []
+        used = len(parts[0]._cellvalues) - 1
+        rest = PagedTable(self._labels, self._col_widths, self._rows[used:], self._style, self._min_row_height)
+        return [parts[0], rest]
+
+    def draw(self):
+        self._whole.drawOn(self.canv, 0, 0)
+
+
+def section_tables(labels, col_widths, body_rows, table_style, cell_style=None, fast=None):
+    """
+    Flowables for one report section; body_rows are lists of cell strings.
+
+    The normal path is one Table of Paragraph cells. With fast=True (default:
+    when there are at least FAST_PDF_ROWS rows) cells that fit on one line
+    are plain strings styled like the Paragraphs, and the body goes into a
+    PagedTable, so layout cost stays linear in the number of rows.
+    """
+    cell_style = cell_style or STYLES["Normal"]
+    if fast is None:
+        fast = len(body_rows) >= FAST_PDF_ROWS
+
+    if not fast:
+        data = [header_row(labels)]
+        data += [[Paragraph(text, cell_style) for text in row] for row in body_rows]
+        table = Table(data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(table_style)
+        return [table]
+
+    rows = [
+        [_fast_cell(text, width, cell_style) for text, width in zip(row, col_widths)]
+        for row in body_rows
+    ]
+    style = table_style + _fast_body_style(cell_style)
+    return [PagedTable(labels, col_widths, rows, style, cell_style.leading + ROW_PADDING)]
+
+
+# ==========================================================
+# Canvas with "Generated on" stamp and page x/n footer
+# ==========================================================
+class NumberedCanvas(canvas.Canvas):
+    """
+    Stamps every page with the generation time and "page/total".
+
+    The total is not known until save(), so each page draws its number and a
+    reference to a form XObject; the form is written once at save() with the
+    final page count. Nothing is kept per page, so memory stays flat however
+    long the report gets.
+    """
+    TOTAL_FORM = "page_total"
+    FOOTER_FONT = ("Helvetica", 8)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._pages = 0
+
+    def showPage(self):
+        self._pages += 1
+        self._draw_footer()
+        super().showPage()
+
+    def save(self):
+        self.beginForm(self.TOTAL_FORM)
+        self.setFont(*self.FOOTER_FONT)
+        self.drawString(0, 0, str(self._pages))
+        self.endForm()
+        super().save()
+
+    def _draw_footer(self):
+        width, height = self._pagesize
+        self.saveState()
+        self.setFont("Helvetica", 6)
+        self.drawString(15 * mm, height - 10 * mm, f"Generated on: {self._timestamp}")
+
+        # "n/" is placed as if the total had as many digits as n, which
+        # centres the footer exactly on the last page and near enough elsewhere
+        number = f"{self._pageNumber}/"
+        font, size = self.FOOTER_FONT
+        number_width = stringWidth(number, font, size)
+        x = width / 2.0 - (number_width + stringWidth(str(self._pageNumber), font, size)) / 2.0
+        self.setFont(font, size)
+        self.drawString(x, 15 * mm, number)
+        self.translate(x + number_width, 15 * mm)
+        self.doForm(self.TOTAL_FORM)
+        self.restoreState()
@@ -1,21 +1,65 @@
-import subprocess, sys, os, tkinter as tk
-HERE = os.path.dirname(os.path.abspath(__file__))
+import importlib, sys, time, tkinter as tk
+from tkinter import messagebox
 
-def run(script):
-    subprocess.Popen([sys.executable, os.path.join(HERE, script)])
-
-root = tk.Tk()
-root.title("VAT Refunder")
+# Every screen runs as a Toplevel in this process, so they share one
+# connection pool (db.py) and one reference-data cache (refdata.py).
+# Screen modules are imported on first use only.
 buttons = [
-    ("Log Official Invoices/ Vouchers",  "invoices.py"),
-    ("Log Personal Invoice",  "invoice_pers.py"),
-    ("Log New Supplier", "new_supplier.py"),
-    ("Print Official VAT", "vat_oficial.py"),
-    ("Print Personal VAT ", "vat_colleague.py"),
-    ("Print Invoice-to-Voucher Report", "vat_vouchers.py"),
+    ("Log Official Invoices/ Vouchers",  "invoices"),
+    ("Log Personal Invoice",  "invoice_pers"),
+    ("Log New Supplier", "new_supplier"),
+    ("Print Official VAT", "vat_oficial"),
+    ("Print Personal VAT ", "vat_colleague"),
+    ("Print Invoice-to-Voucher Report", "vat_vouchers"),
+    ("Batch Reports (several quarters)", "report_batch"),
 ]
-for text, script in buttons:
-    tk.Button(root, text=text, width=28, command=lambda s=script: run(s)).pack(padx=16, pady=8)
+windows = {}
+
+def report_startup(name, started, import_secs, cached):
+    total_ms = (time.perf_counter() - started) * 1000
+    import_note = "already imported" if cached else f"import {import_secs * 1000:.0f} ms"
+    line = f"{name}: first window in {total_ms:.0f} ms ({import_note})"
+    print(f"[startup] {line}", flush=True)
+    status_var.set(line)
+
+def run(name):
+    win = windows.get(name)
+    if win is not None and win.winfo_exists():
+        win.deiconify()
+        win.lift()
+        win.focus_force()
+        return
+
+    started = time.perf_counter()
+    cached = name in sys.modules
+    try:
+        module = importlib.import_module(name)
+        import_secs = time.perf_counter() - started
+        win = module.main(master=root)
+    except Exception as e:
+        messagebox.showerror("Error", f"Could not open {name}: {e}")
+        return
+    windows[name] = win
+
+    def on_map(event):
+        if event.widget is win:
+            win.unbind("<Map>")
+            report_startup(name, started, import_secs, cached)
+    win.bind("<Map>", on_map, add="+")
+
+# Guarded: report_batch's worker processes re-import the main module
+if __name__ == "__main__":
+    import migrate
+    schema_warnings = migrate.startup()  # databases created before the newer db/init files
+
+    root = tk.Tk()
+    root.title("VAT Refunder")
+    for text, name in buttons:
+        tk.Button(root, text=text, width=28, command=lambda n=name: run(n)).pack(padx=16, pady=8)
 
-tk.Label(root, text="MySQL must be running (Docker).").pack(pady=(6,12))
-root.mainloop()
\ No newline at end of file
+    tk.Label(root, text="MySQL must be running (Docker).").pack(pady=(6,12))
+    status_var = tk.StringVar()
+    tk.Label(root, textvariable=status_var, font=("Helvetica", 8), fg="grey").pack(pady=(0, 8))
+    if schema_warnings:
+        root.after(0, lambda: messagebox.showwarning("Database Upgrade Needed", "\n\n".join(schema_warnings)))
+    root.mainloop()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Column introspection shared by the report modules.
+
+Views and tables differ between deployments (e.g. a VAT view with or without
+Proveedor, Head_of_Accounts.Name vs Head_of_Accounts_Name). Instead of trying
+a query and falling back on error, reports look the columns up in
+information_schema.COLUMNS once per process and build the right projection
+up front. An entry is dropped again when a query built from it fails with
+"unknown column" (the schema changed underneath us), or via invalidate().
+has_unique_key() answers the same way for writers that rely on a UNIQUE key.
+"""
+
+import threading
+from mysql.connector import Error, errorcode
+
+_columns = {}  # table name (lower case) -> frozenset of lower-case column names
+_unique_keys = set()  # (table, column), lower case, known to have a UNIQUE key
+_lock = threading.Lock()
+
+
+def columns(cur, table):
+    """Lower-case column names of table (or view) in the current database, memoized."""
+    key = table.lower()
+    cached = _columns.get(key)
+    if cached is not None:
+        return cached
+
+    cur.execute(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,),
+    )
+    names = frozenset(
+        (row["COLUMN_NAME"] if isinstance(row, dict) else row[0]).lower()
+        for row in cur.fetchall()
+    )
+    if names:  # a missing view may be created later; don't remember that
+        with _lock:
+            _columns[key] = names
+    return names
+
+
+def has_column(cur, table, column):
+    return column.lower() in columns(cur, table)
+
+
+def pick_column(cur, table, *candidates):
+    """First of candidates that table actually has, or None."""
+    present = columns(cur, table)
+    for name in candidates:
+        if name.lower() in present:
+            return name
+    return None
+
+
+def has_unique_key(cur, table, column):
+    """
+    Whether table has a single-column UNIQUE key (or primary key) on column.
+    Only a True answer is memoized: the key may be added later (migrate.py).
+    """
+    key = (table.lower(), column.lower())
+    if key in _unique_keys:
+        return True
+    cur.execute(
+        "SELECT INDEX_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0 "
+        "GROUP BY INDEX_NAME HAVING COUNT(*) = 1 AND MAX(COLUMN_NAME) = %s",
+        (table, column),
+    )
+    found = bool(cur.fetchall())
+    if found:
+        with _lock:
+            _unique_keys.add(key)
+    return found
+
+
+def invalidate(table=None):
+    """Forget the columns of table, or of every table when table is None."""
+    with _lock:
+        if table is None:
+            _columns.clear()
+            _unique_keys.clear()
+        else:
+            _columns.pop(table.lower(), None)
+            _unique_keys.difference_update({k for k in _unique_keys if k[0] == table.lower()})
+
+
+def run_with_columns(cur, tables, run):
+    """
+    Call run(), which builds its statement from columns(); if that statement
+    fails with "unknown column", drop tables from the memo and call run()
+    once more against the fresh column lists.
+    """
+    try:
+        return run()
+    except Error as err:
+        if err.errno != errorcode.ER_BAD_FIELD_ERROR:
+            raise
+        for table in tables:
+            invalidate(table)
+        return run()
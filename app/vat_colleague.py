@@ -1,119 +1,86 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import csv
-from contextlib import contextmanager
+import multiprocessing
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from mysql.connector import Error
-from db import get_cnx  # central DB connector
-from tkinter import Tk, Label, Button, Entry, StringVar, LEFT, RIGHT, E, W, N, S, END
+from db import db_cursor  # shared pooled connection
+import background
+from core.report_rows import colleague_csv_row
+from tkinter import Tk, Toplevel, Label, Button, Entry, StringVar, LEFT, RIGHT, E, W, N, S, END
 from tkinter import messagebox, filedialog
 import time
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from datetime import datetime
-
-# ==========================================================
-# Context manager for automatic cleanup
-# ==========================================================
-@contextmanager
-def db_cursor(commit=False):
-    cnx = get_cnx()
-    cur = cnx.cursor()
-    try:
-        yield cur
-        if commit:
-            cnx.commit()
-    except Exception as e:
-        cnx.rollback()
-        raise e
-    finally:
-        cur.close()
-        cnx.close()
 
 # ==========================================================
 # Define output directory
 # ==========================================================
-DEFAULT_OUTPUT_DIR = "~Desktop/exports"
+DEFAULT_OUTPUT_DIR = os.path.expanduser("~/Desktop/exports")
 
 # Global variable for output directory (user can browse)
 OUTPUT_DIR = DEFAULT_OUTPUT_DIR
+FORMATS = ("pdf", "csv")
 
 # ==========================================================
 # Define functions
 # ==========================================================
 
-def fetch_data(Colleague_ID, quarter, fiscal_year):
-    try:
-        with db_cursor(commit=False) as cur:
-            cur.callproc('GetRelFactColleague', [Colleague_ID, quarter, fiscal_year])
-            data = []
-            for result in cur.stored_results():
-                data = result.fetchall()
-            return data
-    except Error as e:
-        messagebox.showerror("Error", f"Error: {e}")
-
-def generate_csv(data, output_file):
-    """
-    Generate CSV summary per Agencia Tributaria guidelines:
-    Nif Proveedor; Importe total (impuestos incluidos); Nº factura; Cuota IVA; Fecha devengo
-    """
-    if not data:
-        return
+def read_data(Colleague_ID, quarter, fiscal_year):
+    """Rows of GetRelFactColleague; Colleague_ID None means every colleague. Errors propagate."""
+    with db_cursor(commit=False) as cur:
+        cur.callproc('GetRelFactColleague', [Colleague_ID, quarter, fiscal_year])
+        data = []
+        for result in cur.stored_results():
+            data = result.fetchall()
+        return data
 
-    valid_data = [row for row in data if len(row) >= 13]
-    if not valid_data:
-        return
+def _valid(data):
+    return (row for row in data or [] if len(row) >= 13)
 
-    try:
-        with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile, delimiter=";")
-            for row in valid_data:
-                nif = str(row[3])
-                total = f"{float(row[6]):.2f}".rstrip("0").rstrip(".")
-                invoice_no = str(row[5])
-                iva = f"{float(row[8]):.2f}".rstrip("0").rstrip(".")
-                try:
-                    fecha_obj = datetime.strptime(str(row[7]), "%Y-%m-%d")
-                    fecha = fecha_obj.strftime("%d-%m-%Y")
-                except Exception:
-                    fecha = str(row[7])
-                writer.writerow([nif, total, invoice_no, iva, fecha])
-        messagebox.showinfo("CSV Generated", f"CSV summary generated: {output_file}")
-    except Exception as e:
-        messagebox.showerror("CSV Generation Error", f"Error generating CSV: {e}")
-
-def generate_pdf(data, output_file):
-    if not data:
-        messagebox.showinfo("No Data", "No data available to generate the report.")
-        return
+def _quarter(row):
+    return row[11], row[12]
 
-    valid_data = [row for row in data if len(row) >= 13]
-    if not valid_data:
-        messagebox.showinfo("No Valid Data", "No valid data rows found. Skipping PDF generation.")
-        return
+def report_rows(data):
+    """
+    The valid rows sorted once by (year, quarter), the order the report lists
+    them; the sort is stable, so procedure order is kept within a quarter.
+    """
+    return sorted(_valid(data), key=lambda row: (row[12], row[11]))
 
-    doc = SimpleDocTemplate(output_file, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='QuarterHeader', parent=styles['Heading2'], alignment=1, spaceAfter=10))
-    styles.add(ParagraphStyle(name='TableHeader', parent=styles['Normal'], fontSize=9, leading=12, alignment=1, textColor=colors.white))
-    styles.add(ParagraphStyle(name='TableCell', parent=styles['Normal'], fontSize=8, leading=10))
+def group_by_colleague(data):
+    """
+    {(colleague name, NIE): rows}, each already in report_rows() order: the
+    valid rows are sorted once by colleague, year and quarter and split in a
+    single pass.
+    """
+    rows = sorted(_valid(data), key=lambda row: (str(row[0]), str(row[1]), row[12], row[11]))
+    return {key: list(group) for key, group in groupby(rows, key=lambda row: (row[0], row[1]))}
 
-    quarters = sorted(set((row[11], row[12]) for row in valid_data))
+def write_reports(rows, output_pdf=None, output_csv=None, progress=None):
+    """
+    Write the PDF and/or the CSV summary (per Agencia Tributaria guidelines)
+    for rows from report_rows() in a single traversal: quarters are grouped
+    on the fly and each row goes to its quarter's PDF table and to the CSV as
+    it is read. Returns the paths written ([] when there are no rows).
+    Errors propagate; progress is ReportLab's build progress callback.
+    """
+    if not rows:
+        return []
 
-    for quarter, fiscal_year in quarters:
-        quarter_data = [row for row in valid_data if row[11] == quarter and row[12] == fiscal_year]
-        if not quarter_data:
-            continue
+    elements = []
+    if output_pdf:
+        # ReportLab is only loaded once a PDF is actually requested
+        from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer, PageBreak
+        from report_pdf import PORTRAIT, STYLES, COLLEAGUE_COLUMNS, COLLEAGUE_TABLE_STYLE, NumberedCanvas
+        styles = STYLES
+        headers, col_widths = COLLEAGUE_COLUMNS
+
+    def quarter_heading(first_row, quarter, fiscal_year):
         if elements:
             elements.append(PageBreak())
-        colleague_name = quarter_data[0][0]
-        nie = quarter_data[0][1]
-        service_office = quarter_data[0][2]
+        colleague_name, nie, service_office = first_row[0], first_row[1], first_row[2]
 
         elements.append(Paragraph("Relación de Facturas - Modelo 362", styles['Title']))
         elements.append(Spacer(1, 12))
@@ -124,52 +91,52 @@ def generate_pdf(data, output_file):
         elements.append(Paragraph(f"<b>Trimestre:</b> {quarter}", styles['Normal']))
         elements.append(Spacer(1, 12))
 
-        headers = ["NIF", "Proveedor", "Nº Factura", "Importe Total (€)", "Fecha Devengo", "Cuota IVA (€)"]
-        data_table = [headers]
-        vat_total = 0
-
-        for row in quarter_data:
-            supplier_name = Paragraph(str(row[4]), styles['TableCell'])
-            data_row = [
-                str(row[3]),
-                supplier_name,
-                str(row[5]),
-                f"{float(row[6]):,.2f}",
-                str(row[7]),
-                f"{float(row[8]):,.2f}"
-            ]
-            data_table.append(data_row)
-            vat_total += row[8]
-
-        table = Table(data_table, colWidths=[30*mm, 50*mm, 30*mm, 30*mm, 30*mm, 30*mm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
-        ]))
+    def quarter_table(data_table, quarter, vat_total):
+        table = Table(data_table, colWidths=col_widths)
+        table.setStyle(COLLEAGUE_TABLE_STYLE)
         elements.append(table)
         elements.append(Spacer(1, 12))
         elements.append(Paragraph(f"<b>Total Cuotas IVA para Trimestre {quarter}: € {vat_total:,.2f}</b>", styles['Normal']))
 
+    csvfile = open(output_csv, "w", newline="", encoding="utf-8") if output_csv else None
     try:
-        doc.build(elements)
-        messagebox.showinfo("Report Generated", f"PDF report generated: {output_file}")
-    except Exception as e:
-        messagebox.showerror("PDF Generation Error", f"An error occurred: {e}")
+        writer = csv.writer(csvfile, delimiter=";") if csvfile else None
+        for (quarter, fiscal_year), quarter_rows in groupby(rows, key=_quarter):
+            data_table = [list(headers)] if output_pdf else None
+            vat_total = 0
+            for row in quarter_rows:
+                if writer:
+                    writer.writerow(colleague_csv_row(row))
+                if output_pdf:
+                    if len(data_table) == 1:
+                        quarter_heading(row, quarter, fiscal_year)
+                    data_table.append([
+                        str(row[3]),
+                        Paragraph(str(row[4]), styles['TableCell']),
+                        str(row[5]),
+                        f"{float(row[6]):,.2f}",
+                        str(row[7]),
+                        f"{float(row[8]):,.2f}"
+                    ])
+                    vat_total += row[8]
+            if output_pdf:
+                quarter_table(data_table, quarter, vat_total)
+    finally:
+        if csvfile:
+            csvfile.close()
 
-def generate_report(Colleague_ID, quarter, fiscal_year):
-    data = fetch_data(Colleague_ID, quarter, fiscal_year)
-    if not data:
-        messagebox.showwarning("No Data", "No data found for the provided criteria.")
-        return
+    if output_pdf:
+        doc = SimpleDocTemplate(output_pdf, pagesize=PORTRAIT)
+        if progress:
+            doc.setProgressCallBack(progress)
+        doc.build(elements, canvasmaker=NumberedCanvas)
+    return [path for path in (output_pdf, output_csv) if path]
 
-    colleague_full_name = data[0][0]
+def report_filenames(colleague_full_name, quarter, fiscal_year, nie=None):
+    """
+    (pdf name, csv name) for one colleague's report. The NIE is part of the
+    name, so two colleagues with the same name do not overwrite each other.
+    """
     name_parts = colleague_full_name.strip().split()
     name = name_parts[0]
     surname = "_".join(name_parts[1:]) if len(name_parts) > 1 else ""
@@ -179,51 +146,187 @@ def generate_report(Colleague_ID, quarter, fiscal_year):
 
     quarter_str = f"Q{quarter}" if quarter else "AllQuarters"
     fiscal_year_str = str(fiscal_year) if fiscal_year else "AllYears"
+    nie_str = "_" + re.sub(r"[^\w-]", "_", str(nie).strip()) if nie and str(nie).strip() else ""
 
-    pdf_filename = f"RelFactColleague_report_{name_sanitized}_{surname_sanitized}_{quarter_str}_{fiscal_year_str}.pdf"
-    csv_filename = f"RelFactColleague_summary_{name_sanitized}_{surname_sanitized}_{quarter_str}_{fiscal_year_str}.csv"
+    pdf_filename = f"RelFactColleague_report_{name_sanitized}_{surname_sanitized}{nie_str}_{quarter_str}_{fiscal_year_str}.pdf"
+    csv_filename = f"RelFactColleague_summary_{name_sanitized}_{surname_sanitized}{nie_str}_{quarter_str}_{fiscal_year_str}.csv"
+    return pdf_filename, csv_filename
 
-    output_pdf = os.path.join(OUTPUT_DIR, pdf_filename)
-    output_csv = os.path.join(OUTPUT_DIR, csv_filename)
+def _output_paths(colleague_full_name, nie, quarter, fiscal_year, output_dir, formats):
+    """(pdf path, csv path) in output_dir, None for a format not in formats."""
+    pdf_filename, csv_filename = report_filenames(colleague_full_name, quarter, fiscal_year, nie)
+    return (os.path.join(output_dir, pdf_filename) if "pdf" in formats else None,
+            os.path.join(output_dir, csv_filename) if "csv" in formats else None)
 
-    generate_pdf(data, output_pdf)
-    generate_csv(data, output_csv)
+def build_report(task, Colleague_ID, quarter, fiscal_year, output_dir=None, formats=FORMATS):
+    """
+    Background part of generate_report(): (status, paths, row count) with
+    status 'no data', 'no valid data' or 'generated'. Errors propagate.
+    """
+    data = read_data(Colleague_ID, quarter, fiscal_year)
+    if not data:
+        return "no data", [], 0
+    rows = report_rows(data)
+    if not rows:
+        return "no valid data", [], 0
+    task.check()
 
-def select_and_generate_report():
-    Colleague_ID_input = Colleague_ID_var.get().strip()
+    output_pdf, output_csv = _output_paths(data[0][0], data[0][1], quarter, fiscal_year, output_dir or OUTPUT_DIR, formats)
+    paths = write_reports(rows, output_pdf, output_csv, progress=background.pdf_progress(task))
+    return "generated", paths, len(rows)
+
+def generate_report(Colleague_ID, quarter, fiscal_year):
+    def show_result(result):
+        status, paths, _ = result
+        if status == "no data":
+            messagebox.showwarning("No Data", "No data found for the provided criteria.")
+        elif status == "no valid data":
+            messagebox.showinfo("No Valid Data", "No valid data rows found. Skipping report generation.")
+        else:
+            output_pdf, output_csv = paths
+            messagebox.showinfo("Report Generated", f"PDF report generated: {output_pdf}\nCSV summary generated: {output_csv}")
+
+    def show_error(e):
+        if isinstance(e, Error):
+            messagebox.showerror("Error", f"Error: {e}")
+        else:
+            messagebox.showerror("Report Generation Error", f"An error occurred: {e}")
+
+    background.start(
+        generate_button,
+        lambda task: build_report(task, Colleague_ID, quarter, fiscal_year),
+        on_done=show_result,
+        on_error=show_error,
+        busy=[generate_button, all_button],
+        title="Generating Colleague Report",
+    )
+
+# ==========================================================
+# All colleagues in one pass
+# ==========================================================
+def _render_colleague(rows, output_pdf, output_csv):
+    """Worker: both files for one colleague; returns the paths written."""
+    return write_reports(rows, output_pdf, output_csv)
+
+def generate_all_reports(quarter, fiscal_year, output_dir=None, workers=None, progress=None, formats=FORMATS):
+    """
+    One procedure call for every colleague, grouped in a single pass, then
+    each colleague's PDF and CSV rendered in a pool of worker processes, named
+    as generate_report() names them. progress(done, total, name) is called
+    as each colleague finishes and may raise to stop the run. Returns
+    [(colleague name, paths, error, row count)].
+    Database errors propagate.
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    groups = group_by_colleague(read_data(None, quarter, fiscal_year))
+    results = []
+
+    # spawn: workers must not inherit the pool's sockets or Tk state
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {}
+        for (name, nie), rows in groups.items():
+            future = pool.submit(_render_colleague, rows,
+                                 *_output_paths(name, nie, quarter, fiscal_year, output_dir, formats))
+            futures[future] = name, len(rows)
+        for future in as_completed(futures):
+            name, count = futures[future]
+            try:
+                results.append((name, future.result(), None, count))
+            except Exception as e:
+                results.append((name, [], str(e), count))
+            if progress:
+                try:
+                    progress(len(results), len(futures), name)
+                except BaseException:
+                    # e.g. the run was cancelled: drop the colleagues not started yet
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+    return results
+
+def _read_period():
+    """(quarter, fiscal_year) from the form, None for blanks; None after an error message."""
     quarter_input = quarter_var.get().strip()
     fiscal_year_input = fiscal_year_var.get().strip()
 
-    try:
-        Colleague_ID = int(Colleague_ID_input) if Colleague_ID_input else None
-    except ValueError:
-        messagebox.showerror("Invalid Input", "Colleague ID must be an integer.")
-        return
     try:
         quarter = int(quarter_input) if quarter_input else None
     except ValueError:
         messagebox.showerror("Invalid Input", "Quarter must be 1–4.")
-        return
+        return None
     try:
         fiscal_year = int(fiscal_year_input) if fiscal_year_input else None
     except ValueError:
         messagebox.showerror("Invalid Input", "Fiscal Year must be valid.")
-        return
+        return None
     if quarter is not None and not (1 <= quarter <= 4):
         messagebox.showerror("Invalid Input", "Quarter must be between 1 and 4.")
-        return
+        return None
     if fiscal_year is not None and not (1900 <= fiscal_year <= 2100):
         messagebox.showerror("Invalid Input", "Fiscal Year must be 1900–2100.")
-        return
+        return None
+    return quarter, fiscal_year
 
+def _ensure_output_dir():
     if not os.path.exists(OUTPUT_DIR):
         try:
             os.makedirs(OUTPUT_DIR)
         except OSError as e:
             messagebox.showerror("Directory Error", f"Could not create output directory: {e}")
-            return
+            return False
+    return True
+
+def select_and_generate_report():
+    Colleague_ID_input = Colleague_ID_var.get().strip()
+
+    try:
+        Colleague_ID = int(Colleague_ID_input) if Colleague_ID_input else None
+    except ValueError:
+        messagebox.showerror("Invalid Input", "Colleague ID must be an integer.")
+        return
+    period = _read_period()
+    if period is None or not _ensure_output_dir():
+        return
+    quarter, fiscal_year = period
     generate_report(Colleague_ID, quarter, fiscal_year)
 
+def select_and_generate_all():
+    period = _read_period()
+    if period is None or not _ensure_output_dir():
+        return
+    quarter, fiscal_year = period
+    output_dir = OUTPUT_DIR
+
+    def work(task):
+        task.progress(0, None, "Fetching…")
+
+        def progress(done, total, name):
+            task.check()
+            task.progress(done, total, f"{done}/{total}  {name}")
+
+        return generate_all_reports(quarter, fiscal_year, output_dir, progress=progress)
+
+    def show_result(results):
+        if not results:
+            messagebox.showwarning("No Data", "No data found for the provided criteria.")
+            return
+        errors = [f"{name}: {error}" for name, _, error, _ in results if error]
+        written = sum(len(paths) for _, paths, _, _ in results)
+        message = f"{written} files generated for {len(results) - len(errors)} colleagues in:\n{output_dir}"
+        if errors:
+            messagebox.showwarning("Reports Generated", message + "\n\nFailed:\n" + "\n".join(errors[:10]))
+        else:
+            messagebox.showinfo("Reports Generated", message)
+
+    background.start(
+        all_button,
+        work,
+        on_done=show_result,
+        busy=[generate_button, all_button],
+        title="Generating All Colleague Reports",
+    )
+
 def browse_directory():
     global OUTPUT_DIR
     directory = filedialog.askdirectory(initialdir=DEFAULT_OUTPUT_DIR, title="Select Output Directory")
@@ -231,8 +334,8 @@ def browse_directory():
         OUTPUT_DIR = directory
         output_dir_var.set(OUTPUT_DIR)
 
-def main():
-    root = Tk()
+def main(master=None):
+    root = Toplevel(master) if master else Tk()
     root.title("Generate RelFactColleague Report")
 
     root.columnconfigure(1, weight=1)
@@ -259,10 +362,17 @@ def main():
     Entry(root, textvariable=output_dir_var, state="readonly").grid(row=3, column=1, padx=10, pady=5, sticky=W+E)
     Button(root, text="Browse", command=browse_directory).grid(row=3, column=2, padx=5, pady=5)
 
+    global generate_button, all_button
     generate_button = Button(root, text="Generate Report", command=select_and_generate_report)
-    generate_button.grid(row=4, column=0, columnspan=3, pady=15)
+    generate_button.grid(row=4, column=0, columnspan=3, pady=(15, 5))
+
+    # Every colleague for the quarter / year above, one file pair each
+    all_button = Button(root, text="Generate for All Colleagues", command=select_and_generate_all)
+    all_button.grid(row=5, column=0, columnspan=3, pady=(5, 10))
 
-    root.mainloop()
+    if master is None:
+        root.mainloop()
+    return root
 
 if __name__ == "__main__":
     main()
@@ -14,11 +14,17 @@ Output dir:
 
 import os
 from datetime import datetime
-from contextlib import contextmanager
 from mysql.connector import Error
-from db import get_cnx  # central DB connector
+from contextlib import closing
+from db import db_cursor, parallel_snapshot_read, snapshot_cursor  # shared pooled connection
+import schema
+import report_cache
+import background
+from core.periods import quarter_of_month
+from core.report_rows import fmt_amount, fmt_date, aeat_csv_rows
 from tkinter import (
     Tk,
+    Toplevel,
     Label,
     Button,
     OptionMenu,
@@ -28,74 +34,15 @@ from tkinter import (
     IntVar,
 )
 
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.platypus import (
-    BaseDocTemplate,
-    Frame,
-    PageTemplate,
-    Table,
-    TableStyle,
-    Paragraph,
-    Spacer,
-)
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_RIGHT
-from reportlab.pdfgen import canvas
-
-# ==========================================================
-# Context manager for automatic cleanup
-# ==========================================================
-@contextmanager
-def db_cursor(commit=False):
-    cnx = get_cnx()
-    cur = cnx.cursor(dictionary=True)
-    try:
-        yield cur
-        if commit:
-            cnx.commit()
-    except Exception as e:
-        cnx.rollback()
-        raise e
-    finally:
-        cur.close()
-        cnx.close()
-
 # ==========================================================
 # Config
 # ==========================================================
-OUTPUT_DIR = "~/Desktop/exports"
-MAX_INVOICE_NUMBER_LEN = 12  # AEAT constraint
+OUTPUT_DIR = os.path.expanduser("~/Desktop/exports")
+STREAM_BATCH = 1000          # rows per fetchmany() on the streaming CSV path
+WRITE_BUFFER = 1 << 16       # bytes buffered per output file before hitting disk
+REPORT_VERSION = 1           # bump when the output layout changes, so cached reports are rebuilt
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# ==========================================================
-# Custom Canvas Class
-# ==========================================================
-class NumberedCanvas(canvas.Canvas):
-    def __init__(self, *args, **kwargs):
-        super(NumberedCanvas, self).__init__(*args, **kwargs)
-        self._saved_page_states = []
-
-    def showPage(self):
-        self._saved_page_states.append(dict(self.__dict__))
-        self._startPage()
-
-    def save(self):
-        num_pages = len(self._saved_page_states)
-        for state in self._saved_page_states:
-            self.__dict__.update(state)
-            self._draw_footer(num_pages)
-            super(NumberedCanvas, self).showPage()
-        super(NumberedCanvas, self).save()
-
-    def _draw_footer(self, page_count):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.setFont("Helvetica", 6)
-        self.drawString(15 * mm, A4[1] - 10 * mm, f"Generated on: {timestamp}")
-        self.setFont("Helvetica", 8)
-        self.drawCentredString(A4[0] / 2.0, 15 * mm, f"{self._pageNumber}/{page_count}")
-
 # ==========================================================
 # Data Fetching
 # ==========================================================
@@ -130,106 +77,134 @@ SELECT_FALLBACK = ", ".join(
     ]
 )
 
-def fetch_data(view_name, quarter, fiscal_year):
-    try:
-        with db_cursor(commit=False) as cur:
-            try:
-                query = f"""
-                SELECT {SELECT_WITH_PROVEEDOR}
-                FROM {view_name}
-                WHERE Trimestre = %s AND Fiscal_Year = %s
-                ORDER BY NIF, Fecha_Devengo, Numero_Factura
-                """
-                cur.execute(query, (quarter, fiscal_year))
-            except Error:
-                query = f"""
-                SELECT {SELECT_FALLBACK}
-                FROM {view_name}
-                WHERE Trimestre = %s AND Fiscal_Year = %s
-                ORDER BY NIF, Fecha_Devengo, Numero_Factura
-                """
-                cur.execute(query, (quarter, fiscal_year))
-
-            rows = cur.fetchall() or []
-            norm = [{k: r.get(k, "") for k in COLUMNS} for r in rows]
-            return norm
-
-    except Error as err:
-        messagebox.showerror("Database Error", f"Error: {err}")
-        return []
+SECTIONS = [
+    ("Chancery", "Invoices_Chancery_Vat"),
+    ("Residence", "Invoices_Residence_Vat"),
+]
 
-
-# ==========================================================
-# Helpers
-# ==========================================================
-def _fmt_amount(x):
-    try:
-        return f"{float(x):,.2f}"
-    except Exception:
-        return str(x)
+# Fingerprint of one section: count and checksum of the view rows the report
+# reads for the quarter, over the columns it selects
+WATERMARK_SECTION = """
+     (SELECT COUNT(*) AS n, COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', {columns}))), 0) AS x
+      FROM {view_name} WHERE Trimestre = %s AND Fiscal_Year = %s) {alias}"""
 
 
-def _fmt_date(d):
-    # Accepts date/datetime/str; returns yyyy-mm-dd string
-    if hasattr(d, "strftime"):
-        return d.strftime("%Y-%m-%d")
-    try:
-        s = str(d)
-        return s[:10]
-    except Exception:
-        return str(d)
+def section_select(cur, view_name):
+    """The projection for view_name: the view may not expose Proveedor."""
+    if schema.has_column(cur, view_name, "Proveedor"):
+        return SELECT_WITH_PROVEEDOR
+    return SELECT_FALLBACK
 
 
-def _fmt_date_ddmmyyyy(d):
-    """Return date as dd-mm-YYYY (preferred for AEAT CSV)."""
-    if hasattr(d, "strftime"):
-        return d.strftime("%d-%m-%Y")
-    s = str(d)
-    s10 = s[:10]
-    try:
-        # Convert common YYYY-MM-DD to DD-MM-YYYY
-        if "-" in s10 and len(s10) == 10:
-            parts = s10.split("-")
-            if len(parts) == 3 and len(parts[0]) == 4:
-                y, m, d2 = parts
-                return f"{d2}-{m}-{y}"
-        # If already dd/mm/yyyy or dd-mm-yyyy, normalize to dashes
-        if "/" in s10 and len(s10) == 10:
-            return s10.replace("/", "-")
-        return s10
-    except Exception:
-        return s10
+def sections_watermark(cur, quarter, fiscal_year):
+    """
+    (sql, params) fingerprinting the rows of every section for the quarter.
+    Used by the report cache, and compared across the two snapshots of
+    read_sections() so both sections come from the same committed state.
+    """
+    parts, params = [], []
+    for k, (_, view_name) in enumerate(SECTIONS):
+        present = schema.columns(cur, view_name)
+        columns = ", ".join(c for c in COLUMNS if c.lower() in present)
+        parts.append(WATERMARK_SECTION.format(columns=columns or "NULL", view_name=view_name, alias=f"s{k}"))
+        params += [quarter, fiscal_year]
+    select = ", ".join(f"s{k}.n, s{k}.x" for k in range(len(SECTIONS)))
+    return f"SELECT {select}\nFROM" + "\nCROSS JOIN".join(parts), tuple(params)
+
+
+def report_watermark(quarter, fiscal_year):
+    """sections_watermark() for callers without a cursor (report cache, batch)."""
+    with db_cursor() as cur:
+        return sections_watermark(cur, quarter, fiscal_year)
+
+
+def _execute_view(cur, view_name, quarter, fiscal_year):
+    """Run the section query on cur, leaving the rows to be fetched by the caller."""
+    def run():
+        # The view may not expose Proveedor; pick the projection up front
+        select = section_select(cur, view_name)
+        query = f"""
+        SELECT {select}
+        FROM {view_name}
+        WHERE Trimestre = %s AND Fiscal_Year = %s
+        ORDER BY NIF, Fecha_Devengo, Numero_Factura
+        """
+        cur.execute(query, (quarter, fiscal_year))
+
+    schema.run_with_columns(cur, [view_name], run)
+
+
+def _view_reader(view_name, quarter, fiscal_year):
+    """Return a reader(cur) that selects one section's rows from view_name."""
+    def read(cur):
+        _execute_view(cur, view_name, quarter, fiscal_year)
+        rows = cur.fetchall() or []
+        return [{k: r.get(k, "") for k in COLUMNS} for r in rows]
+    return read
+
+
+def iter_report_rows(quarter, fiscal_year):
+    """
+    Yield (section, row) for Chancery then Residence, streamed from one
+    unbuffered cursor in STREAM_BATCH chunks. Both sections are read from the
+    same snapshot; memory use does not grow with the number of rows.
+    """
+    with snapshot_cursor(dictionary=True) as cur:
+        for section, view_name in SECTIONS:
+            _execute_view(cur, view_name, quarter, fiscal_year)
+            while True:
+                batch = cur.fetchmany(STREAM_BATCH)
+                if not batch:
+                    break
+                for row in batch:
+                    yield section, row
+
+
+def read_sections(quarter, fiscal_year):
+    """
+    Return (chancery_rows, residence_rows), fetched concurrently on two pooled
+    connections from snapshots of the same committed data. Errors propagate.
+    """
+    return tuple(parallel_snapshot_read(
+        [
+            _view_reader(view_name, quarter, fiscal_year)
+            for _, view_name in SECTIONS
+        ],
+        report_watermark(quarter, fiscal_year),
+        dictionary=True,
+    ))
 
 
 # ==========================================================
 # PDF Generation (Chancery first, then Residence)
 # ==========================================================
-def generate_pdf(chancery_rows, residence_rows, output_file, fiscal_year, quarter):
+def write_pdf(chancery_rows, residence_rows, output_file, fiscal_year, quarter, progress=None):
+    """
+    Render the PDF; returns output_file, or None when there is no data. Errors
+    propagate. progress(kind, value) is ReportLab's build progress callback
+    (see background.pdf_progress); it may raise to stop the build.
+    """
     if not chancery_rows and not residence_rows:
-        messagebox.showinfo("No Data", "No data for the selected period.")
-        return
+        return None
+
+    # ReportLab is only loaded once a PDF is actually requested
+    from reportlab.lib.units import mm
+    from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, Paragraph, Spacer
+    from report_pdf import PORTRAIT, STYLES, OFICIAL_COLUMNS, OFICIAL_TABLE_STYLE, NumberedCanvas, section_tables
 
     doc = BaseDocTemplate(
         output_file,
-        pagesize=A4,
+        pagesize=PORTRAIT,
         rightMargin=15 * mm,
         leftMargin=15 * mm,
         topMargin=20 * mm,
         bottomMargin=15 * mm,
     )
 
-    styles = getSampleStyleSheet()
-    total_style = ParagraphStyle(
-        name="Total",
-        parent=styles["Normal"],
-        fontSize=10,
-        alignment=TA_RIGHT,
-        spaceBefore=6,
-        spaceAfter=12,
-    )
-    h_style = styles["Heading2"]
-    h_style.spaceBefore = 6
-    h_style.spaceAfter = 6
+    total_style = STYLES["Total"]
+    h_style = STYLES["SectionHeading"]
+    cell_style = STYLES["Normal"]
+    labels, col_widths = OFICIAL_COLUMNS
 
     frame = Frame(
         doc.leftMargin, doc.bottomMargin, doc.width, doc.height - 10 * mm, id="normal"
@@ -239,26 +214,17 @@ def generate_pdf(chancery_rows, residence_rows, output_file, fiscal_year, quarte
         canvas_obj.saveState()
         canvas_obj.setFont("Helvetica-Bold", 12)
         title = f"Relación de Facturas - Modelo 362 — Q{quarter} / {fiscal_year}"
-        canvas_obj.drawString(doc.leftMargin, A4[1] - 15 * mm, title)
+        canvas_obj.drawString(doc.leftMargin, PORTRAIT[1] - 15 * mm, title)
         canvas_obj.restoreState()
 
     doc.addPageTemplates([PageTemplate(id="Report", frames=frame, onPage=header)])
+    if progress:
+        doc.setProgressCallBack(progress)
 
     elements = []
 
-    def rows_to_table(rows, start_serial=1):
-        table_header = [
-            Paragraph("Serial Nº", styles["Heading4"]),
-            Paragraph("NIF", styles["Heading4"]),
-            Paragraph("Proveedor", styles["Heading4"]),
-            Paragraph("Nº Factura", styles["Heading4"]),
-            Paragraph("Fecha Devengo", styles["Heading4"]),
-            Paragraph("Importe Total (€)", styles["Heading4"]),
-            Paragraph("Cuota IVA (€)", styles["Heading4"]),
-        ]
-        col_widths = [15 * mm, 30 * mm, 50 * mm, 35 * mm, 25 * mm, 25 * mm, 25 * mm]
-
-        data = [table_header]
+    def rows_to_tables(rows, start_serial=1):
+        body = []
         serial = start_serial
         subtotal_vat = 0.0
 
@@ -266,7 +232,7 @@ def generate_pdf(chancery_rows, residence_rows, output_file, fiscal_year, quarte
             nif = r.get("NIF", "")
             prov = r.get("Proveedor", "")
             nf = r.get("Numero_Factura", "")
-            fecha = _fmt_date(r.get("Fecha_Devengo", ""))
+            fecha = fmt_date(r.get("Fecha_Devengo", ""))
             importe = r.get("Importe_Total_Impuestos_Incluidos", 0) or 0
             cuota = r.get("Cuotas_IVA", 0) or 0
             try:
@@ -274,49 +240,30 @@ def generate_pdf(chancery_rows, residence_rows, output_file, fiscal_year, quarte
             except Exception:
                 pass
 
-            data.append(
+            body.append(
                 [
-                    Paragraph(str(serial), styles["Normal"]),
-                    Paragraph(str(nif), styles["Normal"]),
-                    Paragraph(str(prov), styles["Normal"]),
-                    Paragraph(str(nf), styles["Normal"]),
-                    Paragraph(str(fecha), styles["Normal"]),
-                    Paragraph(_fmt_amount(importe), styles["Normal"]),
-                    Paragraph(_fmt_amount(cuota), styles["Normal"]),
+                    str(serial),
+                    str(nif),
+                    str(prov),
+                    str(nf),
+                    str(fecha),
+                    fmt_amount(importe),
+                    fmt_amount(cuota),
                 ]
             )
             serial += 1
 
-        table = Table(data, colWidths=col_widths, repeatRows=1)
-        table.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                    ("ALIGN", (2, 1), (2, -1), "LEFT"),
-                    ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-                    ("FONTSIZE", (0, 0), (-1, -1), 8),
-                    ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                    (
-                        "ROWBACKGROUNDS",
-                        (0, 1),
-                        (-1, -1),
-                        [colors.white, colors.whitesmoke],
-                    ),
-                ]
-            )
-        )
-        return table, serial, subtotal_vat
+        # Large sections switch to plain-string cells and chunked tables
+        tables = section_tables(labels, col_widths, body, OFICIAL_TABLE_STYLE, cell_style)
+        return tables, serial, subtotal_vat
 
     serial = 1
     grand_total_vat = 0.0
 
     if chancery_rows:
         elements.append(Paragraph("Chancery", h_style))
-        tbl, serial, sub_vat = rows_to_table(chancery_rows, start_serial=serial)
-        elements.append(tbl)
+        tables, serial, sub_vat = rows_to_tables(chancery_rows, start_serial=serial)
+        elements.extend(tables)
         elements.append(
             Paragraph(
                 f"<b>Total Cuotas IVA (Chancery): € {sub_vat:,.2f}</b>", total_style
@@ -327,8 +274,8 @@ def generate_pdf(chancery_rows, residence_rows, output_file, fiscal_year, quarte
 
     if residence_rows:
         elements.append(Paragraph("Residence", h_style))
-        tbl, serial, sub_vat = rows_to_table(residence_rows, start_serial=serial)
-        elements.append(tbl)
+        tables, serial, sub_vat = rows_to_tables(residence_rows, start_serial=serial)
+        elements.extend(tables)
         elements.append(
             Paragraph(
                 f"<b>Total Cuotas IVA (Residence): € {sub_vat:,.2f}</b>", total_style
@@ -344,11 +291,8 @@ def generate_pdf(chancery_rows, residence_rows, output_file, fiscal_year, quarte
         )
     )
 
-    try:
-        doc.build(elements, canvasmaker=NumberedCanvas)
-        messagebox.showinfo("Success", f"PDF report generated: {output_file}")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to generate PDF: {e}")
+    doc.build(elements, canvasmaker=NumberedCanvas)
+    return output_file
 
 
 # ==========================================================
@@ -356,63 +300,133 @@ def generate_pdf(chancery_rows, residence_rows, output_file, fiscal_year, quarte
 # Required order per line:
 #   NIF; Importe_Total_Impuestos_Incluidos; Numero_Factura(<=20); Cuotas_IVA; Fecha_Devengo(dd-mm-aaaa);
 # ==========================================================
-def generate_csv(chancery_rows, residence_rows, output_file):
-    """
-    Write CSV with trailing semicolon per line; return list of truncations.
+TRUNCATION_LOG_HEADER = (
+    "section;NIF;Proveedor;Numero_Factura_Original;Numero_Factura_Truncada;Fecha_Devengo;Importe;Cuota;\n"
+)
 
-    Returns: list of dicts with keys:
-      section, NIF, Proveedor, Numero_Factura_Original, Numero_Factura_Truncada,
-      Fecha_Devengo, Importe, Cuota
+
+def write_csv(rows, output_file, log_file=None):
     """
-    if not chancery_rows and not residence_rows:
-        messagebox.showinfo("No Data", "No data for the selected period.")
-        return []
+    Stream (section, row) pairs into the CSV, one line per row with a trailing
+    semicolon. Invoice numbers longer than core.report_rows.MAX_INVOICE_NUMBER_LEN
+    are truncated and, when log_file is given, written to it as they occur (the
+    log is only created if something is truncated).
 
-    truncations = []
+    Returns (rows_written, truncated, log_error). If the CSV itself cannot be
+    written the partial file is removed and the error propagates.
+    """
+    written = truncated = 0
+    log = None
+    log_error = None
 
     try:
-        with open(output_file, mode="w", newline="", encoding="utf-8") as f:
-            for section_name, rows in (
-                ("Chancery", chancery_rows),
-                ("Residence", residence_rows),
-            ):
-                for r in rows:
-                    nif = str(r.get("NIF", ""))
-                    nf = str(r.get("Numero_Factura", ""))
-                    importe = str(r.get("Importe_Total_Impuestos_Incluidos", ""))
-                    cuota = str(r.get("Cuotas_IVA", ""))
-                    fecha = _fmt_date_ddmmyyyy(r.get("Fecha_Devengo", ""))
-
-                    original_nf = nf
-                    if len(nf) > MAX_INVOICE_NUMBER_LEN:
-                        nf = nf[:MAX_INVOICE_NUMBER_LEN]
-                        truncations.append(
-                            {
-                                "section": section_name,
-                                "NIF": nif,
-                                "Proveedor": str(r.get("Proveedor", "")),
-                                "Numero_Factura_Original": original_nf,
-                                "Numero_Factura_Truncada": nf,
-                                "Fecha_Devengo": fecha,
-                                "Importe": importe,
-                                "Cuota": cuota,
-                            }
-                        )
-
-                    # Order: NIF; Importe; Numero; Cuota; Fecha;  (trailing semicolon)
-                    vals = [nif, importe, nf, cuota, fecha]
-                    f.write(";".join(vals) + ";\n")
-
-        return truncations
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to save CSV: {e}")
-        return []
+        with open(output_file, mode="w", newline="", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+            # vals: NIF; Importe; Numero; Cuota; Fecha (core.report_rows.aeat_csv_row)
+            for section_name, r, vals, original_nf in aeat_csv_rows(rows):
+                if original_nf is not None:
+                    truncated += 1
+                    if log_file and log_error is None:
+                        try:
+                            if log is None:
+                                log = open(log_file, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER)
+                                log.write(TRUNCATION_LOG_HEADER)
+                            nif, importe, nf, cuota, fecha = vals
+                            entry = [section_name, nif, str(r.get("Proveedor", "")), original_nf, nf, fecha, importe, cuota]
+                            log.write(";".join(entry) + ";\n")
+                        except OSError as e:
+                            log_error = e
+
+                # trailing semicolon
+                f.write(";".join(vals) + ";\n")
+                written += 1
+
+    except Exception:
+        # Don't leave a half-written AEAT file behind
+        try:
+            os.remove(output_file)
+        except OSError:
+            pass
+        raise
+    finally:
+        if log is not None:
+            try:
+                log.close()
+            except OSError as e:
+                log_error = log_error or e
+
+    return written, truncated, log_error
+
+
+def sections_to_rows(chancery_rows, residence_rows):
+    """(section, row) pairs for write_csv() from already fetched sections."""
+    for section, rows in (("Chancery", chancery_rows), ("Residence", residence_rows)):
+        for row in rows:
+            yield section, row
 
 
 # ==========================================================
 # Main GUI
 # ==========================================================
-def main():
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def build_report(task, fmt, quarter, fiscal_year):
+    """
+    Background part of the report window: cached output, or fetch and
+    render. Returns (status, files, info) with status 'cached', 'no data' or
+    'generated'; errors and background.Cancelled propagate.
+    """
+    key = report_cache.cache_key("vat_oficial", quarter, fiscal_year, fmt)
+    # Same quarter, same data as last time: hand back the previous output
+    fp = report_cache.fingerprint(report_watermark(quarter, fiscal_year), REPORT_VERSION)
+    cached = report_cache.lookup(key, fp, OUTPUT_DIR)
+    if cached:
+        return "cached", cached["files"], cached["info"]
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_filename = f"VAT_Q{quarter}_{fiscal_year}_{timestamp}"
+
+    if fmt == "pdf":
+        # Fetch BOTH datasets concurrently; output stays Chancery first, then Residence
+        task.progress(0, None, "Fetching…")
+        chancery_rows, residence_rows = read_sections(quarter, fiscal_year)
+        task.check()
+        pdf_file = os.path.join(OUTPUT_DIR, base_filename + ".pdf")
+        if not write_pdf(chancery_rows, residence_rows, pdf_file, fiscal_year, quarter,
+                         progress=background.pdf_progress(task)):
+            return "no data", {}, {}
+        files, info = {"main": pdf_file}, {}
+    else:  # CSV, streamed straight from the server cursor to disk
+        csv_file = os.path.join(OUTPUT_DIR, base_filename + ".csv")
+        log_file = os.path.join(OUTPUT_DIR, base_filename + "_truncated_log.csv")
+        try:
+            with closing(iter_report_rows(quarter, fiscal_year)) as rows:
+                written, truncated, log_error = write_csv(
+                    background.watched(rows, task, STREAM_BATCH), csv_file, log_file
+                )
+        except background.Cancelled:
+            _remove(log_file)  # write_csv() already removed the CSV
+            raise
+        if not written:
+            _remove(csv_file)
+            return "no data", {}, {}
+        if log_error:
+            # incomplete log: don't cache this output
+            return "generated", {"main": csv_file}, {"log_error": log_error}
+        files, info = {"main": csv_file}, {"truncated": truncated}
+        if truncated:
+            files["log"] = log_file
+
+    report_cache.store(key, fp, files, info)
+    return "generated", files, info
+
+
+def main(master=None):
     def generate_report():
         selected_quarter = quarter_var.get()
         selected_year = year_var.get()
@@ -423,76 +437,56 @@ def main():
             )
             return
 
-        # Fetch BOTH datasets: Chancery first, then Residence
-        chancery_view = "Invoices_Chancery_Vat"
-        residence_view = "Invoices_Residence_Vat"
-
-        chancery_rows = fetch_data(chancery_view, selected_quarter, selected_year)
-        residence_rows = fetch_data(residence_view, selected_quarter, selected_year)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_filename = f"VAT_Q{selected_quarter}_{selected_year}_{timestamp}"
+        fmt = "pdf" if output_type.get() == 1 else "csv"
+        background.start(
+            root,
+            lambda task: build_report(task, fmt, selected_quarter, selected_year),
+            on_done=lambda result: show_result(fmt, *result),
+            on_error=show_error,
+            busy=[generate_button],
+            title="Generating VAT Report",
+        )
 
-        if output_type.get() == 1:  # PDF
-            pdf_file = os.path.join(OUTPUT_DIR, base_filename + ".pdf")
-            generate_pdf(
-                chancery_rows, residence_rows, pdf_file, selected_year, selected_quarter
+    def show_error(err):
+        if isinstance(err, Error):
+            messagebox.showerror("Database Error", f"Error: {err}")
+        else:
+            messagebox.showerror("Error", f"Failed to generate the report: {err}")
+
+    def show_result(fmt, status, files, info):
+        if status == "no data":
+            messagebox.showinfo("No Data", "No data for the selected period.")
+        elif status == "cached":
+            message = f"No changes since the last report for this period.\n\nFile:\n{files['main']}"
+            if "log" in files:
+                message += f"\n\nTruncated invoices logged to:\n{files['log']}\n\nTotal truncated: {info.get('truncated', 0)}"
+            messagebox.showinfo("Report up to date", message)
+        elif fmt == "pdf":
+            messagebox.showinfo("Success", f"PDF report generated: {files['main']}")
+        elif info.get("log_error"):
+            messagebox.showwarning(
+                "CSV saved (log failed)",
+                f"CSV saved to:\n{files['main']}\n\nFailed to write truncation log: {info['log_error']}",
+            )
+        elif "log" in files:
+            messagebox.showinfo(
+                "CSV saved with truncations",
+                f"CSV saved to:\n{files['main']}\n\nTruncated invoices logged to:\n{files['log']}\n\nTotal truncated: {info['truncated']}",
+            )
+        else:
+            messagebox.showinfo(
+                "Success",
+                f"CSV file saved: {files['main']}\nNo invoice numbers required truncation.",
             )
-        else:  # CSV
-            csv_file = os.path.join(OUTPUT_DIR, base_filename + ".csv")
-            truncs = generate_csv(chancery_rows, residence_rows, csv_file)
-
-            # If any truncations occurred, persist a log next to the CSV
-            if truncs:
-                log_file = os.path.join(
-                    OUTPUT_DIR, base_filename + "_truncated_log.csv"
-                )
-                try:
-                    with open(log_file, "w", encoding="utf-8", newline="") as lf:
-                        # header
-                        lf.write(
-                            "section;NIF;Proveedor;Numero_Factura_Original;Numero_Factura_Truncada;Fecha_Devengo;Importe;Cuota;\n"
-                        )
-                        for t in truncs:
-                            lf.write(
-                                ";".join(
-                                    [
-                                        str(t["section"]),
-                                        str(t["NIF"]),
-                                        str(t["Proveedor"]),
-                                        str(t["Numero_Factura_Original"]),
-                                        str(t["Numero_Factura_Truncada"]),
-                                        str(t["Fecha_Devengo"]),
-                                        str(t["Importe"]),
-                                        str(t["Cuota"]),
-                                    ]
-                                )
-                                + ";\n"
-                            )
-                    messagebox.showinfo(
-                        "CSV saved with truncations",
-                        f"CSV saved to:\n{csv_file}\n\nTruncated invoices logged to:\n{log_file}\n\nTotal truncated: {len(truncs)}",
-                    )
-                except Exception as e:
-                    messagebox.showwarning(
-                        "CSV saved (log failed)",
-                        f"CSV saved to:\n{csv_file}\n\nFailed to write truncation log: {e}",
-                    )
-            else:
-                messagebox.showinfo(
-                    "Success",
-                    f"CSV file saved: {csv_file}\nNo invoice numbers required truncation.",
-                )
 
-    root = Tk()
+    root = Toplevel(master) if master else Tk()
     root.title("Generate VAT Report (Chancery → Residence)")
 
     # Quarter selector (default to current quarter)
     quarter_var = StringVar()
     Label(root, text="Select Quarter:").pack(pady=5)
     quarters = ["1", "2", "3", "4"]
-    month = datetime.now().month
-    current_quarter = str((month - 1) // 3 + 1)
+    current_quarter = str(quarter_of_month(datetime.now().month))
     quarter_var.set(current_quarter)
     OptionMenu(root, quarter_var, *quarters).pack()
 
@@ -512,9 +506,12 @@ def main():
         root, text="LibreOffice Calc (CSV)", variable=output_type, value=2
     ).pack()
 
-    Button(root, text="Generate Report", command=generate_report).pack(pady=20)
+    generate_button = Button(root, text="Generate Report", command=generate_report)
+    generate_button.pack(pady=20)
 
-    root.mainloop()
+    if master is None:
+        root.mainloop()
+    return root
 
 
 if __name__ == "__main__":
@@ -2,55 +2,15 @@
 import os, csv
 from pathlib import Path
 from datetime import datetime
-from contextlib import contextmanager
-from mysql.connector import DBError
-from db import get_cnx  # central DB connector
-from tkinter import Tk, Label, Button, OptionMenu, StringVar, Radiobutton, IntVar, messagebox
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_RIGHT
-from reportlab.pdfgen import canvas
-
-# ==========================================================
-# Context manager for automatic cleanup
-# ==========================================================
-@contextmanager
-def db_cursor(commit=False):
-    cnx = get_cnx()
-    cur = cnx.cursor()
-    try:
-        yield cur
-        if commit:
-            cnx.commit()
-    except Exception as e:
-        cnx.rollback()
-        raise e
-    finally:
-        cur.close()
-        cnx.close()
-
-# ==========================================================
-# Canvas with Page Numbers
-# ==========================================================
-
-class NumberedCanvas(canvas.Canvas):
-    def __init__(self,*a,**k):
-        super().__init__(*a,**k); self._saved=[]
-    def showPage(self):
-        self._saved.append(dict(self.__dict__)); self._startPage()
-    def save(self):
-        n=len(self._saved)
-        for st in self._saved:
-            self.__dict__.update(st); self._draw(n); super().showPage()
-        super().save()
-    def _draw(self,n):
-        ts=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        w,h=self._pagesize
-        self.setFont("Helvetica",6); self.drawString(15*mm,h-10*mm,f"Generated on: {ts}")
-        self.setFont("Helvetica",8); self.drawCentredString(w/2,15*mm,f"{self._pageNumber}/{n}")
+from mysql.connector import Error as DBError
+from db import db_cursor, snapshot_cursor  # shared pooled connection
+from link_summary import OFFICES
+import link_summary
+import schema
+import report_cache
+import background
+from core.report_rows import voucher_csv_row
+from tkinter import Tk, Toplevel, Label, Button, OptionMenu, StringVar, Radiobutton, IntVar, messagebox
 
 # ==========================================================
 # Output Directory setup
@@ -58,130 +18,174 @@ class NumberedCanvas(canvas.Canvas):
 
 OUT_DIR = Path.home()/ "Desktop" / "exports"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
+REPORT_VERSION = 2  # bump when the output layout changes, so cached reports are rebuilt
 
 # ==========================================================
-# Fetch Chancery Data
+# Queries
 # ==========================================================
-def fetch_chancery_data(quarter, fiscal_year):
-    try:
-        with db_cursor() as cur:
-            query = """ 
-            SELECT
-            n.Supplier_Name                          AS Proveedor,
-            i.`Number`                               AS Numero_Factura,
-            i.Date                                   AS Fecha_Devengo,
-            i.Total                                  AS Importe_Total_Impuestos_Incluidos,
-            i.Vat                                    AS Cuotas_IVA,
-            GROUP_CONCAT(DISTINCT v.Voucher_Number ORDER BY v.Voucher_Number SEPARATOR ', ') AS Voucher_Numbers,
-            MAX(ha.Head_of_Accounts_Name)            AS Head_of_Accounts
-            FROM Invoices_Chancery i
-            LEFT JOIN NIF_Codes n          ON n.Supplier_ID = i.Supplier_ID
-            LEFT JOIN Vouchers_Chancery vc ON vc.Invoice_ID = i.ID
-            LEFT JOIN Vouchers v           ON v.Voucher_ID = vc.Voucher_ID
-            LEFT JOIN Head_of_Accounts ha  ON ha.Head_of_Accounts_ID = v.Head_of_Accounts_ID
-            WHERE QUARTER(i.Date) = %s AND YEAR(i.Date) = %s AND i.Refundable = 1
-            GROUP BY i.ID, n.Supplier_Name, i.`Number`, i.Date, i.Total, i.Vat
-            ORDER BY n.Supplier_Name ASC, i.Date ASC, i.`Number` ASC;
-            """
-            cur.execute(query, (quarter, fiscal_year))
-            return cur.fetchall()
-    except DBError as e:
-        messagebox.showerror("Database Error", f"Error fetching Chancery Data: {e}")
-        return []
+STREAM_BATCH = 1000  # rows per fetchmany() while streaming the report
+
+# One office's section. Voucher numbers and head of accounts come from the
+# Invoice_Voucher_Links summary (see link_summary.py), one row per invoice,
+# so there is nothing left to group.
+# Year/Quarter are the stored generated columns, so the filter can use
+# IDX_I*_Year_Quarter_Refundable (db/init/002); QUARTER(i.Date) would not.
+SECTION_QUERY = """
+    SELECT
+    {office_no}                              AS Office,
+    n.Supplier_Name                          AS Proveedor,
+    i.`Number`                               AS Numero_Factura,
+    i.Date                                   AS Fecha_Devengo,
+    i.Total                                  AS Importe_Total_Impuestos_Incluidos,
+    i.Vat                                    AS Cuotas_IVA,
+    s.Voucher_Numbers                        AS Voucher_Numbers,
+    s.Head_of_Accounts                       AS Head_of_Accounts
+    FROM {invoices} i
+    LEFT JOIN NIF_Codes n              ON n.Supplier_ID = i.Supplier_ID
+    LEFT JOIN Invoice_Voucher_Links s  ON s.Office = '{office}' AND s.Invoice_ID = i.ID
+    WHERE i.Year = %s AND i.Quarter = %s AND i.Refundable = 1
+"""
+
+
+def section_query(office):
+    """SECTION_QUERY for one office; its rows carry the office's position in OFFICES."""
+    invoices, _ = OFFICES[office]
+    return SECTION_QUERY.format(office_no=list(OFFICES).index(office), office=office, invoices=invoices)
+
+
+def report_query():
+    """
+    Every office's section in one statement, ordered office by office and
+    then as the report lists them. Takes (fiscal_year, quarter) per office.
+    """
+    sections = "\n    UNION ALL\n".join(f"({section_query(office)})" for office in OFFICES)
+    return sections + "\n    ORDER BY Office, Proveedor, Fecha_Devengo, Numero_Factura"
+
+
+# Fingerprint of the data behind one quarter's report (see report_cache.py)
+SECTIONS_WATERMARK = """
+SELECT c.n, c.m, c.x, r.n, r.m, r.x, v.n, v.m, v.x, lc.n, lc.x, lr.n, lr.x, s.n, s.x, h.n, h.m, h.x
+FROM (SELECT COUNT(*) AS n, COALESCE(MAX(ID), 0) AS m,
+             COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', ID, Supplier_ID, Number, Date, Total, Vat, Refundable))), 0) AS x
+      FROM Invoices_Chancery WHERE Year = %s AND Quarter = %s) c
+CROSS JOIN
+     (SELECT COUNT(*) AS n, COALESCE(MAX(ID), 0) AS m,
+             COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', ID, Supplier_ID, Number, Date, Total, Vat, Refundable))), 0) AS x
+      FROM Invoices_Residence WHERE Year = %s AND Quarter = %s) r
+CROSS JOIN
+     (SELECT COUNT(*) AS n, COALESCE(MAX(Voucher_ID), 0) AS m,
+             COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Voucher_ID, Voucher_Number, Head_of_Accounts_ID))), 0) AS x
+      FROM Vouchers) v
+CROSS JOIN
+     (SELECT COUNT(*) AS n, COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Invoice_ID, Voucher_ID))), 0) AS x
+      FROM Vouchers_Chancery) lc
+CROSS JOIN
+     (SELECT COUNT(*) AS n, COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Invoice_ID, Voucher_ID))), 0) AS x
+      FROM Vouchers_Residence) lr
+CROSS JOIN
+     (SELECT COUNT(*) AS n, COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Supplier_ID, Supplier_Name))), 0) AS x
+      FROM NIF_Codes) s
+CROSS JOIN
+     (SELECT COUNT(*) AS n, COALESCE(MAX(Head_of_Accounts_ID), 0) AS m,
+             COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', Head_of_Accounts_ID, {head_name}))), 0) AS x
+      FROM Head_of_Accounts) h
+"""
+
+
+def sections_watermark(cur, quarter, fiscal_year):
+    """(sql, params) of SECTIONS_WATERMARK, with the head-of-accounts name column looked up via schema.py."""
+    column = schema.pick_column(cur, "Head_of_Accounts", "Head_of_Accounts_Name", "Name")
+    sql = SECTIONS_WATERMARK.format(head_name=f"`{column}`" if column else "NULL")
+    return sql, (fiscal_year, quarter, fiscal_year, quarter)
+
+
+def report_watermark(quarter, fiscal_year):
+    """sections_watermark() for callers without a cursor (report cache, batch)."""
+    with db_cursor() as cur:
+        return sections_watermark(cur, quarter, fiscal_year)
 
 # ==========================================================
-# Fetch Residence Data
+# Fetch both sections in one round trip
 # ==========================================================
-def fetch_residence_data(quarter, fiscal_year):
-    try:
-        with db_cursor() as cur:
-            query = """ 
-            SELECT
-            n.Supplier_Name                          AS Proveedor,
-            i.`Number`                               AS Numero_Factura,
-            i.Date                                   AS Fecha_Devengo,
-            i.Total                                  AS Importe_Total_Impuestos_Incluidos,
-            i.Vat                                    AS Cuotas_IVA,
-            GROUP_CONCAT(DISTINCT v.Voucher_Number ORDER BY v.Voucher_Number SEPARATOR ', ') AS Voucher_Numbers,
-            MAX(ha.Head_of_Accounts_Name)            AS Head_of_Accounts
-            FROM Invoices_Residence i
-            LEFT JOIN NIF_Codes n          ON n.Supplier_ID = i.Supplier_ID
-            LEFT JOIN Vouchers_Chancery vc ON vc.Invoice_ID = i.ID
-            LEFT JOIN Vouchers v           ON v.Voucher_ID = vc.Voucher_ID
-            LEFT JOIN Head_of_Accounts ha  ON ha.Head_of_Accounts_ID = v.Head_of_Accounts_ID
-            WHERE QUARTER(i.Date) = %s AND YEAR(i.Date) = %s AND i.Refundable = 1
-            GROUP BY i.ID, n.Supplier_Name, i.`Number`, i.Date, i.Total, i.Vat
-            ORDER BY n.Supplier_Name ASC, i.Date ASC, i.`Number` ASC;
-            """
-            cur.execute(query, (quarter, fiscal_year))
-            return cur.fetchall()
-    except DBError as e:
-        messagebox.showerror("Database Error", f"Error fetching Residence Data: {e}")
-        return []
+def iter_report_rows(quarter, fiscal_year):
+    """
+    Yield (office, row) for every office in OFFICES order, rows already in
+    report order, streamed from one unbuffered cursor in STREAM_BATCH chunks.
+    """
+    offices = list(OFFICES)
+    # Bring this quarter's link summary up to date first; only rebuilds it
+    # when its links changed since the last sync
+    with db_cursor(commit=True) as cur:
+        link_summary.sync(cur, (fiscal_year, quarter))
+
+    with snapshot_cursor() as cur:
+        cur.execute(report_query(), (fiscal_year, quarter) * len(offices))
+        while True:
+            batch = cur.fetchmany(STREAM_BATCH)
+            if not batch:
+                break
+            for row in batch:
+                yield offices[row[0]], row[1:]
+
+
+def read_sections(quarter, fiscal_year):
+    """(chancery_data, residence_data) from a single query. Errors propagate."""
+    sections = {office: [] for office in OFFICES}
+    for office, row in iter_report_rows(quarter, fiscal_year):
+        sections[office].append(row)
+    return tuple(sections.values())
 
 # ==========================================================
 # PDF Generation
 # ==========================================================
-def generate_pdf(chancery_data, residence_data, output_file, fiscal_year, quarter):
+def write_pdf(chancery_data, residence_data, output_file, fiscal_year, quarter, progress=None):
+    """
+    Render the PDF; returns output_file, or None when there is no data. Errors
+    propagate. progress(kind, value) is ReportLab's build progress callback.
+    """
     if not chancery_data and not residence_data:
-        messagebox.showinfo("No Data", "No data for the selected period.")
-        return
+        return None
+
+    # ReportLab is only loaded once a PDF is actually requested
+    from reportlab.lib.units import mm
+    from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, Paragraph, Spacer, PageBreak
+    from report_pdf import LANDSCAPE, STYLES, VOUCHER_COLUMNS, VOUCHER_TABLE_STYLE, NumberedCanvas, section_tables
 
     doc = BaseDocTemplate(
         output_file,
-        pagesize=landscape(A4),
+        pagesize=LANDSCAPE,
         rightMargin=15 * mm,
         leftMargin=15 * mm,
         topMargin=15 * mm,
         bottomMargin=15 * mm
     )
-    styles = getSampleStyleSheet()
-    total_style = ParagraphStyle(name='Total', parent=styles['Normal'], fontSize=8, alignment=TA_RIGHT, spaceAfter=6)
+    styles = STYLES
+    total_style = styles['TotalSmall']
     elements = []
 
     # Shared Table settings
-    col_widths = [70 * mm, 40 * mm, 30 * mm, 30 * mm, 30 * mm, 30 * mm, 40 * mm]
-    t_style = TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
-        ('FONTSIZE', (0, 0), (-1, -1), 7),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
-    ])
+    labels, col_widths = VOUCHER_COLUMNS
 
     def create_table_section(data, title, label):
         elements.append(Paragraph(f"{title} (Modelo 362)", styles['Title']))
         elements.append(Spacer(1, 12))
         
-        table_header = [
-            Paragraph("Proveedor", styles['Heading4']),
-            Paragraph("Nº Factura", styles['Heading4']),
-            Paragraph("Fecha Devengo", styles['Heading4']),
-            Paragraph("Importe Total (€)", styles['Heading4']),
-            Paragraph("Cuota IVA (€)", styles['Heading4']),
-            Paragraph("Voucher Nº", styles['Heading4']),
-            Paragraph("Head of Accounts", styles['Heading4'])
-        ]
-        table_data = [table_header]
+        body = []
         total_vat = 0
         for row in data:
-            table_data.append([
-                Paragraph(str(row[0]), styles['Normal']),
-                Paragraph(str(row[1]), styles['Normal']),
-                Paragraph(str(row[2]), styles['Normal']),
-                Paragraph(f"{row[3]:,.2f}", styles['Normal']),
-                Paragraph(f"{row[4]:,.2f}", styles['Normal']),
-                Paragraph("" if row[5] is None else str(row[5]), styles['Normal']),
-                Paragraph(str(row[6]), styles['Normal'])
+            body.append([
+                str(row[0]),
+                str(row[1]),
+                str(row[2]),
+                f"{row[3]:,.2f}",
+                f"{row[4]:,.2f}",
+                "" if row[5] is None else str(row[5]),
+                str(row[6])
             ])
             total_vat += row[4]
 
-        table = Table(table_data, colWidths=col_widths, repeatRows=1)
-        table.setStyle(t_style)
-        elements.append(table)
+        # Large sections switch to plain-string cells and chunked tables
+        elements.extend(section_tables(labels, col_widths, body, VOUCHER_TABLE_STYLE, styles['Normal']))
         elements.append(Spacer(1, 6))
         elements.append(Paragraph(f"<b>Total Cuotas IVA ({label}): € {total_vat:,.2f}</b>", total_style))
 
@@ -198,73 +202,107 @@ def generate_pdf(chancery_data, residence_data, output_file, fiscal_year, quarte
         canvas_obj.saveState()
         canvas_obj.setFont('Helvetica-Bold', 10)
         header_text = "Relación de Facturas de IVA"
-        canvas_obj.drawString(doc_obj.leftMargin, landscape(A4)[1] - 15 * mm, header_text)
+        canvas_obj.drawString(doc_obj.leftMargin, LANDSCAPE[1] - 15 * mm, header_text)
         canvas_obj.restoreState()
 
     frame = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height - 20 * mm)
     doc.addPageTemplates([PageTemplate(id='Report', frames=frame, onPage=header_footer)])
+    if progress:
+        doc.setProgressCallBack(progress)
 
-    try:
-        doc.build(elements, canvasmaker=NumberedCanvas) 
-        messagebox.showinfo("Success", f"PDF report generated: {output_file}")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to generate PDF: {e}")
+    doc.build(elements, canvasmaker=NumberedCanvas)
+    return output_file
 
 # ==========================================================
 # CSV Generation
 # ==========================================================
-def generate_csv(chancery_data, residence_data, output_file):
+def write_csv(chancery_data, residence_data, output_file):
+    """Write the CSV; returns output_file, or None when there is no data. Errors propagate."""
     if not chancery_data and not residence_data:
-        messagebox.showinfo("No Data", "No data for the selected period.")
-        return
+        return None
     headers = ["Proveedor", "Numero_Factura", "Fecha_Devengo", "Importe_Total_Impuestos_Incluidos", "Cuotas_IVA", "Voucher_Number", "Head_of_Accounts"]
-    try:
-        with open(output_file, mode="w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f, delimiter=";")
-            writer.writerow(headers)
-            
-            if chancery_data:
-                writer.writerow(["--- CHANCERY DATA ---"])
-                for row in chancery_data:
-                    r = list(row)
-                    r[5] = "" if r[5] is None else r[5]
-                    writer.writerow(r)
-            
-            if residence_data:
-                writer.writerow(["--- RESIDENCE DATA ---"])
-                for row in residence_data:
-                    r = list(row)
-                    r[5] = "" if r[5] is None else r[5]
-                    writer.writerow(r)
-        messagebox.showinfo("Success", f"CSV file saved: {output_file}")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to save CSV: {e}")
+    with open(output_file, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(headers)
+        
+        if chancery_data:
+            writer.writerow(["--- CHANCERY DATA ---"])
+            for row in chancery_data:
+                writer.writerow(voucher_csv_row(row))
+        
+        if residence_data:
+            writer.writerow(["--- RESIDENCE DATA ---"])
+            for row in residence_data:
+                writer.writerow(voucher_csv_row(row))
+    return output_file
 
 # ==========================================================
 # Main GUI
 # ==========================================================
-def main():
+def build_report(task, fmt, quarter, fiscal_year):
+    """
+    Background part of the report window: cached output, or fetch and
+    render. Returns (status, output file) with status 'cached', 'no data' or
+    'generated'; errors and background.Cancelled propagate.
+    """
+    # Same quarter, same data as last time: hand back the previous output
+    key = report_cache.cache_key("vat_vouchers", quarter, fiscal_year, fmt)
+    fp = report_cache.fingerprint(report_watermark(quarter, fiscal_year), REPORT_VERSION)
+    cached = report_cache.lookup(key, fp, OUT_DIR)
+    if cached:
+        return "cached", cached["files"]["main"]
+
+    task.progress(0, None, "Fetching…")
+    chancery_data, residence_data = read_sections(quarter, fiscal_year)
+    task.check()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_filename = f"Vouchers_Q{quarter}_{fiscal_year}_{timestamp}"
+    if fmt == "pdf":
+        output = write_pdf(chancery_data, residence_data, os.path.join(OUT_DIR, base_filename + ".pdf"),
+                           fiscal_year, quarter, progress=background.pdf_progress(task))
+    else:
+        output = write_csv(chancery_data, residence_data, os.path.join(OUT_DIR, base_filename + ".csv"))
+    if not output:
+        return "no data", None
+    report_cache.store(key, fp, {"main": output})
+    return "generated", output
+
+def main(master=None):
     def generate_report():
         selected_quarter = quarter_var.get()
         selected_year = year_var.get()
         if not selected_quarter or not selected_year:
             messagebox.showwarning("Input Required", "Please select both quarter and fiscal year.")
             return
-        
-        chancery_data = fetch_chancery_data(selected_quarter, selected_year)
-        residence_data = fetch_residence_data(selected_quarter, selected_year)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_filename = f"Vouchers_Q{selected_quarter}_{selected_year}_{timestamp}"
-        
-        if output_type.get() == 1:
-            pdf_file = os.path.join(OUT_DIR, base_filename + ".pdf")
-            generate_pdf(chancery_data, residence_data, pdf_file, selected_year, selected_quarter)
+
+        fmt = "pdf" if output_type.get() == 1 else "csv"
+        background.start(
+            root,
+            lambda task: build_report(task, fmt, selected_quarter, selected_year),
+            on_done=lambda result: show_result(fmt, *result),
+            on_error=show_error,
+            busy=[generate_button],
+            title="Generating Vouchers Report",
+        )
+
+    def show_error(e):
+        if isinstance(e, DBError):
+            messagebox.showerror("Database Error", f"Error fetching report data: {e}")
+        else:
+            messagebox.showerror("Error", f"Failed to generate the report: {e}")
+
+    def show_result(fmt, status, output):
+        if status == "cached":
+            messagebox.showinfo("Report up to date", f"No changes since the last report for this period.\n\nFile:\n{output}")
+        elif status == "no data":
+            messagebox.showinfo("No Data", "No data for the selected period.")
+        elif fmt == "pdf":
+            messagebox.showinfo("Success", f"PDF report generated: {output}")
         else:
-            csv_file = os.path.join(OUT_DIR, base_filename + ".csv")
-            generate_csv(chancery_data, residence_data, csv_file)
+            messagebox.showinfo("Success", f"CSV file saved: {output}")
 
-    root = Tk()
+    root = Toplevel(master) if master else Tk()
     root.title("Generate Vat Vouchers Report")
     
     quarter_var = StringVar()
@@ -282,8 +320,11 @@ def main():
     Radiobutton(root, text="PDF", variable=output_type, value=1).pack()
     Radiobutton(root, text="LibreOffice Calc (CSV)", variable=output_type, value=2).pack()
     
-    Button(root, text="Generate Report", command=generate_report).pack(pady=20)
-    root.mainloop()
+    generate_button = Button(root, text="Generate Report", command=generate_report)
+    generate_button.pack(pady=20)
+    if master is None:
+        root.mainloop()
+    return root
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
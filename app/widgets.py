@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import threading
+from tkinter import ttk
+from completion import CompletionIndex
+
+# ==========================================================
+# Autocomplete Combobox Class
+# ==========================================================
+class AutocompleteCombobox(ttk.Combobox):
+    """
+    A Combobox with autocompletion.
+
+    Matches come from a CompletionIndex instead of a scan of the whole list,
+    lookups are debounced while the user is still typing, and at most
+    MAX_RESULTS entries (matches, or the start of the full list) are pushed
+    into the Tk widget. A readonly combobox cannot be typed into, so it
+    always lists every entry.
+    """
+    DEBOUNCE_MS = 120
+    MAX_RESULTS = 50
+
+    def set_completion_list(self, completion_list):
+        self._index = CompletionIndex(completion_list)
+        self._pending = None
+        self._show_all()
+        # Mid-word lookups need the trigram index; build it off the event loop
+        threading.Thread(target=self._index.warm, daemon=True).start()
+        self.bind('<KeyRelease>', self._handle_keyrelease)
+
+    def add_completion(self, item):
+        """Add a single entry without rebuilding the index (or copying the list)."""
+        if self._index.add(item) and self._showing_all:
+            self._show_all()
+
+    def _show_all(self):
+        if str(self['state']) == 'readonly':
+            # No typing to narrow it down: every entry has to be in the list
+            self['values'] = self._index.items()
+        else:
+            # The first MAX_RESULTS entries; typing narrows the list down from there
+            self['values'] = self._index.items(self.MAX_RESULTS)
+        self._showing_all = True
+
+    def _handle_keyrelease(self, event):
+        if event.keysym in ("BackSpace", "Left", "Right", "Up", "Down", "Return", "Escape"):
+            return
+        if self._pending:
+            self.after_cancel(self._pending)
+        self._pending = self.after(self.DEBOUNCE_MS, self._refresh_matches)
+
+    def _refresh_matches(self):
+        self._pending = None
+        value = self.get()
+        matches = self._index.search(value, self.MAX_RESULTS) if value.strip() else []
+        if matches:
+            self['values'] = matches
+            self._showing_all = False
+            self.event_generate('<Down>')
+        elif not self._showing_all:
+            self._show_all()
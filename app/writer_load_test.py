@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Multi-writer load test for the entry screens' write path.
+
+Builds a scratch database from db/init/*.sql (as explain_check.py does) and
+runs --writers threads at once, each on its own pooled connection, through
+the same functions the screens call (invoices.write_transaction() and
+write_supplier()):
+
+  distinct   every writer submits its own invoices, each with a voucher;
+             every submit must land and no row lock wait may occur
+  colliding  every writer submits the same invoice numbers and suppliers;
+             each must land exactly once and every other attempt must come
+             back as a Duplicate naming that number (duplicates.py)
+
+Afterwards the tables are counted against the successful submits, so a lost
+or doubled write fails the run. Lock waits are read from SHOW GLOBAL STATUS
+(Innodb_row_lock_waits), which is server-wide: run it on a quiet server.
+Deadlocks and lock wait timeouts show up as unexpected errors.
+
+Needs an account that may create databases, e.g.:
+  DB_USER=root DB_PASS=... python writer_load_test.py
+  python writer_load_test.py --writers 16 --submits 500 --keep
+
+Exit status: 0 when every check passes, 1 otherwise.
+"""
+
+import os
+import sys
+import argparse
+import threading
+from datetime import date
+from decimal import Decimal
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+from mysql.connector import Error
+from db import db_config, db_cursor
+from explain_check import create_database
+import duplicates
+import invoices
+
+DEFAULT_DATABASE = "vat_refunder_load"
+DEFAULT_WRITERS = 8
+DEFAULT_SUBMITS = 200         # per writer and phase
+START_WAIT_SECONDS = 30
+
+
+def use_database(name, writers):
+    """Point db_config(), and so the pool created on first use, at the scratch database."""
+    url = os.getenv("MYSQL_CONNECTION")
+    if url:
+        os.environ["MYSQL_CONNECTION"] = urlparse(url)._replace(path="/" + name).geturl()
+    else:
+        os.environ["DB_NAME"] = name
+    os.environ["DB_POOL_SIZE"] = str(writers)  # one connection per writer, nobody waits on the pool
+
+
+def seed():
+    with db_cursor(commit=True) as cur:
+        cur.execute("INSERT INTO Head_of_Accounts (Name) VALUES ('Load test')")
+        head_id = cur.lastrowid
+        cur.execute(invoices.SUPPLIER_INSERT, ("LOAD-NIF", "Load test supplier"))
+        supplier_id = cur.lastrowid
+    return supplier_id, head_id
+
+
+def row_lock_waits():
+    with db_cursor() as cur:
+        cur.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_waits'")
+        return int(cur.fetchone()[1])
+
+
+# ==========================================================
+# Writers
+# ==========================================================
+def invoice_row(supplier_id, number, day):
+    total = Decimal("121.00") + day
+    return (supplier_id, number, date(2024, 1, 1 + day % 28), total, Decimal("21.00"), 1, "Processed", 1)
+
+
+def distinct_writer(writer, submits, supplier_id, head_id, start):
+    """Own numbers only; returns (successes, unexpected errors)."""
+    ok, errors = 0, []
+    start.wait(START_WAIT_SECONDS)
+    for k in range(submits):
+        office = "Chancery" if k % 2 else "Residence"
+        voucher = (f"L{writer:02d}{k:06d}", head_id, "Load test", Decimal("21.00"), 1, 2024)
+        try:
+            invoices.write_transaction(office, [invoice_row(supplier_id, f"W{writer:02d}-{k:06d}", k)], [voucher])
+            ok += 1
+        except Error as e:
+            errors.append(str(e))
+    return ok, errors
+
+
+def colliding_writer(writer, submits, supplier_id, start):
+    """
+    Numbers every writer also submits; returns (numbers inserted, numbers
+    reported as duplicates, unexpected errors).
+    """
+    inserted, reported, errors = [], [], []
+    start.wait(START_WAIT_SECONDS)
+    for k in range(submits):
+        attempts = (
+            (f"C-{k:06d}", lambda n=f"C-{k:06d}": invoices.write_transaction(
+                "Chancery", [invoice_row(supplier_id, n, k)], [])),
+            (f"NIF-{k:06d}", lambda n=f"NIF-{k:06d}": invoices.write_supplier(n, f"Supplier {n}")),
+        )
+        for number, attempt in attempts:
+            try:
+                attempt()
+                inserted.append(number)
+            except Error as e:
+                dup = duplicates.duplicate(e)
+                if dup and dup.value == number:
+                    reported.append(number)
+                else:
+                    errors.append(str(e))
+    return inserted, reported, errors
+
+
+def run_writers(target, writers, *args):
+    start = threading.Barrier(writers)
+    with ThreadPoolExecutor(max_workers=writers, thread_name_prefix="writer") as ex:
+        futures = [ex.submit(target, w, *args, start) for w in range(writers)]
+        return [f.result() for f in futures]
+
+
+def count(sql):
+    with db_cursor() as cur:
+        cur.execute(sql)
+        return cur.fetchone()[0]
+
+
+# ==========================================================
+# Phases: each returns a list of failures
+# ==========================================================
+def distinct_phase(writers, submits, supplier_id, head_id):
+    waits = row_lock_waits()
+    results = run_writers(distinct_writer, writers, submits, supplier_id, head_id)
+    waits = row_lock_waits() - waits
+
+    ok = sum(n for n, _ in results)
+    errors = [e for _, errs in results for e in errs]
+    stored = {
+        "invoices": count("SELECT (SELECT COUNT(*) FROM Invoices_Chancery WHERE Number LIKE 'W%') "
+                          "+ (SELECT COUNT(*) FROM Invoices_Residence WHERE Number LIKE 'W%')"),
+        "vouchers": count("SELECT COUNT(*) FROM Vouchers WHERE Voucher_Number LIKE 'L%'"),
+        "links": count("SELECT (SELECT COUNT(*) FROM Vouchers_Chancery) + (SELECT COUNT(*) FROM Vouchers_Residence)"),
+        "link summary": count("SELECT COUNT(*) FROM Invoice_Voucher_Links"),
+    }
+    print(f"distinct:  {ok}/{writers * submits} submits, {len(errors)} error(s), {waits} row lock wait(s)")
+
+    failures = [f"distinct: {e}" for e in errors[:10]]
+    if ok != writers * submits:
+        failures.append(f"distinct: {writers * submits - ok} submit(s) failed")
+    failures += [f"distinct: {n} {what} stored for {ok} submits"
+                 for what, n in stored.items() if n != ok]
+    if waits:
+        failures.append(f"distinct: {waits} row lock wait(s)")
+    return failures
+
+
+def colliding_phase(writers, submits, supplier_id):
+    waits = row_lock_waits()
+    results = run_writers(colliding_writer, writers, submits, supplier_id)
+    waits = row_lock_waits() - waits
+
+    inserted = [n for ins, _, _ in results for n in ins]
+    reported = [n for _, rep, _ in results for n in rep]
+    errors = [e for _, _, errs in results for e in errs]
+    expected = {f"{prefix}{k:06d}" for k in range(submits) for prefix in ("C-", "NIF-")}
+    print(f"colliding: {len(inserted)} inserted, {len(reported)} duplicate(s) reported, "
+          f"{len(errors)} error(s), {waits} row lock wait(s) (expected: losers wait for the winner)")
+
+    failures = [f"colliding: {e}" for e in errors[:10]]
+    if sorted(inserted) != sorted(expected):
+        failures.append(f"colliding: {len(inserted)} numbers inserted, expected each of {len(expected)} once")
+    if len(reported) != len(expected) * (writers - 1):
+        failures.append(f"colliding: {len(reported)} duplicates reported, expected {len(expected) * (writers - 1)}")
+    for what, sql in (
+        ("invoices", "SELECT COUNT(*) FROM Invoices_Chancery WHERE Number LIKE 'C-%'"),
+        ("suppliers", "SELECT COUNT(*) FROM NIF_Codes WHERE Supplier_NIF_Code LIKE 'NIF-%'"),
+    ):
+        n = count(sql)
+        if n != submits:
+            failures.append(f"colliding: {n} {what} stored, expected {submits}")
+    return failures
+
+
+# ==========================================================
+# Main
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run concurrent writers against a scratch database.")
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help=f"scratch database (default {DEFAULT_DATABASE})")
+    parser.add_argument("--writers", type=int, default=DEFAULT_WRITERS, help="concurrent writers (2-32)")
+    parser.add_argument("--submits", type=int, default=DEFAULT_SUBMITS, help="submits per writer and phase")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch database afterwards")
+    args = parser.parse_args(argv)
+    if not 2 <= args.writers <= 32:
+        parser.error("--writers must be between 2 and 32 (the pool limit)")
+
+    config = db_config()
+    if args.database == config.get("database"):
+        parser.error("the scratch database must not be the application database")
+    config.pop("database", None)
+
+    try:
+        cnx = mysql.connector.connect(**config)
+    except Error as e:
+        print(f"Cannot connect: {e}", file=sys.stderr)
+        return 1
+    try:
+        create_database(cnx, args.database)
+        use_database(args.database, args.writers)
+        supplier_id, head_id = seed()
+        failures = distinct_phase(args.writers, args.submits, supplier_id, head_id)
+        failures += colliding_phase(args.writers, args.submits, supplier_id)
+    except Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        failures = [str(e)]
+    finally:
+        if not args.keep:
+            try:
+                cnx.cursor().execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+            except Error:
+                pass
+        cnx.close()
+
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    print("No lost updates, no lock waits." if not failures else f"{len(failures)} check(s) failed.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+-- ============================================================
+--  Report indexes
+--  The quarterly reports filter on the stored generated columns
+--  (WHERE Year = ? AND Quarter = ? AND Refundable = 1), so the
+--  composite indexes lead with Year, Quarter. The old
+--  (Vat, Year, Quarter) indexes could not serve that filter.
+--  Check with: python app/explain_check.py
+-- ============================================================
+
+USE vat_refunder;
+
+-- ============================================================
+-- 1. Invoices_Chancery / Invoices_Residence
+-- ============================================================
+ALTER TABLE Invoices_Chancery
+  DROP INDEX IDX_IC_Vat_Year_Quarter,
+  ADD KEY IDX_IC_Year_Quarter_Refundable (Year, Quarter, Refundable);
+
+ALTER TABLE Invoices_Residence
+  DROP INDEX IDX_IR_Vat_Year_Quarter,
+  ADD KEY IDX_IR_Year_Quarter_Refundable (Year, Quarter, Refundable);
+
+-- ============================================================
+-- 2. Invoice <-> voucher link tables
+--    Reports join them on Invoice_ID, the reference-data caches
+--    on Voucher_ID; the primary key serves the first, the
+--    secondary key the second.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS Vouchers_Chancery (
+  Invoice_ID INT NOT NULL,
+  Voucher_ID INT NOT NULL,
+  PRIMARY KEY (Invoice_ID, Voucher_ID),
+  KEY IDX_VC_Voucher_Invoice (Voucher_ID, Invoice_ID),
+  CONSTRAINT fk_Vouchers_Chancery_Invoice FOREIGN KEY (Invoice_ID)
+    REFERENCES Invoices_Chancery (ID)
+    ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT fk_Vouchers_Chancery_Voucher FOREIGN KEY (Voucher_ID)
+    REFERENCES Vouchers (Voucher_ID)
+    ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE IF NOT EXISTS Vouchers_Residence (
+  Invoice_ID INT NOT NULL,
+  Voucher_ID INT NOT NULL,
+  PRIMARY KEY (Invoice_ID, Voucher_ID),
+  KEY IDX_VR_Voucher_Invoice (Voucher_ID, Invoice_ID),
+  CONSTRAINT fk_Vouchers_Residence_Invoice FOREIGN KEY (Invoice_ID)
+    REFERENCES Invoices_Residence (ID)
+    ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT fk_Vouchers_Residence_Voucher FOREIGN KEY (Voucher_ID)
+    REFERENCES Vouchers (Voucher_ID)
+    ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
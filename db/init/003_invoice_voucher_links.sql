@@ -0,0 +1,58 @@
+-- ============================================================
+--  Invoice -> voucher link summary
+--  One row per linked invoice: its voucher numbers (ordered,
+--  comma separated) and head of accounts, so the voucher report
+--  reads it by key instead of joining and grouping the link
+--  tables on every run. Maintained by app/link_summary.py.
+-- ============================================================
+
+USE vat_refunder;
+
+-- ============================================================
+-- 1. Invoice_Voucher_Links
+-- ============================================================
+CREATE TABLE IF NOT EXISTS Invoice_Voucher_Links (
+  Office ENUM('Chancery','Residence') NOT NULL,
+  Invoice_ID INT NOT NULL,
+  Year INT NOT NULL,
+  Quarter INT NOT NULL,
+  Voucher_Numbers TEXT,
+  Head_of_Accounts VARCHAR(255) DEFAULT NULL,
+  PRIMARY KEY (Office, Invoice_ID),
+  KEY IDX_IVL_Office_Year_Quarter (Office, Year, Quarter)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- ============================================================
+-- 2. Invoice_Voucher_Links_State
+--    Per-quarter fingerprint of the link tables at the last
+--    rebuild (plus the deltas below); link_summary.sync()
+--    rebuilds quarters that moved.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS Invoice_Voucher_Links_State (
+  Office ENUM('Chancery','Residence') NOT NULL,
+  Year INT NOT NULL,
+  Quarter INT NOT NULL,
+  Link_Count INT NOT NULL,
+  Link_Checksum BIGINT UNSIGNED NOT NULL,
+  Rebuilt_At TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (Office, Year, Quarter)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- ============================================================
+-- 3. Invoice_Voucher_Links_Delta
+--    Link rows added since the last rebuild, one row per submit:
+--    (count, checksum) of the links it wrote, already reflected
+--    in Invoice_Voucher_Links. State plus deltas is what sync()
+--    compares with the link tables. Submits only INSERT here,
+--    so concurrent submits never wait on a shared state row.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS Invoice_Voucher_Links_Delta (
+  Delta_ID BIGINT NOT NULL AUTO_INCREMENT,
+  Office ENUM('Chancery','Residence') NOT NULL,
+  Year INT NOT NULL,
+  Quarter INT NOT NULL,
+  Link_Count INT NOT NULL,
+  Link_Checksum BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (Delta_ID),
+  KEY IDX_IVLD_Office_Year_Quarter (Office, Year, Quarter)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;